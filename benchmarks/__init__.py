@@ -0,0 +1 @@
+"""Benchmarks of fx, run with ``python -m benchmarks --help``."""
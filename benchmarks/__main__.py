@@ -0,0 +1,87 @@
+"""Runs benchmarks of fx.
+
+Examples, from the root directory of the source tree::
+
+  python -m benchmarks
+  python -m benchmarks --quick -k itemgetter
+  python -m benchmarks -o before.json
+  python -m benchmarks --compare before.json --threshold 10
+"""
+import argparse
+import importlib
+import sys
+
+from benchmarks import runner
+
+MODULES = [
+    'bench_operators',
+    'bench_apply',
+    'bench_depth',
+    'bench_itemgetter',
+    'bench_readme',
+    'bench_hooks',
+    'bench_shm',
+]
+
+
+def collect(keywords):
+    """Returns cases of all benchmark modules, matching any of keywords."""
+    cases = []
+    for name in MODULES:
+        module = importlib.import_module('benchmarks.' + name)
+        for case in module.cases():
+            name = '%s:%s' % (module.__name__.split('.')[-1][6:], case.name)
+            if keywords and not any(word in name for word in keywords):
+                continue
+            cases.append(case._replace(name=name))
+    return cases
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks', description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '-k', dest='keywords', action='append', default=[],
+        help='only run benchmarks with names containing KEYWORDS')
+    parser.add_argument(
+        '-o', '--output', help='save results as JSON to OUTPUT')
+    parser.add_argument(
+        '--compare', metavar='JSON',
+        help='compare with results saved before, exit with status 1 '
+             'on regressions')
+    parser.add_argument(
+        '--threshold', type=float, default=10.0,
+        help='percent slower than before to count as a regression '
+             '(default: %(default)s)')
+    parser.add_argument(
+        '--quick', action='store_true', help='fewer and shorter runs')
+    parser.add_argument(
+        '-l', '--list', action='store_true', help='list benchmarks only')
+    args = parser.parse_args(argv)
+
+    cases = collect(args.keywords)
+    if args.list:
+        for case in cases:
+            print(case.name)
+        return 0
+
+    repeat, min_time = (3, 0.02) if args.quick else (5, 0.1)
+    if args.compare:
+        results = runner.run(cases, repeat, min_time)
+        regressions = runner.compare(
+            results, runner.load(args.compare), args.threshold)
+    else:
+        print(runner.header())
+        results = runner.run(cases, repeat, min_time, stream=sys.stdout)
+        regressions = []
+
+    if args.output:
+        runner.save(args.output, results)
+    if regressions:
+        print('\nregressions: %s' % ', '.join(regressions))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
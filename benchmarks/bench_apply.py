@@ -0,0 +1,25 @@
+"""Invocation cost of partially applied Function objects.
+
+Applying arguments one by one should not make invocation any slower, the
+ratio to a plain partial object is expected to stay flat as the number of
+applications grows.
+"""
+from functools import partial
+
+from benchmarks.runner import Case
+from fx import f
+
+
+def applied(times):
+    """Returns ``max`` with ``times + 1`` arguments applied one by one."""
+    function = f(max) << -1
+    for n in range(times):
+        function <<= n
+    return function
+
+
+def cases():
+    return [
+        Case('max << ... (%d applications)' % times,
+             applied(times), partial(max, -1, *range(times)))
+        for times in (1, 4, 16, 64)]
@@ -0,0 +1,44 @@
+"""Scaling of pipelines with depth, from 1 to 10,000 stages."""
+from functools import reduce
+
+from benchmarks.runner import Case
+from fx import f
+
+DEPTHS = (1, 10, 100, 1000, 10000)
+
+
+def inc(n):
+    return n + 1
+
+
+def loop(functions):
+    """Hand-written equivalent of a pipeline of ``functions``."""
+    def run(value):
+        for function in functions:
+            value = function(value)
+        return value
+    return run
+
+
+def cases():
+    result = []
+    for depth in DEPTHS:
+        pipeline = reduce(lambda pipe, stage: pipe | stage,
+                          [inc] * (depth - 1), f(inc))
+        baseline = loop([inc] * depth)
+        result.append(Case(
+            'invoke %d stages' % depth,
+            lambda pipeline=pipeline: pipeline(0),
+            lambda baseline=baseline: baseline(0)))
+        compiled = pipeline.compile()
+        result.append(Case(
+            'invoke %d stages compiled' % depth,
+            lambda compiled=compiled: compiled(0),
+            lambda baseline=baseline: baseline(0)))
+        result.append(Case(
+            'build %d stages with |' % depth,
+            lambda depth=depth: reduce(
+                lambda pipe, stage: pipe | stage, [inc] * (depth - 1),
+                f(inc)),
+            lambda depth=depth: [inc] * depth))
+    return result
@@ -0,0 +1,48 @@
+"""Overhead of invocation hooks, disabled and enabled with sampling.
+
+Once hooks are removed, invocation costs the same as before any hook was
+registered, the ratio of the disabled case is expected to be 1.00x.
+"""
+from contextlib import contextmanager
+
+from benchmarks.runner import Case
+from fx import f
+from fx.function import Function, add_hook, remove_hook
+
+
+def inc(n):
+    return n + 1
+
+
+def hook(function, seconds, error):
+    pass
+
+
+def registered(sample):
+    """Returns a context manager factory registering ``hook``."""
+    @contextmanager
+    def context():
+        add_hook(hook, sample)
+        try:
+            yield
+        finally:
+            remove_hook(hook)
+    return context
+
+
+def cases():
+    class Plain(Function):
+        # invokes as Function does when no hook was ever registered
+        __call__ = Function.invoke
+
+    pipeline = f(inc) | inc
+    plain = Plain._chain(pipeline.stages)
+    with registered(1)():
+        pass
+    result = [Case('disabled (inc | inc)(1)',
+                   lambda: pipeline(1), lambda: plain(1))]
+    for sample in (1, 10, 100):
+        result.append(Case(
+            'enabled 1 in %d (inc | inc)(1)' % sample,
+            lambda: pipeline(1), lambda: plain(1), registered(sample)))
+    return result
@@ -0,0 +1,42 @@
+"""ItemGetter with key paths of growing depth, and on plain iterators."""
+from benchmarks.runner import Case
+from fx import _
+
+
+def nested(depth):
+    """Returns a list nested ``depth`` times, and a getter of its item."""
+    obj = 42
+    getter = _
+    for _n in range(depth):
+        obj = [obj]
+        getter = getter[0]
+    return obj, getter
+
+
+def cases():
+    result = []
+    for depth in (1, 4, 16):
+        obj, getter = nested(depth)
+        source = 'lambda obj: obj' + '[0]' * depth
+        baseline = eval(source)
+        result.append(Case(
+            'path depth %d' % depth,
+            lambda getter=getter, obj=obj: getter(obj),
+            lambda baseline=baseline, obj=obj: baseline(obj)))
+
+    data = list(range(100000))
+    result.extend([
+        Case('iterator _[1000]',
+             lambda: _[1000](iter(data)),
+             lambda: next(iter(data[1000:]))),
+        Case('iterator _[-1]',
+             lambda: _[-1](iter(data)),
+             lambda: list(iter(data))[-1]),
+        Case('iterator _[10:20]',
+             lambda: list(_[10:20](iter(data))),
+             lambda: list(iter(data))[10:20]),
+        Case('iterator _[-10:]',
+             lambda: list(_[-10:](iter(data))),
+             lambda: list(iter(data))[-10:]),
+    ])
+    return result
@@ -0,0 +1,229 @@
+"""Memory allocated by constructing and invoking Function objects.
+
+Measured with tracemalloc, per operation:
+
+- bytes and memory blocks still allocated after constructing an object,
+  that is, its footprint,
+- peak bytes allocated while invoking a function, freed once it returns,
+- peak bytes while streaming a large input through a pipeline.
+
+Each case has a budget in bytes, a case allocating more fails the run, so
+do results allocating more than saved ones with ``--compare``.
+
+Examples, from the root directory of the source tree::
+
+  python -m benchmarks.bench_memory
+  python -m benchmarks.bench_memory -o before.json
+  python -m benchmarks.bench_memory --compare before.json
+"""
+import argparse
+import gc
+import sys
+import tracemalloc
+from collections import namedtuple
+from functools import partial
+
+from benchmarks import runner
+from fx import _, f
+from fx.utils import compose
+
+#: Number of objects constructed to average footprints over
+NUMBER = 10000
+
+#: Number of items of large inputs
+LARGE = 1000000
+
+# calls before measuring peaks, item getters are compiled on second call
+WARMUP = 3
+
+#: ``kind`` is one of 'construct', 'call' or 'stream', ``budget`` is the
+#: maximum number of bytes allowed
+Case = namedtuple('Case', 'name kind function budget')
+
+
+def inc(n):
+    return n + 1
+
+
+def odd(n):
+    return n % 2
+
+
+def cases():
+    finc = f(inc)
+    record = {'user': {'id': 42}}
+    pipeline = finc | inc
+    applied = f(max) << 1
+    compiled = pipeline.compile()
+    getter = _['user']['id']
+    return [
+        # footprints, the budgets leave room for differences between
+        # versions of Python, e.g. Python 3.11 allocates values of instance
+        # dictionaries, for metadata assigned to Function objects, up front
+        Case('f(len)', 'construct', lambda: f(len), 160),
+        Case('Function.clone', 'construct', lambda: f.clone(finc), 128),
+        Case('inc | inc', 'construct', lambda: finc | inc, 320),
+        Case('inc ** inc', 'construct', lambda: finc ** inc, 320),
+        Case('inc << 1', 'construct', lambda: finc << 1, 384),
+        Case('~inc', 'construct', lambda: ~finc, 256),
+        Case('partial(inc, 1)', 'construct', lambda: partial(inc, 1), 256),
+        Case('compose(inc, inc)', 'construct', lambda: compose(inc, inc), 96),
+        # key paths are interned, so repeating them allocates nothing
+        Case("_['user']['id']", 'construct', lambda: _['user']['id'], 32),
+        Case('_[0:10]', 'construct', lambda: _[0:10], 32),
+        # transient allocations of invocation
+        Case('f(inc)(1)', 'call', lambda: finc(1), 512),
+        Case('(inc | inc)(1)', 'call', lambda: pipeline(1), 512),
+        Case('(max << 1)(2)', 'call', lambda: applied(2), 512),
+        Case('compiled (inc | inc)(1)', 'call', lambda: compiled(1), 256),
+        Case("_['user']['id'](record)", 'call', lambda: getter(record), 256),
+        # streaming keeps a constant number of items in memory
+        Case('map | filter | sum', 'stream',
+             lambda: (f(map) << inc | f(filter) << odd | sum)(range(LARGE)),
+             16384),
+        Case('optimized map | filter | sum', 'stream',
+             lambda: (f(map) << inc | f(filter) << odd | sum).optimize()(
+                 range(LARGE)),
+             16384),
+        Case('_[-10:] on iterator', 'stream',
+             lambda: _[-10:](iter(range(LARGE))), 16384),
+        Case('_[10:-10] on iterator', 'stream',
+             lambda: sum(_[10:-10](iter(range(LARGE)))), 16384),
+    ]
+
+
+def footprint(function):
+    """Returns bytes and blocks still allocated per call to ``function``."""
+    gc.collect()
+    tracemalloc.start()
+    try:
+        blocks = sys.getallocatedblocks()
+        before = tracemalloc.get_traced_memory()[0]
+        objects = [None] * NUMBER
+        size = tracemalloc.get_traced_memory()[0] - before
+        for index in range(NUMBER):
+            objects[index] = function()
+        after = tracemalloc.get_traced_memory()[0]
+        blocks = sys.getallocatedblocks() - blocks
+    finally:
+        tracemalloc.stop()
+    # the list holding the objects is not part of the measurement
+    # nor is the list itself, a single block
+    return ((after - before - size) / float(NUMBER),
+            (blocks - 1) / float(NUMBER))
+
+
+def peak(function):
+    """Returns peak bytes allocated while calling ``function``."""
+    # warms up caches, e.g. of compiled code
+    for _ in range(WARMUP):
+        function()
+    gc.collect()
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        function()
+        top = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return top - before
+
+
+def run(cases, stream=None):
+    """Runs ``cases``, returns results as a list of dicts."""
+    results = []
+    for case in cases:
+        if case.kind == 'construct':
+            size, blocks = footprint(case.function)
+        else:
+            size, blocks = peak(case.function), None
+        result = {
+            'name': case.name,
+            'kind': case.kind,
+            'bytes': size,
+            'blocks': blocks,
+            'budget': case.budget,
+        }
+        results.append(result)
+        if stream is not None:
+            stream.write(format_result(result) + '\n')
+            stream.flush()
+    return results
+
+
+def format_result(result, previous=None):
+    """Formats a result as a line of text."""
+    blocks = result['blocks']
+    line = '%-36s %-9s %12.1f %8s %10d' % (
+        result['name'], result['kind'], result['bytes'],
+        '-' if blocks is None else '%.2f' % blocks, result['budget'])
+    if previous is not None:
+        line += ' %+10.1f' % (result['bytes'] - previous['bytes'])
+    return line
+
+
+def header(compare=False):
+    """Returns the header of text results."""
+    line = '%-36s %-9s %12s %8s %10s' % (
+        'benchmark', 'kind', 'bytes', 'blocks', 'budget')
+    if compare:
+        line += ' %10s' % 'change'
+    return line
+
+
+def failures(results, previous=None, threshold=0.0):
+    """Returns names of results over budget, or allocating more than
+    ``previous`` ones by more than ``threshold`` bytes."""
+    previous = dict((result['name'], result) for result in previous or [])
+    names = []
+    for result in results:
+        before = previous.get(result['name'])
+        if result['bytes'] > result['budget']:
+            names.append(result['name'])
+        elif (before is not None and
+              result['bytes'] > before['bytes'] + threshold):
+            names.append(result['name'])
+    return names
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        prog='python -m benchmarks.bench_memory',
+        description=__doc__.splitlines()[0])
+    parser.add_argument(
+        '-k', dest='keywords', action='append', default=[],
+        help='only run benchmarks with names containing KEYWORDS')
+    parser.add_argument(
+        '-o', '--output', help='save results as JSON to OUTPUT')
+    parser.add_argument(
+        '--compare', metavar='JSON',
+        help='compare with results saved before, fail on increases')
+    parser.add_argument(
+        '--threshold', type=float, default=8.0,
+        help='bytes more than before to count as an increase '
+             '(default: %(default)s)')
+    args = parser.parse_args(argv)
+
+    selected = [case for case in cases()
+                if not args.keywords or
+                any(word in case.name for word in args.keywords)]
+    previous = runner.load(args.compare) if args.compare else None
+    print(header(compare=previous is not None))
+    before = dict((result['name'], result) for result in previous or [])
+    results = []
+    for case in selected:
+        result, = run([case])
+        results.append(result)
+        print(format_result(result, before.get(result['name'])))
+
+    if args.output:
+        runner.save(args.output, results)
+    names = failures(results, previous, args.threshold)
+    if names:
+        print('\nover budget or increased: %s' % ', '.join(names))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,41 @@
+"""Invocation overhead of each operator against hand-written functions."""
+from benchmarks.runner import Case
+from fx import _, f
+
+
+def inc(n):
+    return n + 1
+
+
+def minus(a, b):
+    return a - b
+
+
+def cases():
+    finc, fminus = f(inc), f(minus)
+    record = {'user': {'id': 42}}
+    return [
+        Case('f(inc)(1)', lambda: finc(1), lambda: inc(1)),
+        Case('(inc | inc)(1)', lambda pipe=finc | inc: pipe(1),
+             lambda: inc(inc(1))),
+        Case('(inc ** inc)(1)', lambda pipe=finc ** inc: pipe(1),
+             lambda: inc(inc(1))),
+        Case('(minus << 1)(2)', lambda g=fminus << 1: g(2),
+             lambda: minus(1, 2)),
+        Case('(minus & 1)(2)', lambda g=fminus & 1: g(2),
+             lambda: minus(1, 2)),
+        Case('(~minus)(1, 2)', lambda g=~fminus: g(1, 2),
+             lambda: minus(2, 1)),
+        Case('+(inc << 1)', lambda g=finc << 1: +g, lambda: inc(1)),
+        Case("_['user']['id'](record)",
+             lambda g=_['user']['id']: g(record),
+             lambda: record['user']['id']),
+        Case('(inc | inc).compile()(1)',
+             lambda g=(finc | inc).compile(): g(1), lambda: inc(inc(1))),
+        # construction
+        Case('inc | inc', lambda: finc | inc, lambda: (inc, inc)),
+        Case('minus << 1', lambda: fminus << 1, lambda: (minus, 1)),
+        Case('~minus', lambda: ~fminus, lambda: (minus,)),
+        Case("_['user']['id']", lambda: _['user']['id'],
+             lambda: ('user', 'id')),
+    ]
@@ -0,0 +1,33 @@
+"""Examples from README against their hand-written equivalents."""
+from benchmarks.runner import Case
+from fx import f
+
+
+def factorial(n):
+    return 1 if n == 1 else n * factorial(n - 1)
+
+
+def is_multiple(n):
+    return n % 3 == 0 or n % 5 == 0
+
+
+def cases():
+    double_all = f(map) << 2 .__mul__ | list
+    sum_upto = 1 .__add__ | f(range) << 1 | sum
+    parse_hex_str = ~f(int) << 16
+    euler_p1 = f(range) << 1 | f(filter) << is_multiple | sum
+    fact = f(lambda n: 1 if n == 1 else n * fact(n - 1))
+    euler_p20 = str ** fact | sum ** f(map) << int
+
+    return [
+        Case('double_all', lambda: double_all([1, 2, 3]),
+             lambda: list(map(2 .__mul__, [1, 2, 3]))),
+        Case('sum_upto', lambda: sum_upto(100),
+             lambda: sum(range(1, 100 + 1))),
+        Case('parse_hex_str', lambda: parse_hex_str('c0ffee'),
+             lambda: int('c0ffee', 16)),
+        Case('euler_p1', lambda: euler_p1(1000),
+             lambda: sum(filter(is_multiple, range(1, 1000)))),
+        Case('euler_p20', lambda: euler_p20(100),
+             lambda: sum(map(int, str(factorial(100))))),
+    ]
@@ -0,0 +1,46 @@
+"""Passing large buffers to process pools, shared memory against pickle.
+
+Each call sends one buffer to a worker process and back through
+``parallel_map``, the worker returning it as is.  The fx side uses
+``transport='shared_memory'``, the baseline the default pickle transport,
+a ratio below 1.00x is expected from 1 MB up.  Buffers of 1 GB are
+measured only if the environment variable ``FX_BENCH_LARGE`` is set.
+"""
+import atexit
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+from benchmarks.runner import Case
+from fx import identity, parallel_map
+
+MB = 1024 * 1024
+
+
+def echo(data, executor, transport):
+    """Returns a function sending ``data`` to a worker and back."""
+    def run():
+        result, = parallel_map(
+            identity, [data], executor=executor, transport=transport)
+        return result
+    return run
+
+
+def cases():
+    executor = ProcessPoolExecutor(1)
+    atexit.register(executor.shutdown)
+    sizes = [1, 16, 128]
+    if os.environ.get('FX_BENCH_LARGE'):
+        sizes.append(1024)
+    buffers = [('bytes', size, bytes(size * MB)) for size in sizes]
+    try:
+        import numpy
+    except ImportError:
+        pass
+    else:
+        buffers.append(
+            ('ndarray', 16, numpy.zeros(16 * MB // 8).reshape(-1, 1024)))
+    return [
+        Case('echo %s %d MB' % (kind, size),
+             echo(data, executor, 'shared_memory'),
+             echo(data, executor, 'pickle'))
+        for kind, size, data in buffers]
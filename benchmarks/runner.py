@@ -0,0 +1,117 @@
+"""Runs benchmark cases, reports timings as text or JSON.
+
+A benchmark module defines ``cases()``, returning a list of :class:`Case`,
+each with a zero-argument function using fx and a zero-argument baseline
+function doing the same in plain Python, plus an optional ``context``, a
+context manager factory, in which the function is measured.
+"""
+import json
+import platform
+import sys
+import time
+import timeit
+from collections import namedtuple
+
+from fx import VERSION
+
+Case = namedtuple('Case', 'name function baseline context')
+Case.__new__.__defaults__ = (None,)
+
+
+def measure(function, repeat, min_time):
+    """Returns the best time of a call to ``function`` in seconds."""
+    timer = timeit.Timer(function)
+    number = 1
+    while True:
+        elapsed = timer.timeit(number)
+        if elapsed >= min_time:
+            break
+        number *= 10 if elapsed < min_time / 10 else 2
+    best = min([elapsed] + timer.repeat(repeat - 1, number))
+    return best / number
+
+
+def run(cases, repeat=5, min_time=0.1, stream=None):
+    """Runs ``cases``, returns results as a list of dicts."""
+    results = []
+    for case in cases:
+        if case.context is None:
+            function = measure(case.function, repeat, min_time)
+        else:
+            with case.context():
+                function = measure(case.function, repeat, min_time)
+        baseline = measure(case.baseline, repeat, min_time)
+        result = {
+            'name': case.name,
+            'usec': function * 1e6,
+            'baseline_usec': baseline * 1e6,
+            'ratio': function / baseline,
+        }
+        results.append(result)
+        if stream is not None:
+            stream.write(format_result(result) + '\n')
+            stream.flush()
+    return results
+
+
+def format_result(result, previous=None):
+    """Formats a result as a line of text."""
+    line = '%-48s %12.3f %12.3f %8.2fx' % (
+        result['name'], result['usec'], result['baseline_usec'],
+        result['ratio'])
+    if previous is not None:
+        line += ' %+7.1f%%' % ((result['usec'] / previous['usec'] - 1) * 100)
+    return line
+
+
+def header(compare=False):
+    """Returns the header of text results."""
+    line = '%-48s %12s %12s %9s' % (
+        'benchmark', 'fx (usec)', 'baseline', 'ratio')
+    if compare:
+        line += ' %8s' % 'change'
+    return line
+
+
+def document(results):
+    """Returns results with information about the environment."""
+    return {
+        'fx': VERSION,
+        'python': platform.python_version(),
+        'implementation': platform.python_implementation(),
+        'machine': platform.machine(),
+        'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+        'results': results,
+    }
+
+
+def compare(results, previous, threshold, stream=sys.stdout):
+    """Prints ``results`` against ``previous`` ones, returns regressions.
+
+    A regression is a benchmark slower than before by more than
+    ``threshold`` percent.
+    """
+    previous = dict((result['name'], result) for result in previous)
+    stream.write(header(compare=True) + '\n')
+    regressions = []
+    for result in results:
+        before = previous.get(result['name'])
+        stream.write(format_result(result, before) + '\n')
+        if before is None:
+            continue
+        if result['usec'] > before['usec'] * (1 + threshold / 100.0):
+            regressions.append(result['name'])
+    return regressions
+
+
+def load(path):
+    """Loads results saved as JSON."""
+    with open(path) as stream:
+        return json.load(stream)['results']
+
+
+def save(path, results):
+    """Saves results as JSON."""
+    with open(path, 'w') as stream:
+        json.dump(document(results), stream, indent=2, sort_keys=True)
+        stream.write('\n')
@@ -3,16 +3,20 @@
 # License: BSD New, see LICENSE for details.
 """fx - a functional programming approach"""
 
-__all__ = ['_', 'Function', 'compose', 'f', 'flip', 'x']
+__all__ = [
+    '_', 'AsyncFunction', 'Function', 'afunction', 'compose', 'f', 'flip',
+    'identity', 'parallel_map', 'parallel_reduce', 'project', 'x']
 
 __version__ = (0, 4)
 __release__ = 'dev'
 
 VERSION = '%d.%d' % __version__ + __release__
 
-from fx.function import Function
-from fx.itemgetter import _, x
-from fx.utils import compose, flip
+from fx.function import AsyncFunction, Function
+from fx.itemgetter import _, project, x
+from fx.parallel import parallel_map, parallel_reduce
+from fx.utils import compose, flip, identity
 
 # alias for less typing
 f = Function
+afunction = AsyncFunction
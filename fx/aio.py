@@ -0,0 +1,60 @@
+# Copyright 2012-2014, Philip Xu <pyx@xrefactor.com>
+# License: BSD New, see LICENSE for details.
+"""fx.aio - implements asyncio helpers for class AsyncFunction."""
+
+__all__ = ['async_map']
+
+import asyncio
+from inspect import isawaitable
+
+
+async def async_map(function, iterable, limit=None, ordered=True):
+    """Returns a list of ``function`` applied to items of ``iterable``,
+    awaiting results concurrently.
+
+    At most ``limit`` calls are awaited at a time, all of them if None,
+    items are read from ``iterable`` as calls complete.  If ``ordered`` is
+    False, results are listed as soon as they are done, rather than in the
+    order of items.  If a call fails, the others are cancelled and the
+    exception raised.  ``function`` may also return plain values.
+
+    >>> async def double(n):
+    ...     await asyncio.sleep(0.01 * (3 - n))
+    ...     return n * 2
+    >>> asyncio.run(async_map(double, range(4), limit=2))
+    [0, 2, 4, 6]
+    >>> asyncio.run(async_map(double, range(4), ordered=False))
+    [6, 4, 2, 0]
+    """
+    if limit is None:
+        items = list(iterable)
+        workers = len(items)
+    elif limit < 1:
+        raise ValueError('limit must be a positive integer')
+    else:
+        items = iterable
+        workers = limit
+    items = enumerate(items)
+    results = {}
+    done = []
+
+    async def worker():
+        # shares items with other workers, until there is none left
+        for index, item in items:
+            result = function(item)
+            if isawaitable(result):
+                result = await result
+            if ordered:
+                results[index] = result
+            else:
+                done.append(result)
+
+    tasks = [asyncio.ensure_future(worker()) for _ in range(workers)]
+    try:
+        await asyncio.gather(*tasks)
+    finally:
+        for task in tasks:
+            task.cancel()
+    if not ordered:
+        return done
+    return [results[index] for index in range(len(results))]
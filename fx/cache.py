@@ -0,0 +1,374 @@
+# Copyright 2012-2014, Philip Xu <pyx@xrefactor.com>
+# License: BSD New, see LICENSE for details.
+"""fx.cache - caches results of functions."""
+
+__all__ = [
+    'AsyncSingleFlight', 'CacheInfo', 'Memoized', 'Replay', 'SingleFlight',
+    'Thunk']
+
+from collections import OrderedDict, namedtuple
+from functools import partial
+from threading import Event, Lock, RLock
+from time import monotonic
+
+#: Statistics of a cache, ``expirations`` counts entries dropped as their
+#: time to live was over, ``evictions`` the ones dropped to make room.
+CacheInfo = namedtuple(
+    'CacheInfo', 'hits misses evictions expirations maxsize currsize')
+
+# separates positional arguments from keyword arguments in keys
+KWARGS = object()
+
+# result not evaluated yet
+MISSING = object()
+
+
+def make_key(*args, **kwargs):
+    """Returns a hashable key of arguments, ignoring keyword argument order.
+
+    >>> make_key(1, 2) == make_key(1, 2)
+    True
+    >>> make_key(1, b=2, c=3) == make_key(1, c=3, b=2)
+    True
+    >>> make_key(1, b=2) == make_key(1, 2)
+    False
+    """
+    if not kwargs:
+        if len(args) == 1 and type(args[0]) in (int, str):
+            return args[0]
+        return args
+    return args + (KWARGS,) + tuple(sorted(kwargs.items()))
+
+
+class Memoized(object):
+    """Caches results of ``function``, with LRU and time based eviction.
+
+    At most ``maxsize`` results are kept, least recently used ones are
+    evicted first, ``None`` means no limit.  Results older than ``ttl``
+    seconds are computed again, ``None`` means they never expire.  ``key``
+    computes the cache key of arguments, all arguments must be hashable by
+    default.  Exceptions are not cached.
+
+    >>> calls = []
+    >>> def square(n):
+    ...     calls.append(n)
+    ...     return n * n
+    >>> memoized = Memoized(square, maxsize=2)
+    >>> memoized(2), memoized(2), memoized(3), memoized(4), memoized(2)
+    (4, 4, 9, 16, 4)
+    >>> calls
+    [2, 3, 4, 2]
+    >>> info = memoized.cache_info()
+    >>> info.hits, info.misses, info.evictions, info.currsize
+    (1, 4, 2, 2)
+    """
+    __slots__ = (
+        'function', 'maxsize', 'ttl', 'key', 'lock', 'cache',
+        'hits', 'misses', 'evictions', 'expirations')
+
+    def __init__(self, function, maxsize=128, ttl=None, key=None):
+        self.function = function
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.key = make_key if key is None else key
+        self.lock = Lock()
+        # key -> (result, time it expires at)
+        self.cache = OrderedDict()
+        self.hits = self.misses = self.evictions = self.expirations = 0
+
+    def __call__(self, *args, **kwargs):
+        key = self.key(*args, **kwargs)
+        with self.lock:
+            try:
+                result, expires = self.cache[key]
+            except KeyError:
+                pass
+            else:
+                if expires is None or monotonic() < expires:
+                    self.cache.move_to_end(key)
+                    self.hits += 1
+                    return result
+                del self.cache[key]
+                self.expirations += 1
+            self.misses += 1
+
+        # computed without holding the lock, so that other keys are not
+        # blocked, concurrent calls with the same key may compute it twice.
+        result = self.function(*args, **kwargs)
+        expires = None if self.ttl is None else monotonic() + self.ttl
+
+        with self.lock:
+            if self.maxsize is not None and self.maxsize <= 0:
+                return result
+            self.cache[key] = result, expires
+            self.cache.move_to_end(key)
+            if expires is not None:
+                self.purge()
+            if self.maxsize is not None:
+                while len(self.cache) > self.maxsize:
+                    self.cache.popitem(last=False)
+                    self.evictions += 1
+        return result
+
+    def purge(self):
+        """Removes expired results from the least recently used end, until
+        one that has not, so that the cache does not grow with expired
+        results of keys never used again.  Called with the lock held."""
+        now = monotonic()
+        cache = self.cache
+        while cache:
+            key = next(iter(cache))
+            expires = cache[key][1]
+            if expires is None or now < expires:
+                break
+            cache.popitem(last=False)
+            self.expirations += 1
+
+    def __reduce__(self):
+        # pickled empty, results are not shared between processes
+        key = None if self.key is make_key else self.key
+        return Memoized, (self.function, self.maxsize, self.ttl, key)
+
+    def cache_info(self):
+        """Returns statistics of the cache as a :data:`CacheInfo`."""
+        with self.lock:
+            return CacheInfo(
+                self.hits, self.misses, self.evictions, self.expirations,
+                self.maxsize, len(self.cache))
+
+    def cache_clear(self):
+        """Clears the cache and its statistics."""
+        with self.lock:
+            self.cache.clear()
+            self.hits = self.misses = self.evictions = self.expirations = 0
+
+
+class Thunk(object):
+    """Evaluates ``function`` once when called without arguments.
+
+    The result is kept until :meth:`cache_clear`, calls with arguments are
+    passed through, uncached.  If the result is an iterator, it is wrapped
+    in a :class:`Replay`, so that each call returns a new iterator over the
+    same items, each produced once.
+
+    >>> calls = []
+    >>> thunk = Thunk(lambda: calls.append(1) or len(calls))
+    >>> thunk(), thunk()
+    (1, 1)
+    >>> thunk.cache_clear()
+    >>> thunk()
+    2
+    >>> squares = Thunk(lambda: map(lambda n: calls.append(n) or n * n,
+    ...                             range(3)))
+    >>> list(squares()), list(squares())
+    ([0, 1, 4], [0, 1, 4])
+    >>> calls
+    [1, 1, 0, 1, 2]
+    """
+    __slots__ = ('function', 'lock', 'result', 'hits', 'misses')
+
+    def __init__(self, function):
+        self.function = function
+        self.lock = Lock()
+        self.result = MISSING
+        self.hits = self.misses = 0
+
+    def __call__(self, *args, **kwargs):
+        if args or kwargs:
+            return self.function(*args, **kwargs)
+        with self.lock:
+            result = self.result
+            if result is MISSING:
+                result = self.function()
+                if hasattr(type(result), '__next__'):
+                    result = Replay(result)
+                self.result = result
+                self.misses += 1
+            else:
+                self.hits += 1
+        return iter(result) if type(result) is Replay else result
+
+    def __reduce__(self):
+        # pickled unevaluated
+        return Thunk, (self.function,)
+
+    def cache_info(self):
+        """Returns statistics as a :data:`CacheInfo`, misses count
+        evaluations."""
+        with self.lock:
+            cached = self.result is not MISSING
+            return CacheInfo(self.hits, self.misses, 0, 0, 1, int(cached))
+
+    def cache_clear(self):
+        """Forgets the result, evaluated again on next call, and clears
+        statistics."""
+        with self.lock:
+            self.result = MISSING
+            self.hits = self.misses = 0
+
+
+class Replay(object):
+    """Iterable over items of ``iterator``, pulled once and kept, so that
+    iterating again replays them.
+
+    >>> items = Replay(iter(range(3)))
+    >>> first = iter(items)
+    >>> next(first), next(first)
+    (0, 1)
+    >>> list(items), list(first)
+    ([0, 1, 2], [2])
+    """
+    __slots__ = ('iterator', 'items', 'lock')
+
+    def __init__(self, iterator):
+        self.iterator = iterator
+        self.items = []
+        self.lock = RLock()
+
+    def __iter__(self):
+        items = self.items
+        index = 0
+        while True:
+            if index < len(items):
+                yield items[index]
+                index += 1
+                continue
+            with self.lock:
+                if index < len(items):
+                    continue
+                if self.iterator is None:
+                    return
+                try:
+                    item = next(self.iterator)
+                except StopIteration:
+                    self.iterator = None
+                    return
+                items.append(item)
+
+
+class Flight(object):
+    """An invocation in flight, waited for by concurrent identical ones."""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = Event()
+        self.result = self.error = None
+
+    def outcome(self):
+        """Returns the result of the invocation, or raises its exception."""
+        if self.error is not None:
+            raise self.error
+        return self.result
+
+
+class SingleFlight(object):
+    """Runs ``function`` once for concurrent calls with equal arguments.
+
+    The first caller runs ``function``, callers with the same key arriving
+    before it returns wait for it, and get the same result or exception.
+    Results are not kept once all callers got them.  ``key`` computes the
+    key of arguments, as in :class:`Memoized`.
+
+    >>> from concurrent.futures import ThreadPoolExecutor
+    >>> from time import sleep
+    >>> calls = []
+    >>> def fetch(name):
+    ...     calls.append(name)
+    ...     sleep(0.1)
+    ...     return name.upper()
+    >>> fetch = SingleFlight(fetch)
+    >>> with ThreadPoolExecutor(4) as executor:
+    ...     list(executor.map(fetch, ['spam'] * 4))
+    ['SPAM', 'SPAM', 'SPAM', 'SPAM']
+    >>> calls
+    ['spam']
+    """
+    __slots__ = ('function', 'key', 'lock', 'flights')
+
+    def __init__(self, function, key=None):
+        self.function = function
+        self.key = make_key if key is None else key
+        self.lock = Lock()
+        # key -> Flight
+        self.flights = {}
+
+    def __call__(self, *args, **kwargs):
+        key = self.key(*args, **kwargs)
+        with self.lock:
+            flight = self.flights.get(key)
+            if flight is None:
+                flight = self.flights[key] = Flight()
+                leader = True
+            else:
+                leader = False
+
+        if not leader:
+            flight.done.wait()
+            return flight.outcome()
+
+        try:
+            flight.result = self.function(*args, **kwargs)
+        except BaseException as error:
+            flight.error = error
+            raise
+        finally:
+            with self.lock:
+                del self.flights[key]
+            flight.done.set()
+        return flight.result
+
+    def __reduce__(self):
+        key = None if self.key is make_key else self.key
+        return SingleFlight, (self.function, key)
+
+
+class AsyncSingleFlight(object):
+    """Runs coroutine function ``function`` once for concurrent calls with
+    equal arguments, in the same event loop.
+
+    The coroutine is run as a task, awaited by all callers, cancelling one
+    of them does not cancel it for the others.
+
+    >>> import asyncio
+    >>> calls = []
+    >>> async def fetch(name):
+    ...     calls.append(name)
+    ...     await asyncio.sleep(0.01)
+    ...     return name.upper()
+    >>> fetch = AsyncSingleFlight(fetch)
+    >>> async def main():
+    ...     return await asyncio.gather(fetch('spam'), fetch('spam'))
+    >>> asyncio.run(main())
+    ['SPAM', 'SPAM']
+    >>> calls
+    ['spam']
+    """
+    __slots__ = ('function', 'key', 'tasks')
+
+    def __init__(self, function, key=None):
+        self.function = function
+        self.key = make_key if key is None else key
+        # (event loop, key) -> task, only touched from event loop threads
+        self.tasks = {}
+
+    async def __call__(self, *args, **kwargs):
+        # imported on use, as importing asyncio takes longer than fx
+        import asyncio
+        key = asyncio.get_running_loop(), self.key(*args, **kwargs)
+        task = self.tasks.get(key)
+        if task is None:
+            task = asyncio.ensure_future(self.function(*args, **kwargs))
+            self.tasks[key] = task
+            task.add_done_callback(partial(self.landed, key))
+        return await asyncio.shield(task)
+
+    def __reduce__(self):
+        key = None if self.key is make_key else self.key
+        return AsyncSingleFlight, (self.function, key)
+
+    def landed(self, key, task):
+        """Forgets ``task`` of ``key`` once done."""
+        del self.tasks[key]
+        if not task.cancelled():
+            # retrieved, even if all callers were cancelled
+            task.exception()
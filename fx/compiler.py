@@ -0,0 +1,245 @@
+# Copyright 2012-2014, Philip Xu <pyx@xrefactor.com>
+# License: BSD New, see LICENSE for details.
+"""fx.compiler - compiles stages of Function into a single function."""
+
+__all__ = ['Fused', 'compile_stages', 'fuse']
+
+from functools import partial
+from fx.utils import compose, flip
+
+#: Maximum number of cached code templates
+CACHE_SIZE = 256
+
+#: Code templates, factory functions keyed by their source code
+templates = {}
+
+TEMPLATE = '''\
+def make_compiled(missing, {constants}):
+    def compiled(value=missing, /, *args, **kwargs):
+        if value is missing or args or kwargs:
+            if value is not missing:
+                args = (value,) + args
+            value = {general}
+        else:
+            value = {single}
+{body}
+    return compiled
+'''
+
+FUSED_TEMPLATE = '''\
+def make_fused({constants}):
+    def fused(iterable):
+        for value in iterable:
+{body}
+    return fused
+'''
+
+# the first operation mapping over all arguments, as the first stage of a
+# pipeline, arguments are checked by map as it is called
+FUSED_HEAD_TEMPLATE = '''\
+def make_fused({constants}):
+    def loop(iterable):
+        for value in iterable:
+{body}
+    def fused(*iterables):
+        return loop(map(c0, *iterables))
+    return fused
+'''
+
+# NOTE:
+# Most pipelines are invoked with a single positional argument, for which
+# the compiled function avoids packing and unpacking arguments.
+MISSING = object()
+
+
+class Compiler(object):
+    """Generates source code of stages, collecting constants referenced."""
+    def __init__(self):
+        self.constants = []
+
+    def constant(self, value):
+        """Returns the name referencing ``value`` in generated code."""
+        self.constants.append(value)
+        return 'c%d' % (len(self.constants) - 1)
+
+    def call(self, function, args, keywords=(), kwargs=False):
+        """Returns an expression calling ``function``.
+
+        ``args`` are expressions of positional arguments, ``keywords`` are
+        dictionaries of keyword arguments, inner ones first, ``kwargs`` tells
+        if keyword arguments of the compiled function are passed.
+        """
+        if type(function) is partial:
+            args = [self.constant(arg) for arg in function.args] + args
+            if function.keywords:
+                keywords = (function.keywords,) + tuple(keywords)
+            return self.call(function.func, args, keywords, kwargs)
+
+        if type(function) is flip:
+            args = [reverse(arg) for arg in reversed(args)]
+            return self.call(function.func, args, keywords, kwargs)
+
+        if type(function) is compose:
+            inner = self.call(function.g, args, keywords, kwargs)
+            return self.call(function.f, [inner])
+
+        # opaque callable, referenced as a constant
+        if keywords:
+            merged = {}
+            for keyword in keywords:
+                merged.update(keyword)
+            keywords = self.constant(merged)
+            if kwargs:
+                args = args + ['**dict(%s, **kwargs)' % keywords]
+            else:
+                args = args + ['**' + keywords]
+        elif kwargs:
+            args = args + ['**kwargs']
+        return '%s(%s)' % (self.constant(function), ', '.join(args))
+
+
+def reverse(arg):
+    """Returns expression of argument ``arg`` in reversed argument list."""
+    if arg == '*args':
+        return '*args[::-1]'
+    if arg == '*args[::-1]':
+        return '*args'
+    return arg
+
+
+def compile_stages(stages):
+    """Compiles a sequence of ``stages`` into a single function.
+
+    Partial applications, flips and compositions of stages are inlined as
+    arguments and nested calls, other callables are called as they are.
+
+    >>> stages = [partial(flip(pow), 2), partial(range, 1), sum]
+    >>> compiled = compile_stages(stages)
+    >>> compiled(4)
+    120
+    >>> print(compiled.source)
+    def make_compiled(missing, c0, c1, c2, c3, c4):
+        def compiled(value=missing, /, *args, **kwargs):
+            if value is missing or args or kwargs:
+                if value is not missing:
+                    args = (value,) + args
+                value = c1(*args[::-1], c0, **kwargs)
+            else:
+                value = c1(value, c0)
+            value = c3(c2, value)
+            return c4(value)
+        return compiled
+    <BLANKLINE>
+    """
+    compiler = Compiler()
+    first = stages[0]
+    general = compiler.call(first, ['*args'], kwargs=True)
+    # constants are referenced in the same order in both calls
+    single = Compiler().call(first, ['value'])
+    lines = ['value = %s' % compiler.call(stage, ['value'])
+             for stage in stages[1:]]
+    if lines:
+        lines[-1] = 'return' + lines[-1][len('value ='):]
+    else:
+        lines.append('return value')
+    names = ['c%d' % index for index in range(len(compiler.constants))]
+    source = TEMPLATE.format(
+        constants=', '.join(names), general=general, single=single,
+        body='\n'.join(' ' * 8 + line for line in lines))
+
+    template = cached_template(source, 'make_compiled')
+    compiled = template(MISSING, *compiler.constants)
+    compiled.source = source
+    return compiled
+
+
+def fuse(operations, head=False):
+    """Fuses ``operations`` on items of an iterable into a generator function.
+
+    ``operations`` is a sequence of pairs of ``map`` or ``filter`` and the
+    function to apply, the generator function returned is equivalent to
+    nested ``map`` and ``filter`` iterators, looping once over the iterable.
+    If ``head`` is True, the first operation is a ``map`` taking all
+    arguments, as ``partial(map, g)`` does, as the first stage of a pipeline.
+
+    >>> fused = fuse([(map, abs), (filter, None), (map, str)])
+    >>> list(fused([-1, 0, 1, -2]))
+    ['1', '1', '2']
+    >>> print(fused.source)
+    def make_fused(c0, c1):
+        def fused(iterable):
+            for value in iterable:
+                value = c0(value)
+                if not value:
+                    continue
+                value = c1(value)
+                yield value
+        return fused
+    <BLANKLINE>
+    >>> fused = fuse([(map, pow), (filter, None)], head=True)
+    >>> list(fused([0, 1, 2], [1, 0, 2]))
+    [1, 4]
+    """
+    return Fused(operations, head)
+
+
+class Fused(object):
+    """Generator function fused from ``operations``, see :func:`fuse`.
+
+    Unlike the generated function it calls, it can be pickled, as its
+    operations, generated again when unpickled.
+    """
+    __slots__ = ('operations', 'head', 'function', 'source')
+
+    def __init__(self, operations, head=False):
+        self.operations = tuple(operations)
+        self.head = head
+        compiler = Compiler()
+        lines = []
+        operations = self.operations
+        if head:
+            if operations[0][0] is not map:
+                raise ValueError('only map operations take all arguments')
+            # looped over by the generated function, as c0
+            compiler.constant(operations[0][1])
+            operations = operations[1:]
+        for operation, function in operations:
+            if operation is map:
+                lines.append(
+                    'value = %s(value)' % compiler.constant(function))
+            elif function is None:
+                lines.extend(['if not value:', '    continue'])
+            else:
+                name = compiler.constant(function)
+                lines.extend(['if not %s(value):' % name, '    continue'])
+        lines.append('yield value')
+        names = ['c%d' % index for index in range(len(compiler.constants))]
+        template = FUSED_HEAD_TEMPLATE if head else FUSED_TEMPLATE
+        self.source = template.format(
+            constants=', '.join(names),
+            body='\n'.join(' ' * 12 + line for line in lines))
+        template = cached_template(self.source, 'make_fused')
+        self.function = template(*compiler.constants)
+
+    def __call__(self, *iterables):
+        return self.function(*iterables)
+
+    def __reduce__(self):
+        return Fused, (self.operations, self.head)
+
+
+def cached_template(source, name):
+    """Returns factory function ``name`` defined in ``source``, cached."""
+    try:
+        return templates[source]
+    except KeyError:
+        pass
+    namespace = {}
+    exec(compile(source, '<fx.compiler>', 'exec'), namespace)
+    template = templates[source] = namespace[name]
+    if len(templates) > CACHE_SIZE:
+        try:
+            del templates[next(iter(templates))]
+        except (StopIteration, RuntimeError, KeyError):
+            pass
+    return template
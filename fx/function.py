@@ -3,10 +3,58 @@
 # License: BSD New, see LICENSE for details.
 """fx.function - implements class Function."""
 
-__all__ = ['Function']
+__all__ = ['AsyncFunction', 'Function', 'add_hook', 'remove_hook']
+
+from collections.abc import Awaitable
+from functools import partial, reduce
+from itertools import count
+from math import gcd
+from threading import Lock
+from time import perf_counter
+from fx.cache import (
+    MISSING, AsyncSingleFlight, Memoized, SingleFlight, Thunk)
+from fx.compiler import compile_stages
+from fx.optimizer import optimize_stages
+from fx.profiler import Profiler
+from fx.utils import constant, flip
+
+# NOTE:
+# Modules for parallel, persisted and asynchronous Function objects are
+# imported by the methods creating them, as they, or what they depend on,
+# take longer to import than the rest of fx.
+
+
+class _wrapped_attribute(str):
+    """Attribute of a Function object looked up from the wrapped function.
+
+    On the class itself, it is the plain string it was created with, so that
+    ``Function.__module__`` and ``Function.__doc__`` keep working.  Values
+    assigned override the wrapped function's, in the instance dictionary.
+    """
+    def __new__(cls, name, value):
+        attribute = str.__new__(cls, value or '')
+        attribute.name = name
+        return attribute
+
+    def __get__(self, instance, owner):
+        if instance is None:
+            return str(self)
+        try:
+            return instance.__dict__[self.name]
+        except KeyError:
+            return getattr(instance.stages[0], self.name, None)
+
+    def __set__(self, instance, value):
+        instance.__dict__[self.name] = value
+
+    def __delete__(self, instance):
+        try:
+            del instance.__dict__[self.name]
+        except KeyError:
+            raise AttributeError(self.name)
 
-from functools import partial
-from fx.utils import compose, flip
+    def __reduce__(self):
+        return str, (str(self),)
 
 
 class Function(object):
@@ -25,6 +73,14 @@ class Function(object):
     >>> double_all_str([1, 2, 3])
     '2 4 6'
     """
+    # the instance dictionary is only created once an attribute is set
+    __slots__ = ('_stages', '_links', '__dict__', '__weakref__')
+
+    # resolved lazily, as most Function objects never have them accessed.
+    __module__ = _wrapped_attribute('__module__', __module__)
+    __name__ = _wrapped_attribute('__name__', 'Function')
+    __doc__ = _wrapped_attribute('__doc__', __doc__)
+
     def __init__(self, function):
         """Creates a function wrapper object.
 
@@ -47,26 +103,78 @@ class Function(object):
         >>> [times_2(n) for n in range(10)]
         [0, 2, 4, 6, 8, 10, 12, 14, 16, 18]
         """
-        self.func = function if callable(function) else lambda: function
-        # copy attributes manually, functools.update_wrapper breaks on partial
-        # object in python 2.7 because it does not have '__module__'
-        for attr in ('__module__', '__name__', '__doc__'):
-            setattr(self, attr, getattr(self.func, attr, None))
+        # NOTE:
+        # A Function is a flat tuple of stages, the first one is invoked with
+        # all arguments, each of the following is invoked with the output of
+        # the previous one.  Wrapping a Function shares its stages instead of
+        # nesting it, so that composing and piping never deepen the stack.
+        # Composing and piping link both operands instead of concatenating
+        # their stages, which are flattened on first use, so that building a
+        # pipeline stage by stage takes linear time.
+        if isinstance(function, Function):
+            self._stages = function.stages
+        else:
+            func = function if callable(function) else constant(function)
+            self._stages = (func,)
+        self._links = None
+
+    @property
+    def stages(self):
+        """The flat tuple of stages."""
+        return self._stages or self._flatten()
+
+    def _flatten(self):
+        """Returns stages of linked Function objects, cached."""
+        stages = []
+        pending = [self]
+        while pending:
+            function = pending.pop()
+            flat = function._stages
+            if flat is None:
+                links = function._links
+                if links is not None:
+                    first, second = links
+                    pending.append(second)
+                    pending.append(first)
+                    continue
+                # flattened meanwhile
+                flat = function._stages
+            stages.extend(flat)
+        self._stages = stages = tuple(stages)
+        self._links = None
+        return stages
 
     @classmethod
     def clone(cls, function):
         """Creates a Function object of the same type as ``cls``."""
-        func = function
-        if isinstance(function, cls):
-            # NOTE:
-            # We are only interested in the underlying function, using it
-            # instead of the whole Function object can reduce unnecessary
-            # indirection with function calls.
-            # This works right now, as there is no other internal state
-            # (instance variables) of Function object, should there be any
-            # other instance variable, it has to be copied accordingly.
-            func = function.func
-        return cls(func)
+        return cls(function)
+
+    @classmethod
+    def _chain(cls, stages):
+        """Creates a Function object that runs a flat tuple of ``stages``."""
+        function = cls.__new__(cls)
+        function._stages = stages
+        function._links = None
+        return function
+
+    def _link(self, first, second):
+        """Creates a Function object of the type of ``self`` that runs
+        stages of ``first`` then of ``second``."""
+        cls = type(self)
+        function = cls.__new__(cls)
+        function._stages = None
+        function._links = first, second
+        return function
+
+    def __reduce__(self):
+        """Pickles a Function as its stages, which must be picklable.
+
+        >>> import pickle
+        >>> f = Function(map) << str | ' '.join
+        >>> pickle.loads(pickle.dumps(f))(range(3))
+        '0 1 2'
+        """
+        return _restore, (type(self), self.stages)
 
     def invoke(self, *args, **kwargs):
         """Invokes the wrapped function with ``args`` and ``kwargs``.
@@ -108,7 +216,11 @@ class Function(object):
         >>> +f.apply('2')
         2
         """
-        return self.func(*args, **kwargs)
+        stages = iter(self._stages or self._flatten())
+        output = next(stages)(*args, **kwargs)
+        for stage in stages:
+            output = stage(output)
+        return output
 
     # Read-only property represents function's output
     value = property(invoke)
@@ -143,7 +255,7 @@ class Function(object):
         >>> f(range(10))
         [1, 2, 3, 4, 5, 6, 7, 8, 9, 10]
         """
-        return self.clone(compose(self.invoke, self.clone(function)))
+        return self._link(self.clone(function), self)
 
     # Function composition operator: **
     __pow__ = compose
@@ -173,7 +285,7 @@ class Function(object):
         >>> sum_upto(100)
         5050
         """
-        return self.clone(compose(function, self.invoke))
+        return self._link(self, self.clone(function))
 
     # Pipe operator: |
     __or__ = pipe
@@ -219,7 +331,16 @@ class Function(object):
         >>> int_from_hex('0xff')
         255
         """
-        return self.clone(partial(self.invoke, *args, **kwargs))
+        head = self.stages[0]
+        if type(head) is partial:
+            # merge into the existing partial object, so that the wrapped
+            # function is called directly, no matter how many times arguments
+            # have been applied.
+            keywords = dict(head.keywords or {}, **kwargs)
+            head = partial(head.func, *(head.args + args), **keywords)
+        else:
+            head = partial(head, *args, **kwargs)
+        return self._chain((head,) + self.stages[1:])
 
     # High cohesive application operator: <<
     __lshift__ = apply
@@ -253,13 +374,252 @@ class Function(object):
         >>> subtract(8, 5)
         -3
         """
-        return self.clone(flip(self.invoke))
+        head = self.stages[0]
+        # flipping twice cancels out
+        head = head.func if type(head) is flip else flip(head)
+        return self._chain((head,) + self.stages[1:])
 
     # Read-only property for easier referencing
     flip = property(reverse_apply)
     # Flip operator: ~
     __invert__ = reverse_apply
 
+    def compile(self):
+        """Returns a function generated to run all stages at once.
+
+        Arguments of partial applications are inlined and flipped arguments
+        are reordered at compile time, so that the compiled function runs as
+        fast as the equivalent hand-written function.  Code generated is
+        cached, Functions of the same structure share it.
+
+        >>> p = lambda n: n % 3 == 0 or n % 5 == 0
+        >>> euler_p1 = Function(range) << 1 | Function(filter) << p | sum
+        >>> compiled = euler_p1.compile()
+        >>> compiled(1000)
+        233168
+
+        The compiled function is a plain function, wrap it in a Function to
+        keep on using operators, at the cost of one more call.
+
+        >>> (Function(compiled) | str)(10)
+        '23'
+        """
+        return compile_stages(self.stages)
+
+    def optimize(self, report=None):
+        """Creates an equivalent Function with stages rewritten to run faster.
+
+        If ``report`` is a list, names of rewrites applied are appended to it,
+        see :func:`fx.optimizer.optimize_stages` for the rewrites available.
+
+        >>> report = []
+        >>> f = (Function(range) | list | sum).optimize(report)
+        >>> f(5)
+        10
+        >>> report
+        ['materialization']
+        >>> minus = Function(lambda a, b: a - b)
+        >>> f = (minus.flip.flip << 5 | ~minus << 1).optimize()
+        >>> len(f.stages), f(2)
+        (2, 2)
+        """
+        return self._chain(optimize_stages(self.stages, report))
+
+    def pmap(self, workers=None, processes=False, chunksize=1, ordered=True,
+             inflight=None, transport='pickle', executor=None):
+        """Creates a Function mapping ``self`` over an iterable in parallel.
+
+        Like ``Function(map) << self``, items are mapped by a pool of threads
+        or processes, see :func:`~fx.parallel.parallel_map` for arguments.
+
+        >>> lengths = (Function(str) | len).pmap(workers=4, chunksize=10)
+        >>> total = Function(range) | lengths | sum
+        >>> total(1000)
+        2890
+
+        Unless ``executor`` is given, each invocation starts a new pool and
+        shuts it down, processes included.  For Functions invoked more than
+        once, e.g. per request, pass a pool created once and reused:
+
+        >>> from concurrent.futures import ThreadPoolExecutor
+        >>> with ThreadPoolExecutor(4) as executor:
+        ...     lengths = (Function(str) | len).pmap(executor=executor)
+        ...     [sum(lengths(range(n))) for n in (10, 100)]
+        [10, 190]
+        """
+        from fx.parallel import parallel_map
+        function = self.stages[0] if len(self.stages) == 1 else self
+        return self._chain((partial(
+            parallel_map, function, workers=workers, processes=processes,
+            chunksize=chunksize, ordered=ordered, inflight=inflight,
+            transport=transport, executor=executor),))
+
+    def preduce(self, initial=MISSING, workers=None, processes=False,
+                chunksize=1024, inflight=None, executor=None):
+        """Creates a Function reducing an iterable by ``self`` in parallel.
+
+        Like ``Function(reduce) << self``, chunks of items are reduced by a
+        pool of threads or processes and combined as a tree, ``self`` must
+        be associative, see :func:`~fx.parallel.parallel_reduce` for
+        arguments.  As with :meth:`pmap`, pass an ``executor`` to reuse a
+        pool across invocations.
+
+        >>> longest = Function(max).apply(key=len).preduce(chunksize=10)
+        >>> longest(str(n) for n in range(1000))
+        '100'
+        >>> concat = Function(lambda a, b: a + b).preduce('>', chunksize=2)
+        >>> concat('spam'), concat('')
+        ('>spam', '>')
+        """
+        from fx.parallel import parallel_reduce
+        function = self.stages[0] if len(self.stages) == 1 else self
+        return self._chain((partial(
+            parallel_reduce, function, initial=initial, workers=workers,
+            processes=processes, chunksize=chunksize, inflight=inflight,
+            executor=executor),))
+
+    def memoize(self, maxsize=128, ttl=None, key=None):
+        """Creates a Function caching results of ``self`` by arguments.
+
+        At most ``maxsize`` results are kept, least recently used first out,
+        results expire after ``ttl`` seconds, ``None`` means no limit for
+        either.  Arguments, including keyword arguments applied, must be
+        hashable, unless ``key`` is given, a function computing a hashable
+        key of them.  It is safe to call from multiple threads.
+
+        >>> calls = []
+        >>> parse = Function(lambda text, base: calls.append(text) or
+        ...                  int(text, base)).memoize(maxsize=100)
+        >>> parse_hex = parse.apply(base=16) | str
+        >>> parse_hex('ff'), parse_hex('ff'), parse_hex('10')
+        ('255', '255', '16')
+        >>> calls
+        ['ff', '10']
+        >>> parse.cache_info().hits
+        1
+        """
+        function = self.stages[0] if len(self.stages) == 1 else self
+        return self._chain((Memoized(function, maxsize, ttl, key),))
+
+    def persist(self, path, maxbytes=None, name=None, mmap=False):
+        """Creates a Function caching results of ``self`` on disk.
+
+        Results are stored at ``path``, a SQLite database file if it ends
+        with ``.db``, ``.sqlite`` or ``.sqlite3``, a directory otherwise,
+        least recently used ones are removed past ``maxbytes`` bytes.  They
+        are keyed by a stable hash of the stages of ``self`` and arguments,
+        or of ``name`` instead of stages if given, so that they are found by
+        other processes and after restarts.  If ``mmap`` is True, large
+        buffers are memory mapped from a directory and always returned as
+        read-only views.  See :class:`~fx.persist.Persisted` for details.
+
+        >>> import os, tempfile
+        >>> path = os.path.join(tempfile.mkdtemp(), 'cache.db')
+        >>> calls = []
+        >>> count_words = Function(lambda text: calls.append(text) or
+        ...                        len(text.split()))
+        >>> count_words.persist(path)('spam and eggs')
+        3
+        >>> count_words.persist(path)('spam and eggs')
+        3
+        >>> calls
+        ['spam and eggs']
+        """
+        from fx.persist import Persisted
+        function = self.stages[0] if len(self.stages) == 1 else self
+        return self._chain((
+            Persisted(function, path, maxbytes, name, mmap),))
+
+    def singleflight(self, key=None):
+        """Creates a Function running ``self`` once for concurrent calls.
+
+        Calls with equal arguments while one is running wait for it and
+        share its result or exception, instead of running ``self`` again,
+        see :class:`~fx.cache.SingleFlight`.  If ``self`` wraps a coroutine
+        function, calls are coalesced within the event loop, see
+        :class:`~fx.cache.AsyncSingleFlight`.  ``key`` computes the key of
+        arguments, as in :meth:`memoize`.
+
+        >>> from concurrent.futures import ThreadPoolExecutor
+        >>> from time import sleep
+        >>> calls = []
+        >>> fetch = Function(lambda n: calls.append(n) or sleep(0.1) or n)
+        >>> fetch = fetch.singleflight() | str
+        >>> with ThreadPoolExecutor(3) as executor:
+        ...     list(executor.map(fetch, [1, 1, 1]))
+        ['1', '1', '1']
+        >>> calls
+        [1]
+        """
+        from inspect import iscoroutinefunction
+        if len(self.stages) == 1:
+            function = self.stages[0]
+            if iscoroutinefunction(function):
+                return self._chain((AsyncSingleFlight(function, key),))
+        else:
+            function = self
+        return self._chain((SingleFlight(function, key),))
+
+    def lazy(self):
+        """Creates a Function evaluating ``self`` once, when called without
+        arguments.
+
+        The value is computed on first use and kept, so that :attr:`value`,
+        ``+``, ``==``, ``!=``, ``in`` and iteration all reuse it.  Iterators
+        are replayed, each use iterates over the same items, produced once.
+        Evaluation is thread-safe, :meth:`cache_clear` invalidates the value.
+        Calls with arguments are not cached, see :class:`~fx.cache.Thunk`.
+
+        >>> calls = []
+        >>> total = Function(lambda: calls.append(1) or 6).lazy()
+        >>> total == 6, total != 6, 6 in total, list(total), total.value
+        (True, False, True, [6], 6)
+        >>> len(calls)
+        1
+        >>> total.cache_clear()
+        >>> +total
+        6
+        >>> len(calls)
+        2
+        """
+        function = self.stages[0] if len(self.stages) == 1 else self
+        return self._chain((Thunk(function),))
+
+    def cache_info(self):
+        """Returns statistics of the cache of a memoized Function.
+
+        The first stage is expected to have method ``cache_info``, as the
+        ones created by :meth:`memoize`, :meth:`persist`, :meth:`lazy` or by
+        :func:`functools.lru_cache` do.
+        """
+        return _cached(self).cache_info()
+
+    def cache_clear(self):
+        """Clears the cache of a memoized Function, see :meth:`cache_info`."""
+        _cached(self).cache_clear()
+
+    def profile(self):
+        """Returns a :class:`~fx.profiler.Profiler` running all stages.
+
+        The profiler is called as the Function would be, and collects the
+        number of calls and the time spent in each stage, plus the number of
+        items and the time producing them for stages returning iterators.
+
+        >>> p = lambda n: n % 3 == 0 or n % 5 == 0
+        >>> euler_p1 = Function(range) << 1 | Function(filter) << p | sum
+        >>> profiler = euler_p1.profile()
+        >>> profiler(1000)
+        233168
+        >>> [stats.items for stats in profiler.stats]
+        [0, 466, 0]
+        >>> profiler.print_stats()  # doctest: +ELLIPSIS
+          #  stage                calls   time (ms)  items  per item (us)
+          0  range << 1               1 ...
+          1  filter << <lambda>       1 ...
+          2  sum                      1 ...
+        """
+        return Profiler(self.stages)
+
     def __eq__(self, other):
         """``self == other``
 
@@ -325,3 +685,213 @@ class Function(object):
             return iter(output)
         except TypeError:
             return iter((output,))
+
+
+class AsyncFunction(Function):
+    """A function wrapper class for pipelines with asynchronous stages.
+
+    Invoking an AsyncFunction returns a coroutine, which awaits the output of
+    each stage if it is awaitable before passing it to the next one, so that
+    coroutine functions and plain functions can be mixed with all operators
+    of :class:`Function`.  Combining an AsyncFunction with a Function by
+    ``|`` or ``**``, on either side, creates an AsyncFunction.
+
+    >>> import asyncio
+    >>> async def fetch(n):
+    ...     await asyncio.sleep(0.01)
+    ...     return [n] * n
+    >>> pipeline = AsyncFunction(abs) | fetch | sum
+    >>> asyncio.run(pipeline(-3))
+    9
+    >>> asyncio.run((str ** Function(len) ** AsyncFunction(fetch))(3))
+    '3'
+
+    Coroutine stages only run when awaited, an AsyncFunction object with all
+    arguments applied is awaited as is:
+
+    >>> async def main():
+    ...     return await (AsyncFunction(fetch) << 2 | len)
+    >>> asyncio.run(main())
+    2
+    """
+    # NOTE:
+    # Function objects are not checked for coroutine functions as they are
+    # combined, which would slow down building every pipeline, the result of
+    # ``|`` and ``**`` is an AsyncFunction only if one operand already is.
+    __slots__ = ()
+
+    async def invoke(self, *args, **kwargs):
+        """Invokes stages with ``args`` and ``kwargs``, awaiting outputs."""
+        stages = iter(self._stages or self._flatten())
+        output = next(stages)(*args, **kwargs)
+        if isinstance(output, Awaitable):
+            output = await output
+        for stage in stages:
+            output = stage(output)
+            if isinstance(output, Awaitable):
+                output = await output
+        return output
+
+    value = property(invoke)
+    call = invoke
+    __call__ = invoke
+    __pos__ = invoke
+
+    def __await__(self):
+        return self.invoke().__await__()
+
+    # overridden in a subclass, reflected operators of an AsyncFunction on
+    # the right side of a Function take precedence
+    def __ror__(self, function):
+        return self.compose(function)
+
+    def __rpow__(self, function):
+        return self.pipe(function)
+
+    def amap(self, limit=None, ordered=True):
+        """Creates an AsyncFunction awaiting ``self`` over an iterable
+        concurrently.
+
+        At most ``limit`` calls are awaited at a time, see
+        :func:`~fx.aio.async_map`.
+
+        >>> import asyncio
+        >>> async def fetch(n):
+        ...     await asyncio.sleep(0.01)
+        ...     return n * n
+        >>> total = Function(range) | AsyncFunction(fetch).amap(limit=5) | sum
+        >>> asyncio.run(total(10))
+        285
+        """
+        from fx.aio import async_map
+        function = self.stages[0] if len(self.stages) == 1 else self
+        return self._chain((partial(
+            async_map, function, limit=limit, ordered=ordered),))
+
+    def singleflight(self, key=None):
+        """Creates an AsyncFunction running ``self`` once for concurrent
+        calls, see :class:`~fx.cache.AsyncSingleFlight`."""
+        from inspect import iscoroutinefunction
+        function = self.stages[0]
+        if len(self.stages) > 1 or not iscoroutinefunction(function):
+            function = self
+        return self._chain((AsyncSingleFlight(function, key),))
+
+    def _unsupported(self, *args, **kwargs):
+        raise TypeError('not supported by AsyncFunction objects')
+
+    # these expect results, not coroutines
+    compile = memoize = persist = lazy = profile = _unsupported
+    pmap = preduce = _unsupported
+
+    # outputs are only known once awaited
+    __eq__ = object.__eq__
+    __ne__ = object.__ne__
+    __hash__ = object.__hash__
+    __contains__ = None
+    __iter__ = None
+
+
+def _restore(cls, stages):
+    """Creates a Function object of type ``cls`` from pickled ``stages``."""
+    return cls._chain(stages)
+
+
+def _cached(function):
+    """Returns the cached function of Function ``function``."""
+    head = function.stages[0]
+    while type(head) is partial:
+        head = head.func
+    if not hasattr(head, 'cache_clear'):
+        raise TypeError('%r is not memoized' % function.__name__)
+    return head
+
+
+# NOTE:
+# Hooks are installed by replacing the invoke methods of Function, so that
+# while none is registered, invocation runs exactly as it would without
+# hook support, not even checking for hooks.
+_hooks = ()
+# no hook is called on invocations not multiple of it
+_sample_gcd = 1
+_hooks_lock = Lock()
+_invocations = count()
+_invoke = Function.invoke
+
+
+def _instrumented_invoke(self, *args, **kwargs):
+    number = next(_invocations)
+    if number % _sample_gcd:
+        # as in Function.invoke, without one more call
+        stages = iter(self._stages or self._flatten())
+        output = next(stages)(*args, **kwargs)
+        for stage in stages:
+            output = stage(output)
+        return output
+    sampled = [hook for hook, sample in _hooks if number % sample == 0]
+    start = perf_counter()
+    try:
+        output = _invoke(self, *args, **kwargs)
+    except Exception as error:
+        elapsed = perf_counter() - start
+        for hook in sampled:
+            hook(self, elapsed, error)
+        raise
+    elapsed = perf_counter() - start
+    for hook in sampled:
+        hook(self, elapsed, None)
+    return output
+
+
+def _install(invoke):
+    Function.invoke = Function.call = invoke
+    Function.__call__ = Function.__pos__ = invoke
+    Function.value = property(invoke)
+
+
+def add_hook(hook, sample=1):
+    """Registers ``hook``, called after invocations of Function objects.
+
+    ``hook(function, seconds, error)`` is called with the Function invoked,
+    the time the invocation took and the exception it raised, or None.
+    If ``sample`` is greater than 1, only 1 in ``sample`` invocations are
+    timed and reported.  Exceptions raised by hooks are not caught.
+
+    While no hook is registered, invocation pays nothing for hook support.
+
+    >>> errors = []
+    >>> def hook(function, seconds, error):
+    ...     errors.append(error)
+    >>> add_hook(hook)
+    >>> Function(int)('42')
+    42
+    >>> Function(int)('spam')
+    Traceback (most recent call last):
+    ...
+    ValueError: invalid literal for int() with base 10: 'spam'
+    >>> errors
+    [None, ValueError("invalid literal for int() with base 10: 'spam'")]
+    >>> remove_hook(hook)
+    """
+    global _hooks, _sample_gcd
+    if sample < 1:
+        raise ValueError('sample must be a positive integer')
+    with _hooks_lock:
+        _hooks += ((hook, int(sample)),)
+        _sample_gcd = reduce(gcd, [sample for hook, sample in _hooks])
+        _install(_instrumented_invoke)
+
+
+def remove_hook(hook):
+    """Unregisters ``hook`` registered with :func:`add_hook`."""
+    global _hooks, _sample_gcd
+    with _hooks_lock:
+        hooks = tuple(pair for pair in _hooks if pair[0] is not hook)
+        if len(hooks) == len(_hooks):
+            raise ValueError('hook not registered')
+        _hooks = hooks
+        if _hooks:
+            _sample_gcd = reduce(gcd, [sample for hook, sample in _hooks])
+        else:
+            _sample_gcd = 1
+            _install(_invoke)
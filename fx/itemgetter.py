@@ -2,11 +2,15 @@
 # License: BSD New, see LICENSE for details.
 """fx.itemgetter - item getter."""
 
-__all__ = ['_', 'x']
+__all__ = ['_', 'project', 'x']
 
-import sys
-from functools import reduce
-from itertools import islice
+from array import array
+from collections import OrderedDict, deque
+from collections.abc import Sequence
+from itertools import count, islice, tee
+from mmap import mmap
+from operator import itemgetter
+from fx.compiler import cached_template
 
 
 class ItemGetter(object):
@@ -32,36 +36,440 @@ class ItemGetter(object):
     >>> get_name = _['name']
     >>> get_name({'name': 'Joe', 'age': 42})
     'Joe'
+
+    Subscriptions after ``view`` slice without copying, see :func:`get_view`.
+    >>> cdr = _.view[1:]
+    >>> isinstance(cdr(b'abc'), memoryview)
+    True
+    >>> cddr = cdr[1:]
+    >>> bytes(cddr(b'abc'))
+    b'c'
     """
-    def __init__(self):
-        self.keys = []
+    __slots__ = ('parent', 'key', 'depth', 'views', 'accessor')
+
+    def __init__(self, parent=None, key=None, views=None):
+        # NOTE:
+        # A key path is a linked list of getters, each one holds a reference
+        # to its parent and the last key only, so that subscription is O(1)
+        # and common prefixes of paths are shared.
+        self.parent = parent
+        self.key = key
+        self.depth = 0 if parent is None else parent.depth + 1
+        if views is None:
+            views = False if parent is None else parent.views
+        self.views = views
+        self.accessor = None
+
+    @property
+    def view(self):
+        """Getter of the same keys, following slices of which return views."""
+        if self.views:
+            return self
+        # interned by the getter viewed, as subscriptions are by parent
+        token = type(self), self if self.depth else None, 'view'
+        try:
+            return interned[token]
+        except KeyError:
+            pass
+        return intern(token, type(self)(self.parent, self.key, views=True))
+
+    @property
+    def keys(self):
+        """Keys of this getter, in the order they are applied."""
+        return tuple(key for function, key in self.steps)
+
+    @property
+    def steps(self):
+        """Pairs of getter function and key, in the order they are applied."""
+        steps = []
+        getter = self
+        while getter.depth:
+            function = get_view if getter.parent.views else get
+            steps.append((function, getter.key))
+            getter = getter.parent
+        steps.reverse()
+        return tuple(steps)
 
     def __getitem__(self, key):
-        getter = type(self)()
-        getter.keys = self.keys[:]
-        getter.keys.append(key)
-        return getter
+        if isinstance(key, slice):
+            token = slice, key.start, key.stop, key.step
+        else:
+            token = type(key), key
+        # all factory objects are equivalent, their children are interned
+        # by key only.
+        token = type(self), self if self.depth else None, self.views, token
+        try:
+            return interned[token]
+        except KeyError:
+            pass
+        except TypeError:
+            # unhashable key, never interned
+            return type(self)(self, key)
+
+        return intern(token, type(self)(self, key))
+
+    def __reduce__(self):
+        # pickled as its keys, the accessor is compiled again when called
+        # and the path interned again when subscribed.
+        path = tuple((key, function is get_view)
+                     for function, key in self.steps)
+        return restore_getter, (type(self), path, self.views)
 
     def __call__(self, obj):
-        def get(obj, key):
-            """The item getter"""
-            if hasattr(obj, '__getitem__'):
-                return obj[key]
+        # NOTE:
+        # The key path is compiled into an accessor function on second call,
+        # so that the common case is as fast as hand-written subscriptions,
+        # while getters used once, e.g. of dynamic keys, pay no compiling.
+        accessor = self.accessor
+        if accessor is None:
+            self.accessor = False
+            return get_steps(obj, self.steps)
+        if accessor is False:
+            accessor = self.accessor = compile_steps(self.steps)
+        return accessor(obj)
+
+
+#: Maximum number of interned getters
+INTERN_SIZE = 1024
+
+#: Interned getters, keyed by type, parent and key, or by type and getter
+#: viewed
+interned = OrderedDict()
+
+
+def intern(token, getter):
+    """Interns ``getter`` by ``token``, returns it."""
+    interned[token] = getter
+    if len(interned) > INTERN_SIZE:
+        try:
+            # oldest first out, in constant time unlike plain dicts
+            interned.popitem(last=False)
+        except KeyError:
+            pass
+    return getter
+
+
+def restore_getter(cls, path, views):
+    """Creates a getter of type ``cls`` from ``path``, pairs of key and
+    whether it is a view.
+
+    >>> import pickle
+    >>> getter = pickle.loads(pickle.dumps(_.view['data'][1:]))
+    >>> getter is _.view['data'][1:]
+    True
+    """
+    getter = cls()
+    for key, view in path:
+        if view:
+            getter = getter.view
+        getter = getter[key]
+    return getter.view if views else getter
+
+
+def get(obj, key):
+    """The item getter, works on iterables without ``__getitem__`` as well."""
+    if hasattr(obj, '__getitem__'):
+        return obj[key]
+
+    if isinstance(key, slice):
+        return islice_tail(obj, key)
+
+    if not isinstance(key, int):
+        raise ValueError('key must be an integer')
+
+    if key >= 0:
+        for item in islice(obj, key, None):
+            return item
+    else:
+        tail = deque(obj, maxlen=-key)
+        if len(tail) == -key:
+            return tail[0]
+
+    raise IndexError('index out of range')
+
+
+def islice_tail(iterable, key):
+    """Slices ``iterable`` with slice object ``key``, returns an iterator.
+
+    Unlike :func:`itertools.islice`, negative indices and steps are
+    supported, keeping no more items in memory than the slice requires.
+
+    >>> list(islice_tail(iter(range(10)), slice(-3, None)))
+    [7, 8, 9]
+    >>> list(islice_tail(iter(range(10)), slice(2, -5, 2)))
+    [2, 4]
+    >>> list(islice_tail(iter(range(10)), slice(None, -4, -2)))
+    [9, 7]
+    """
+    start, stop, step = key.start, key.stop, key.step
+    if step is None:
+        step = 1
+    if step > 0:
+        if start is None or start >= 0:
+            if stop is None or stop >= 0:
+                return islice(iterable, start, stop, step)
+            return islice_init(iterable, start or 0, -stop, step)
+        if stop is None and step == 1:
+            # the last -start items, whatever the length
+            return iter(deque(iterable, maxlen=-start))
+        # only the last -start items are needed
+        size = -start
+    elif stop is not None and stop < 0:
+        # only the last -stop - 1 items are needed
+        size = -stop - 1
+    elif start is not None and start >= 0:
+        return iter(list(islice(iterable, start + 1))[key])
+    else:
+        return iter(list(iterable)[key])
+
+    # the count of items is needed to resolve negative indices, pairs items
+    # with their indices in order to count them at C speed.
+    tail = deque(zip(iterable, count()), maxlen=size)
+    length = tail[-1][1] + 1 if tail else 0
+    offset = length - len(tail)
+    return iter([tail[index - offset][0]
+                 for index in range(*key.indices(length))])
+
+
+def islice_init(iterable, start, size, step):
+    """Yields items of ``iterable`` from ``start``, except the last ``size``.
+
+    >>> list(islice_init(iter(range(10)), 2, 3, 1))
+    [2, 3, 4, 5, 6]
+    """
+    iterator = islice(iterable, start, None)
+    window = deque(islice(iterator, size))
+    for index, item in enumerate(iterator):
+        window.append(item)
+        item = window.popleft()
+        if index % step == 0:
+            yield item
+
+
+def get_view(obj, key):
+    """The item getter, slices without copying when possible.
+
+    ``bytes``, ``bytearray``, :class:`array.array` and :class:`mmap.mmap`
+    objects are sliced as :class:`memoryview`, lists and tuples as
+    :class:`SequenceView`.  Other objects are sliced as usual, as are
+    ``memoryview`` objects and ``numpy`` arrays, slices of which are views
+    already.
+
+    >>> get_view(bytearray(b'spam'), slice(1, 3)).tobytes()
+    b'pa'
+    >>> get_view([1, 2, 3, 4], slice(None, None, -2))
+    SequenceView([4, 2])
+    >>> get_view('spam', slice(1, 3))
+    'pa'
+    """
+    if isinstance(key, slice):
+        if isinstance(obj, BUFFER_TYPES):
+            return memoryview(obj)[key]
+        if isinstance(obj, (list, tuple)):
+            return SequenceView(obj, key)
+    return get(obj, key)
 
-            if isinstance(key, slice):
-                start, stop, step = key.start, key.stop, key.step
-                return (item for item in islice(obj, start, stop, step))
 
-            if not isinstance(key, int) or not 0 <= key <= sys.maxsize:
-                raise ValueError('key must be an integer: 0 <= x <= maxsize')
+#: Types sliced as memoryview by get_view
+BUFFER_TYPES = (bytes, bytearray, array, mmap)
 
-            for index, item in enumerate(obj):
-                if index == key:
-                    return item
 
-            raise IndexError('index out of range')
+class SequenceView(Sequence):
+    """Read-only view of a slice of a sequence.
+
+    Changes to the underlying sequence are visible through the view.
+
+    >>> numbers = list(range(10))
+    >>> evens = SequenceView(numbers, slice(None, None, 2))
+    >>> evens
+    SequenceView([0, 2, 4, 6, 8])
+    >>> evens[1:][::-1]
+    SequenceView([8, 6, 4, 2])
+    >>> numbers[2] = 'two'
+    >>> evens[1]
+    'two'
+    >>> evens == [0, 'two', 4, 6, 8]
+    True
+    """
+    __slots__ = ('sequence', 'indices')
+
+    def __init__(self, sequence, key=slice(None)):
+        if isinstance(sequence, SequenceView):
+            self.sequence = sequence.sequence
+            self.indices = sequence.indices[key]
+        else:
+            self.sequence = sequence
+            self.indices = range(len(sequence))[key]
+
+    def __len__(self):
+        return len(self.indices)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return type(self)(self, index)
+        return self.sequence[self.indices[index]]
+
+    def __iter__(self):
+        return map(self.sequence.__getitem__, self.indices)
+
+    def __reversed__(self):
+        return map(self.sequence.__getitem__, reversed(self.indices))
+
+    def __eq__(self, other):
+        if isinstance(other, SequenceView):
+            other = type(other.sequence)(other)
+        return type(self.sequence)(self) == other
+
+    def __ne__(self, other):
+        return not self == other
+
+    __hash__ = None
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, type(self.sequence)(self))
+
+
+def get_steps(obj, steps):
+    """Applies ``steps``, pairs of getter function and key, to ``obj``."""
+    for function, key in steps:
+        obj = function(obj, key)
+    return obj
+
+
+#: Maximum number of keys compiled into a single expression
+COMPILE_DEPTH = 256
+
+ACCESSOR_TEMPLATE = '''\
+def make_accessor(get_steps, get_view, steps, {names}):
+    def accessor(obj):
+{body}
+    return accessor
+'''
+
+# consecutive subscriptions, falling back to the getter functions from the
+# value they started on, never from the start of the path, as slices of
+# views before may have consumed iterators
+SUBSCRIPT_TEMPLATE = '''\
+        try:
+            {target} {expression}
+        except TypeError:
+            {target} get_steps(obj, steps[{start}:{stop}])'''
+
+# a slice of a view, which falls back by itself
+VIEW_TEMPLATE = '''\
+        obj = get_view(obj, {name})'''
+
+
+def compile_steps(steps):
+    """Compiles ``steps``, pairs of getter function and key, into a function.
+
+    The accessor subscripts its argument with the keys one after another,
+    falling back to the getter function of a step for objects that are not
+    subscriptable, continuing from there.  Code generated depends only on the number of keys and
+    which ones are views, it is cached and shared by getters of the same
+    shape, only keys are bound per getter.
+
+    >>> accessor = compile_steps([(get, 'name'), (get, 0)])
+    >>> accessor({'name': 'Joe'})
+    'J'
+    >>> accessor({'name': iter('Joe')})
+    'J'
+    """
+    steps = tuple(steps)
+    if len(steps) > COMPILE_DEPTH:
+        # too deep for the compiler, subscripts one key at a time instead
+        return lambda obj: get_steps(obj, steps)
+    shape = tuple(
+        function is get_view and isinstance(key, slice)
+        for function, key in steps)
+    try:
+        make_accessor = accessors[shape]
+    except KeyError:
+        make_accessor = accessors[shape] = accessor_template(shape)
+        if len(accessors) > ACCESSORS_SIZE:
+            try:
+                del accessors[next(iter(accessors))]
+            except (StopIteration, RuntimeError, KeyError):
+                pass
+    return make_accessor(
+        get_steps, get_view, steps, *[key for function, key in steps])
+
+
+#: Maximum number of accessor factories cached
+ACCESSORS_SIZE = 256
+
+#: Accessor factories, keyed by views of steps
+accessors = {}
+
+
+def accessor_template(shape):
+    """Returns the accessor factory of steps of ``shape``, flags of views."""
+    names = ['key%d' % index for index in range(len(shape))]
+    body = []
+    start = 0
+    for index, view in enumerate(shape + (True,)):
+        if not view:
+            continue
+        if start < index:
+            # subscriptions from start to index
+            expression = 'obj' + ''.join(
+                '[%s]' % name for name in names[start:index])
+            target = 'return' if index == len(shape) else 'obj ='
+            body.append(SUBSCRIPT_TEMPLATE.format(
+                target=target, expression=expression, start=start,
+                stop=index))
+        if index < len(shape):
+            body.append(VIEW_TEMPLATE.format(name=names[index]))
+        start = index + 1
+    if not shape or shape[-1]:
+        body.append('        return obj')
+    source = ACCESSOR_TEMPLATE.format(
+        names=', '.join(names), body='\n'.join(body))
+    return cached_template(source, 'make_accessor')
+
+
+def project(fields, records, columns=None):
+    """Extracts ``fields`` from each record in ``records``.
+
+    ``fields`` is a sequence of keys or :class:`ItemGetter` objects, returns
+    an iterator of tuples, one per record.
+
+    >>> records = [{'id': 1, 'value': 'a'}, {'id': 2, 'value': 'b'}]
+    >>> list(project(['id', 'value'], records))
+    [(1, 'a'), (2, 'b')]
+    >>> list(project([_['value'][0]], records))
+    [('a',), ('b',)]
+
+    If ``columns`` is given, returns a list of columns instead, each one
+    created by calling ``columns`` on the extracted values of a field, e.g.
+    ``list``, or ``numpy.array``.
+
+    >>> project(['id', 'value'], records, columns=list)
+    [[1, 2], ['a', 'b']]
+    """
+    fields = list(fields)
+    if not fields:
+        # no value to extract, an empty tuple per record, and no column
+        if columns is None:
+            return (() for record in records)
+        return []
+    if not any(isinstance(field, ItemGetter) for field in fields):
+        # flat keys, extracts all fields of a record with a single call
+        if len(fields) == 1:
+            rows = zip(map(itemgetter(fields[0]), records))
+        else:
+            rows = map(itemgetter(*fields), records)
+    else:
+        getters = [
+            field if isinstance(field, ItemGetter) else itemgetter(field)
+            for field in fields]
+        iterators = tee(records, len(getters))
+        rows = zip(*[map(*pair) for pair in zip(getters, iterators)])
 
-        return reduce(get, self.keys, obj)
+    if columns is None:
+        return rows
+    values = list(zip(*rows)) or [()] * len(fields)
+    return [columns(value) for value in values]
 
 
 #: ItemGetter factory object
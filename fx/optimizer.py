@@ -0,0 +1,186 @@
+# Copyright 2012-2014, Philip Xu <pyx@xrefactor.com>
+# License: BSD New, see LICENSE for details.
+"""fx.optimizer - rewrites stages of Function into equivalent faster ones."""
+
+__all__ = ['optimize_stages']
+
+from functools import partial
+from fx.compiler import fuse
+from fx.utils import compose, constant, flip, identity
+
+#: Functions consuming a whole iterable of any type
+CONSUMERS = (frozenset, iter, list, max, min, set, sorted, sum, tuple)
+
+#: Functions materializing an iterable
+MATERIALIZERS = (list, tuple)
+
+#: Functions without side effects, returning immutable values
+PURE = (
+    abs, ascii, bin, bool, chr, complex, float, hex, int, len, oct, ord,
+    repr, round, str)
+
+#: Types of scalars which cannot change
+IMMUTABLE = (bool, bytes, complex, float, int, str, type(None))
+
+
+def one_of(function, functions):
+    """Returns True if ``function`` is one of ``functions``."""
+    return any(function is other for other in functions)
+
+
+def is_consumer(function):
+    """Returns True if ``function`` consumes an iterable of any type."""
+    if one_of(function, CONSUMERS):
+        return True
+    # bound method str.join, e.g. ' '.join
+    return (
+        isinstance(getattr(function, '__self__', None), str) and
+        getattr(function, '__name__', None) == 'join')
+
+
+def is_pure(function):
+    """Returns True if ``function`` is known to be free of side effects."""
+    while type(function) is partial:
+        if not (is_immutable(function.args) and
+                is_immutable(tuple((function.keywords or {}).values()))):
+            return False
+        function = function.func
+    return one_of(function, PURE)
+
+
+def is_immutable(value):
+    """Returns True if ``value`` is an immutable scalar, or a tuple or a
+    frozenset of them, which cannot change after being folded.
+
+    >>> is_immutable((1, 'spam', frozenset([None]))), is_immutable((1, []))
+    (True, False)
+    """
+    if type(value) in IMMUTABLE:
+        return True
+    if type(value) in (tuple, frozenset):
+        return all(is_immutable(item) for item in value)
+    return False
+
+
+def operation(function):
+    """Returns ``(map, g)`` for ``partial(map, g)``, ``(filter, p)`` for
+    ``partial(filter, p)``, otherwise None."""
+    if (type(function) is partial and len(function.args) == 1 and
+            not function.keywords and
+            (function.func is map or function.func is filter)):
+        return function.func, function.args[0]
+    return None
+
+
+def cancel_flips(function, report):
+    """Removes pairs of flips nested in ``function``."""
+    if type(function) is flip:
+        if type(function.func) is flip:
+            report.append('double flip')
+            return cancel_flips(function.func.func, report)
+        func = cancel_flips(function.func, report)
+        return function if func is function.func else flip(func)
+
+    if type(function) is partial:
+        func = cancel_flips(function.func, report)
+        if func is function.func:
+            return function
+        return partial(func, *function.args, **function.keywords)
+
+    if type(function) is compose:
+        f = cancel_flips(function.f, report)
+        g = cancel_flips(function.g, report)
+        if f is function.f and g is function.g:
+            return function
+        return compose(f, g)
+
+    return function
+
+
+def optimize_stages(stages, report=None):
+    """Rewrites ``stages`` into equivalent ones that run faster.
+
+    Rewrites, by the names appended to list ``report`` when they fire:
+
+    ``'double flip'``
+      flipping arguments twice cancels out.
+    ``'single argument flip'``
+      flipping the only argument passed to stages after the first one does
+      nothing.
+    ``'identity'``
+      :func:`~fx.utils.identity` after the first stage does nothing.
+    ``'materialization'``
+      ``list`` or ``tuple`` after the first stage is dropped if followed by a
+      function that consumes any iterable, e.g. ``sum``, ``sorted``, ``iter``
+      or ``str.join``, so that items are consumed as they are produced.
+      Note that with ``iter``, items are then produced lazily.
+    ``'constant folding'``
+      a constant followed by a pure function like ``len`` or ``str`` is
+      evaluated once, into a new constant.
+    ``'map filter fusion'``
+      adjacent ``map`` and ``filter`` applications with a single function
+      are fused into one generator, looping once over the items, see
+      :func:`fx.compiler.fuse`.  As the first stage, only ``map`` is, taking
+      all arguments.  Items are still produced lazily, but once a function
+      raises, the generator is finished.
+
+    >>> from fx.utils import constant
+    >>> report = []
+    >>> optimize_stages(
+    ...     [flip(flip(range)), flip(map), list, sum], report)
+    (<class 'range'>, <class 'map'>, <built-in function sum>)
+    >>> report
+    ['double flip', 'single argument flip', 'materialization']
+    >>> optimize_stages([constant(42), str, len], report)[0]()
+    2
+    """
+    if report is None:
+        report = []
+    stages = [cancel_flips(stage, report) for stage in stages]
+
+    optimized = stages[:1]
+    for stage in stages[1:]:
+        if type(stage) is flip:
+            report.append('single argument flip')
+            stage = stage.func
+        if stage is identity:
+            report.append('identity')
+            continue
+        if (len(optimized) > 1 and one_of(optimized[-1], MATERIALIZERS) and
+                is_consumer(stage)):
+            report.append('materialization')
+            optimized.pop()
+        optimized.append(stage)
+
+    # only immutable values, results of others may change with them
+    while (len(optimized) > 1 and type(optimized[0]) is constant and
+           is_immutable(optimized[0].value) and is_pure(optimized[1])):
+        try:
+            value = optimized[1](optimized[0].value)
+        except Exception:
+            # leaves it to invocation to raise
+            break
+        report.append('constant folding')
+        optimized[:2] = [constant(value)]
+
+    fused = optimized[:1]
+    run = []
+    head = operation(optimized[0]) if optimized else None
+    if head is not None and head[0] is map:
+        # maps over all arguments, fused with the stages following it
+        fused, run = [], optimized[:1]
+    for stage in optimized[1:] + [None]:
+        if operation(stage) is not None:
+            run.append(stage)
+            continue
+        if len(run) > 1:
+            report.append('map filter fusion')
+            fused.append(fuse(
+                [operation(function) for function in run], head=not fused))
+        else:
+            fused.extend(run)
+        run = []
+        if stage is not None:
+            fused.append(stage)
+
+    return tuple(fused)
@@ -0,0 +1,429 @@
+# Copyright 2012-2014, Philip Xu <pyx@xrefactor.com>
+# License: BSD New, see LICENSE for details.
+"""fx.parallel - runs stages over thread or process pools."""
+
+__all__ = ['SharedMemoryTransport', 'parallel_map', 'parallel_reduce']
+
+import os
+from array import array
+from collections import deque, namedtuple
+from functools import partial, reduce
+from itertools import islice
+from fx.cache import MISSING
+
+#: Items and results of at least this many bytes go through shared memory
+SHARED_MEMORY_SIZE = 64 * 1024
+
+
+def parallel_map(function, iterable, workers=None, processes=False,
+                 chunksize=1, ordered=True, inflight=None, executor=None,
+                 transport='pickle'):
+    """Returns an iterator of ``function`` applied to items of ``iterable``,
+    in parallel.
+
+    Items are sent in chunks of ``chunksize`` to a pool of ``workers``
+    threads, or processes if ``processes`` is True, the number of CPUs by
+    default.  With processes, ``function`` and items must be picklable.
+    If ``ordered`` is False, results are produced as soon as their chunk
+    is done, rather than in the order of items.
+
+    At most ``inflight`` chunks are submitted ahead of the results consumed,
+    twice the number of workers by default, so that ``iterable`` can be a
+    stream larger than memory.  Items are read and submitted on first use of
+    the iterator, and the pool is shut down once the iterator is exhausted,
+    closed or garbage collected.  If ``executor`` is given, it is used
+    instead of a new pool, and left running, reusing a pool saves starting
+    workers, processes especially, on each call.
+
+    With ``transport='shared_memory'``, large buffers are passed to and
+    from processes through shared memory instead of being pickled, see
+    :class:`SharedMemoryTransport`.
+
+    >>> list(parallel_map(abs, range(-3, 3), workers=2))
+    [3, 2, 1, 0, 1, 2]
+    >>> sorted(parallel_map(abs, range(-3, 3), chunksize=2, ordered=False))
+    [0, 1, 1, 2, 2, 3]
+    """
+    if chunksize < 1:
+        raise ValueError('chunksize must be a positive integer')
+    count = workers or os.cpu_count() or 1
+    if inflight is None:
+        inflight = 2 * count
+    if inflight < 1:
+        raise ValueError('inflight must be a positive integer')
+    try:
+        transport = TRANSPORTS[transport]
+    except KeyError:
+        raise ValueError('unknown transport %r' % (transport,))
+    chunks = chunked(iterable, chunksize)
+    if executor is not None:
+        return run_map(function, chunks, executor, ordered, inflight,
+                       transport=transport)
+    # imported on use, as importing them takes longer than fx
+    from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+    pool = ProcessPoolExecutor if processes else ThreadPoolExecutor
+    return run_map(function, chunks, pool, ordered, inflight, count,
+                   transport)
+
+
+def parallel_reduce(function, iterable, initial=MISSING, workers=None,
+                    processes=False, chunksize=1024, inflight=None,
+                    executor=None):
+    """Returns ``iterable`` reduced by ``function`` in parallel, like
+    :func:`functools.reduce`.
+
+    ``function`` must be associative, ``function(a, function(b, c)) ==
+    function(function(a, b), c)``, not necessarily commutative.  Chunks of
+    ``chunksize`` items are reduced by a pool of threads or processes, see
+    :func:`parallel_map` for ``workers``, ``processes``, ``inflight`` and
+    ``executor``, and their results are combined, in order, as a balanced
+    tree.  ``initial``, if given, is placed before the items, and is the
+    result if ``iterable`` is empty.
+
+    ``iterable`` is read as a stream, at most ``inflight`` chunks and one
+    partial result per level of the tree are kept at a time, so that it can
+    be larger than memory.
+
+    >>> from operator import add
+    >>> parallel_reduce(add, range(10000), chunksize=100, workers=4)
+    49995000
+    >>> parallel_reduce(add, 'spam', chunksize=1)
+    'spam'
+    >>> parallel_reduce(add, [], 0)
+    0
+    """
+    if chunksize < 1:
+        raise ValueError('chunksize must be a positive integer')
+    partials = parallel_map(
+        partial(reduce, function), chunked(iterable, chunksize),
+        workers=workers, processes=processes, inflight=inflight,
+        executor=executor)
+    result = combine_tree(function, partials)
+    if result is MISSING:
+        if initial is MISSING:
+            raise TypeError(
+                'parallel_reduce() of empty iterable with no initial value')
+        return initial
+    if initial is not MISSING:
+        return function(initial, result)
+    return result
+
+
+def combine_tree(function, partials):
+    """Returns ``partials`` combined by ``function`` as a balanced binary
+    tree, in order, or :data:`MISSING` if there is none.
+
+    Like a binary counter, two results are combined as soon as they are of
+    the same level, the next level up, keeping at most one per level.
+
+    >>> combine_tree(lambda a, b: '(%s %s)' % (a, b), 'abcde')
+    '(((a b) (c d)) e)'
+    """
+    levels = []
+    for result in partials:
+        level = 0
+        while levels and levels[-1][0] == level:
+            result = function(levels.pop()[1], result)
+            level += 1
+        levels.append((level, result))
+    if not levels:
+        return MISSING
+    result = levels.pop()[1]
+    while levels:
+        result = function(levels.pop()[1], result)
+    return result
+
+
+def run_map(function, chunks, executor, ordered, inflight, workers=None,
+            transport=None):
+    """Yields results of ``function`` over ``chunks`` run by ``executor``,
+    a class of pool of ``workers`` created on first use if ``workers`` is
+    given, see :func:`parallel_map`."""
+    if transport is None:
+        transport = PickleTransport
+    if workers is not None:
+        executor = executor(workers)
+    pending = deque()
+    # futures done, not read yet, of unordered results
+    done = deque()
+
+    def submit(chunk):
+        return transport.submit(executor, function, chunk)
+
+    try:
+        for chunk in islice(chunks, inflight):
+            pending.append(submit(chunk))
+        if ordered:
+            while pending:
+                future = pending.popleft()
+                try:
+                    results = transport.result(future)
+                except BaseException:
+                    pending.appendleft(future)
+                    raise
+                for chunk in islice(chunks, 1):
+                    pending.append(submit(chunk))
+                for result in results:
+                    yield result
+        else:
+            from concurrent.futures import FIRST_COMPLETED, wait
+            pending = set(pending)
+            while pending:
+                ready, pending = wait(pending, return_when=FIRST_COMPLETED)
+                done.extend(ready)
+                while done:
+                    future = done.popleft()
+                    try:
+                        results = transport.result(future)
+                    except BaseException:
+                        done.appendleft(future)
+                        raise
+                    for chunk in islice(chunks, 1):
+                        pending.add(submit(chunk))
+                    for result in results:
+                        yield result
+    finally:
+        for future in pending:
+            transport.discard(future)
+        for future in done:
+            transport.discard(future)
+        if workers is not None:
+            executor.shutdown(wait=True)
+
+
+class PickleTransport(object):
+    """Passes chunks and results to workers as they are, pickled by
+    process pools."""
+    @staticmethod
+    def submit(executor, function, chunk):
+        return executor.submit(map_chunk, function, chunk)
+
+    @staticmethod
+    def result(future):
+        return future.result()
+
+    @staticmethod
+    def discard(future):
+        future.cancel()
+
+
+# how to rebuild a buffer from shared memory segment ``name``, ``kind`` is
+# 'bytes', 'array' or 'ndarray', ``format`` the struct format, array
+# typecode or numpy dtype, ``shape`` the shape of numpy arrays
+Shared = namedtuple('Shared', 'name kind format shape nbytes')
+
+
+class SharedMemoryTransport(object):
+    """Passes large buffers to and from workers through shared memory.
+
+    Items and results which are bytes-like objects, :class:`array.array` or
+    numpy arrays of at least :data:`SHARED_MEMORY_SIZE` bytes are copied
+    into :mod:`multiprocessing.shared_memory` segments, only their names
+    and layouts are pickled.  Workers read items in place, without copying:
+
+    - bytes-like objects and arrays as :class:`memoryview`,
+    - numpy arrays as numpy arrays over the segment.
+
+    Results are copied out of their segment into objects of their type,
+    bytes-like results into :class:`bytes`.  Smaller objects, and objects
+    nested in others, are pickled as usual.
+
+    Segments of items are removed once the results of their chunk are
+    read, or the chunk is cancelled or failed, segments of results once
+    copied out, or by the worker if a later item of the chunk fails.
+    Items must not be kept by workers past their call.
+    """
+    @staticmethod
+    def submit(executor, function, chunk):
+        segments = []
+        try:
+            items = [share(item, segments) for item in chunk]
+            future = executor.submit(map_shared_chunk, function, items)
+        except BaseException:
+            release(segments)
+            raise
+        future.segments = segments
+        return future
+
+    @staticmethod
+    def result(future):
+        try:
+            return [restore(result) for result in future.result()]
+        finally:
+            release(future.segments)
+
+    @staticmethod
+    def discard(future):
+        if not future.cancel():
+            try:
+                # results may be in segments to free
+                SharedMemoryTransport.result(future)
+            except BaseException:
+                pass
+        release(future.segments)
+
+
+#: Transports by name, see :func:`parallel_map`
+TRANSPORTS = {
+    'pickle': PickleTransport,
+    'shared_memory': SharedMemoryTransport,
+}
+
+
+def share(obj, segments=None):
+    """Returns ``obj`` as a :data:`Shared` if large enough to be copied into
+    a shared memory segment, appended to ``segments``, otherwise ``obj``."""
+    layout = buffer_layout(obj)
+    if layout is None:
+        return obj
+    from multiprocessing.shared_memory import SharedMemory
+    kind, format, shape, view = layout
+    segment = SharedMemory(create=True, size=view.nbytes)
+    try:
+        segment.buf[:view.nbytes] = view
+    except BaseException:
+        segment.close()
+        segment.unlink()
+        raise
+    if segments is not None:
+        segments.append(segment)
+    else:
+        segment.close()
+    return Shared(segment.name, kind, format, shape, view.nbytes)
+
+
+def buffer_layout(obj):
+    """Returns ``(kind, format, shape, bytes view)`` of ``obj`` if it is a
+    buffer to share, otherwise None."""
+    if isinstance(obj, array):
+        kind, format, shape = 'array', obj.typecode, None
+    elif isinstance(obj, (bytes, bytearray, memoryview)):
+        kind, format, shape = 'bytes', 'B', None
+    elif (type(obj).__module__ == 'numpy' and
+          type(obj).__name__ == 'ndarray'):
+        if obj.dtype.hasobject:
+            return None
+        kind, format, shape = 'ndarray', obj.dtype.str, obj.shape
+        if obj.dtype.fields is not None:
+            format = obj.dtype.descr
+        if not obj.flags.c_contiguous:
+            import numpy
+            obj = numpy.ascontiguousarray(obj)
+    else:
+        return None
+    view = memoryview(obj)
+    if view.nbytes < SHARED_MEMORY_SIZE or not view.c_contiguous:
+        return None
+    return kind, format, shape, view.cast('B')
+
+
+def attach(shared):
+    """Returns the segment of :data:`Shared` ``shared`` and the buffer over
+    it, without copying."""
+    from multiprocessing.shared_memory import SharedMemory
+    segment = SharedMemory(shared.name)
+    data = segment.buf[:shared.nbytes]
+    if shared.kind == 'ndarray':
+        import numpy
+        data = numpy.frombuffer(data, dtype=numpy.dtype(shared.format))
+        data = data.reshape(shared.shape)
+    elif shared.kind == 'array':
+        data = data.cast(shared.format)
+    return segment, data
+
+
+def restore(obj):
+    """Returns ``obj``, or a copy of the buffer it refers to if a
+    :data:`Shared`, removing its segment."""
+    if type(obj) is not Shared:
+        return obj
+    segment, data = attach(obj)
+    try:
+        if obj.kind == 'ndarray':
+            copy = data.copy()
+        elif obj.kind == 'array':
+            copy = array(obj.format)
+            copy.frombytes(data)
+        else:
+            copy = bytes(data)
+        if isinstance(data, memoryview):
+            data.release()
+        del data
+    finally:
+        segment.close()
+        segment.unlink()
+    return copy
+
+
+def release(segments):
+    """Closes and removes shared memory ``segments``."""
+    while segments:
+        segment = segments.pop()
+        segment.close()
+        try:
+            segment.unlink()
+        except FileNotFoundError:
+            pass
+
+
+def map_shared_chunk(function, items):
+    """Returns a list of ``function`` applied to ``items``, in a worker,
+    reading shared items in place and sharing large results."""
+    results = []
+    try:
+        for item in items:
+            if type(item) is Shared:
+                segment, data = attach(item)
+                try:
+                    result = share_result(function(data))
+                finally:
+                    if isinstance(data, memoryview):
+                        data.release()
+                    del data
+                    try:
+                        segment.close()
+                    except BufferError:
+                        # still referenced, unmapped once collected
+                        pass
+            else:
+                result = share_result(function(item))
+            results.append(result)
+    except BaseException:
+        for result in results:
+            if type(result) is Shared:
+                discard_shared(result)
+        raise
+    return results
+
+
+def share_result(result):
+    """Returns ``result`` shared, or as bytes if a memoryview too small to
+    be shared, which cannot be pickled, see :func:`share`."""
+    shared = share(result)
+    if shared is result and isinstance(result, memoryview):
+        return result.tobytes()
+    return shared
+
+
+def discard_shared(shared):
+    """Removes the segment of :data:`Shared` ``shared``."""
+    from multiprocessing.shared_memory import SharedMemory
+    segment = SharedMemory(shared.name)
+    segment.close()
+    segment.unlink()
+
+
+def chunked(iterable, size):
+    """Returns an iterator of lists of ``size`` items of ``iterable``, the
+    last one may be shorter.
+
+    >>> list(chunked(range(5), 2))
+    [[0, 1], [2, 3], [4]]
+    """
+    iterator = iter(iterable)
+    return iter(lambda: list(islice(iterator, size)), [])
+
+
+def map_chunk(function, chunk):
+    """Returns a list of ``function`` applied to items of ``chunk``."""
+    return [function(item) for item in chunk]
@@ -0,0 +1,520 @@
+# Copyright 2012-2014, Philip Xu <pyx@xrefactor.com>
+# License: BSD New, see LICENSE for details.
+"""fx.persist - caches results of functions on disk, across processes."""
+
+__all__ = ['DirectoryStore', 'Persisted', 'SQLiteStore', 'identity_of']
+
+import hashlib
+import io
+import json
+import mmap
+import os
+import pickle
+import sqlite3
+import tempfile
+import time
+from array import array
+from functools import partial
+from operator import attrgetter, itemgetter, methodcaller
+from threading import Lock
+from types import (
+    BuiltinFunctionType, CodeType, FunctionType, MethodDescriptorType, MethodType,
+    MethodWrapperType, ModuleType, WrapperDescriptorType)
+from fx.cache import (
+    AsyncSingleFlight, CacheInfo, Memoized, SingleFlight, Thunk)
+from fx.compiler import Fused
+from fx.itemgetter import ItemGetter
+from fx.record import RecordGetter
+from fx.utils import compose, constant, flip
+
+#: Pickle protocol of keys and values, fixed so that keys are stable
+PROTOCOL = 4
+
+#: Results of at least this many bytes are memory mapped, if raw buffers
+MMAP_SIZE = 64 * 1024
+
+#: Suffixes of paths taken as SQLite databases
+SQLITE_SUFFIXES = ('.db', '.sqlite', '.sqlite3')
+
+# callables identified by name, and the object they are bound to if any
+NAMED_TYPES = (
+    type, FunctionType, BuiltinFunctionType, MethodDescriptorType,
+    MethodWrapperType, WrapperDescriptorType)
+
+# header of raw files, followed by a JSON header padded to HEADER_SIZE
+RAW_MAGIC = b'FXRAW1\n'
+HEADER_SIZE = 256
+
+
+def identity_of(function):
+    """Returns a picklable value identifying ``function`` across processes.
+
+    Functions are identified by module, qualified name and a hash of their
+    byte code, so that editing a function invalidates its results, methods
+    also by the object they are bound to, partial applications, flips,
+    compositions and caching stages by their parts.  Variables of closures
+    are not taken into account.  Other callable objects cannot be told
+    apart by name, TypeError is raised for them.
+
+    >>> identity_of(abs)
+    ('builtins', 'abs')
+    >>> identity_of(partial(int, base=16))
+    ('partial', ('builtins', 'int'), (), (('base', 16),))
+    >>> identity_of(' '.join)
+    ('method', ' ', ('builtins', 'str.join'))
+    """
+    if hasattr(function, 'stages'):
+        return ('Function',) + tuple(map(identity_of, function.stages))
+    if type(function) is partial:
+        return (
+            'partial', identity_of(function.func),
+            tuple(map(identity_of_value, function.args)),
+            tuple((name, identity_of_value(value))
+                  for name, value in sorted(function.keywords.items())))
+    if type(function) is flip:
+        return 'flip', identity_of(function.func)
+    if type(function) is compose:
+        return 'compose', identity_of(function.f), identity_of(function.g)
+    if type(function) is constant:
+        return 'constant', identity_of_value(function.value)
+    if isinstance(function, ItemGetter):
+        return 'ItemGetter', function.views, function.keys
+    if isinstance(function, RecordGetter):
+        return ('RecordGetter',) + function.__reduce__()[1][1:]
+    if isinstance(function, Fused):
+        return ('Fused', function.head) + tuple(
+            (operation.__name__, identity_of_value(predicate))
+            for operation, predicate in function.operations)
+    if isinstance(function, (
+            AsyncSingleFlight, Memoized, Persisted, SingleFlight, Thunk)):
+        # caching does not change results
+        return identity_of(function.function)
+    if isinstance(function, (attrgetter, itemgetter, methodcaller)):
+        return 'operator', repr(function)
+
+    if isinstance(function, MethodType):
+        return ('method', identity_of_value(function.__self__),
+                identity_of(function.__func__))
+    if not isinstance(function, NAMED_TYPES):
+        raise TypeError(
+            'cannot identify %r by name, give a name' % (function,))
+    owner = getattr(function, '__self__', None)
+    if isinstance(owner, ModuleType):
+        owner = None
+    # methods of builtin types have no module, their class has
+    cls = getattr(function, '__objclass__', type(owner))
+    name = (
+        getattr(function, '__module__', None) or cls.__module__,
+        getattr(function, '__qualname__', None) or function.__name__)
+    if owner is not None:
+        # builtin methods, e.g. ``2 .__mul__``
+        return 'method', identity_of_value(owner), name
+    code = getattr(function, '__code__', None)
+    if code is not None:
+        return name + (hashlib.sha256(encode(code_of(code))).hexdigest(),)
+    return name
+
+
+def code_of(code):
+    """Returns byte code, constants and names of ``code``, of globals and
+    of variables, not where it is defined, so that moving a function keeps
+    its results."""
+    consts = tuple(
+        code_of(const) if isinstance(const, CodeType) else const
+        for const in code.co_consts)
+    return (code.co_code, consts, code.co_names, code.co_varnames,
+            code.co_freevars, code.co_cellvars)
+
+
+def identity_of_value(value):
+    """Returns identity of ``value``, an argument of a function or the
+    object a method is bound to, itself unless a function."""
+    if callable(value):
+        try:
+            return identity_of(value)
+        except TypeError:
+            # an object with state, pickled as it is
+            pass
+    return value
+
+
+class Sorted(tuple):
+    """Members of a set or items of a dict, in canonical order."""
+    __slots__ = ()
+
+
+def canonical(value):
+    """Returns ``value`` with members of sets and items of dicts sorted by
+    their encoding, in lists and tuples too, so that equal values are
+    encoded alike, whatever their order of insertion or hashes.
+
+    >>> canonical({'b': {2, 1}, 'a': ()})
+    (<class 'dict'>, (('a', ()), ('b', (<class 'set'>, (1, 2)))))
+    """
+    cls = type(value)
+    if cls is tuple or cls is list:
+        return cls(map(canonical, value))
+    if cls is dict:
+        items = sorted(
+            ((encode(key), (canonical(key), canonical(item)))
+             for key, item in value.items()), key=itemgetter(0))
+        return Sorted((cls, tuple(map(itemgetter(1), items))))
+    if cls is set or cls is frozenset:
+        members = sorted(
+            ((encode(member), canonical(member)) for member in value),
+            key=itemgetter(0))
+        return Sorted((cls, tuple(map(itemgetter(1), members))))
+    return value
+
+
+def encode(value):
+    """Returns ``value`` pickled canonically, see :func:`canonical`.
+
+    Objects are not memoized, equal values give equal bytes even if
+    some are the same object.
+    """
+    stream = io.BytesIO()
+    pickler = pickle.Pickler(stream, protocol=PROTOCOL)
+    pickler.fast = True
+    pickler.dump(canonical(value))
+    return stream.getvalue()
+
+
+def make_key(identity, args, kwargs):
+    """Returns a stable hash of ``identity`` and arguments, in hex."""
+    kwargs = tuple(sorted(kwargs.items()))
+    data = encode((identity, args, kwargs))
+    return hashlib.sha256(data).hexdigest()
+
+
+class DirectoryStore(object):
+    """Stores values in a directory, a file per key.
+
+    Values are pickled.  If ``mmap`` is True, bytes-like objects and arrays
+    of at least :data:`MMAP_SIZE` bytes are stored raw instead, and loaded
+    as read-only memory mapped views, without copying nor unpickling: bytes
+    as a :class:`memoryview`, :class:`array.array` as a memoryview of the
+    same item format, numpy arrays as numpy arrays.
+
+    Least recently used values are removed once files take more than
+    ``maxbytes`` bytes, ``None`` means no limit.  Sizes of files saved are
+    summed up, the directory is only scanned when the sum exceeds the
+    limit, or on the first save.
+    """
+    def __init__(self, path, maxbytes=None, mmap=False):
+        self.path = path
+        self.maxbytes = maxbytes
+        self.mmap = mmap
+        # bytes taken by files as of the last scan and saves since, None
+        # until scanned
+        self.total = None
+        os.makedirs(path, exist_ok=True)
+
+    def paths(self, key):
+        return (os.path.join(self.path, key + '.pickle'),
+                os.path.join(self.path, key + '.raw'))
+
+    def load(self, key):
+        """Returns the value of ``key``, raises KeyError if missing."""
+        for path in self.paths(key):
+            try:
+                with open(path, 'rb') as stream:
+                    if path.endswith('.raw'):
+                        value = load_raw(stream)
+                    else:
+                        value = pickle.load(stream)
+            except FileNotFoundError:
+                continue
+            except (EOFError, ValueError, pickle.UnpicklingError):
+                # corrupted, computed again
+                break
+            # recently used
+            touch(path)
+            return value
+        raise KeyError(key)
+
+    def save(self, key, value):
+        """Stores ``value`` of ``key``, returns the number of evictions."""
+        raw = raw_header(value) if self.mmap else None
+        if raw is None:
+            data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+            path = self.paths(key)[0]
+        else:
+            path = self.paths(key)[1]
+        fd, temporary = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as stream:
+                if raw is None:
+                    stream.write(data)
+                else:
+                    save_raw(stream, raw, value)
+                size = stream.tell()
+            os.replace(temporary, path)
+        except BaseException:
+            remove(temporary)
+            raise
+        if self.maxbytes is None:
+            return 0
+        if self.total is not None:
+            # replaced files are counted twice until the next scan
+            self.total += size
+            if self.total <= self.maxbytes:
+                return 0
+        return self.evict()
+
+    def entries(self):
+        """Returns (last used time, size, path) of stored values."""
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith(('.pickle', '.raw')):
+                try:
+                    stat = entry.stat()
+                except FileNotFoundError:
+                    continue
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        return entries
+
+    def evict(self):
+        """Removes least recently used values over ``maxbytes``."""
+        entries = sorted(self.entries())
+        total = sum(size for _, size, _ in entries)
+        evictions = 0
+        # keeps the most recent value, even if larger than maxbytes
+        for _, size, path in entries[:-1]:
+            if total <= self.maxbytes:
+                break
+            if remove(path):
+                evictions += 1
+            total -= size
+        self.total = total
+        return evictions
+
+    def __len__(self):
+        return len(self.entries())
+
+    def clear(self):
+        """Removes all values."""
+        for _, _, path in self.entries():
+            remove(path)
+        self.total = None
+
+
+class SQLiteStore(object):
+    """Stores pickled values in a SQLite database file.
+
+    Least recently used values are removed once values take more than
+    ``maxbytes`` bytes, ``None`` means no limit.
+    """
+    def __init__(self, path, maxbytes=None):
+        self.path = path
+        self.maxbytes = maxbytes
+        self.lock = Lock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'CREATE TABLE IF NOT EXISTS fx_cache ('
+                'key TEXT PRIMARY KEY, value BLOB, size INTEGER, used REAL)')
+
+    def __reduce__(self):
+        return SQLiteStore, (self.path, self.maxbytes)
+
+    def load(self, key):
+        """Returns the value of ``key``, raises KeyError if missing."""
+        with self.lock, self.connection:
+            row = self.connection.execute(
+                'SELECT value FROM fx_cache WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                raise KeyError(key)
+            self.connection.execute(
+                'UPDATE fx_cache SET used = ? WHERE key = ?',
+                (time.time(), key))
+        return pickle.loads(row[0])
+
+    def save(self, key, value):
+        """Stores ``value`` of ``key``, returns the number of evictions."""
+        data = pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL)
+        with self.lock, self.connection:
+            self.connection.execute(
+                'INSERT OR REPLACE INTO fx_cache VALUES (?, ?, ?, ?)',
+                (key, sqlite3.Binary(data), len(data), time.time()))
+            if self.maxbytes is None:
+                return 0
+            return self.evict()
+
+    def evict(self):
+        """Removes least recently used values over ``maxbytes``."""
+        total, = self.connection.execute(
+            'SELECT COALESCE(SUM(size), 0) FROM fx_cache').fetchone()
+        evictions = 0
+        rows = self.connection.execute(
+            'SELECT key, size FROM fx_cache ORDER BY used').fetchall()
+        # keeps the most recent value, even if larger than maxbytes
+        for key, size in rows[:-1]:
+            if total <= self.maxbytes:
+                break
+            self.connection.execute(
+                'DELETE FROM fx_cache WHERE key = ?', (key,))
+            total -= size
+            evictions += 1
+        return evictions
+
+    def __len__(self):
+        with self.lock:
+            return self.connection.execute(
+                'SELECT COUNT(*) FROM fx_cache').fetchone()[0]
+
+    def clear(self):
+        """Removes all values."""
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM fx_cache')
+
+
+def open_store(path, maxbytes=None, mmap=False):
+    """Returns a store at ``path``, a SQLite database if it has one of
+    :data:`SQLITE_SUFFIXES`, a directory otherwise."""
+    if path.endswith(SQLITE_SUFFIXES):
+        if mmap:
+            raise ValueError('only directory stores memory map values')
+        return SQLiteStore(path, maxbytes)
+    return DirectoryStore(path, maxbytes, mmap)
+
+
+class Persisted(object):
+    """Caches results of ``function`` in ``store``, across processes.
+
+    ``store`` is a store object, or a path opened with ``maxbytes`` and
+    ``mmap``, see :class:`DirectoryStore` and :class:`SQLiteStore`.  If the
+    store memory maps values, results are returned as loaded from it, on
+    first call as on the following ones.  Results are keyed by
+    a stable hash of ``name`` and arguments, ``name`` being derived from
+    ``function`` by default, see :func:`identity_of`.  Arguments and
+    results must be picklable.
+
+    >>> import tempfile
+    >>> calls = []
+    >>> def square(n):
+    ...     calls.append(n)
+    ...     return n * n
+    >>> path = tempfile.mkdtemp()
+    >>> Persisted(square, path)(4)
+    16
+    >>> Persisted(square, path)(4)
+    16
+    >>> calls
+    [4]
+    """
+    def __init__(self, function, store, maxbytes=None, name=None,
+                 mmap=False):
+        self.function = function
+        if isinstance(store, (str, bytes, os.PathLike)):
+            store = open_store(os.fsdecode(store), maxbytes, mmap)
+        self.store = store
+        self.identity = identity_of(function) if name is None else name
+        try:
+            make_key(self.identity, (), {})
+        except (AttributeError, TypeError, pickle.PicklingError):
+            raise TypeError(
+                'cannot identify %r, give a name' % (function,))
+        self.lock = Lock()
+        self.hits = self.misses = self.evictions = 0
+
+    def __call__(self, *args, **kwargs):
+        key = make_key(self.identity, args, kwargs)
+        try:
+            result = self.store.load(key)
+        except KeyError:
+            pass
+        else:
+            with self.lock:
+                self.hits += 1
+            return result
+
+        result = self.function(*args, **kwargs)
+        evictions = self.store.save(key, result)
+        if getattr(self.store, 'mmap', False):
+            # of the same type as results found
+            try:
+                result = self.store.load(key)
+            except KeyError:
+                pass
+        with self.lock:
+            self.misses += 1
+            self.evictions += evictions
+        return result
+
+    def __reduce__(self):
+        return Persisted, (self.function, self.store, None, self.identity)
+
+    def cache_info(self):
+        """Returns statistics of the cache as a :data:`~fx.cache.CacheInfo`,
+        ``maxsize`` is the limit in bytes."""
+        with self.lock:
+            return CacheInfo(
+                self.hits, self.misses, self.evictions, 0,
+                self.store.maxbytes, len(self.store))
+
+    def cache_clear(self):
+        """Removes all stored results and clears statistics."""
+        self.store.clear()
+        with self.lock:
+            self.hits = self.misses = self.evictions = 0
+
+
+def raw_header(value):
+    """Returns the header of ``value`` if stored raw, otherwise None."""
+    if isinstance(value, (bytes, bytearray, memoryview)):
+        view = memoryview(value)
+        if view.nbytes >= MMAP_SIZE and view.c_contiguous:
+            return {'type': 'bytes', 'format': 'B'}
+        return None
+    if isinstance(value, array):
+        if value.itemsize * len(value) >= MMAP_SIZE:
+            return {'type': 'array', 'format': value.typecode}
+        return None
+    if type(value).__module__ == 'numpy' and type(value).__name__ == 'ndarray':
+        if (value.nbytes >= MMAP_SIZE and value.flags.c_contiguous and
+                not value.dtype.hasobject and value.dtype.fields is None):
+            return {
+                'type': 'ndarray', 'format': value.dtype.str,
+                'shape': list(value.shape)}
+    return None
+
+
+def save_raw(stream, header, value):
+    """Writes ``value`` with ``header``, padded for alignment."""
+    header = json.dumps(header).encode('ascii')
+    padding = HEADER_SIZE - len(RAW_MAGIC) - len(header)
+    stream.write(RAW_MAGIC + header + b' ' * padding)
+    stream.write(memoryview(value).cast('B'))
+
+
+def load_raw(stream):
+    """Reads a value written by :func:`save_raw`, memory mapped."""
+    prefix = stream.read(HEADER_SIZE)
+    if not prefix.startswith(RAW_MAGIC) or len(prefix) < HEADER_SIZE:
+        raise ValueError('not a raw file')
+    header = json.loads(prefix[len(RAW_MAGIC):].decode('ascii'))
+    mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+    if header['type'] == 'ndarray':
+        import numpy
+        data = numpy.frombuffer(
+            mapped, dtype=header['format'], offset=HEADER_SIZE)
+        return data.reshape(header['shape'])
+    return memoryview(mapped)[HEADER_SIZE:].cast(header['format'])
+
+
+def touch(path):
+    """Updates modification time of ``path``, ignoring errors."""
+    try:
+        os.utime(path)
+    except OSError:
+        pass
+
+
+def remove(path):
+    """Removes ``path``, returns True if removed."""
+    try:
+        os.remove(path)
+    except OSError:
+        return False
+    return True
@@ -0,0 +1,274 @@
+# Copyright 2012-2014, Philip Xu <pyx@xrefactor.com>
+# License: BSD New, see LICENSE for details.
+"""fx.profiler - times each stage of Function."""
+
+__all__ = ['Metrics', 'Profiler', 'describe']
+
+import sys
+from bisect import bisect_left
+from functools import partial
+from threading import Lock
+from time import perf_counter
+from fx.utils import compose, constant, flip
+
+#: Maximum length of values described
+REPR_SIZE = 24
+
+#: Maximum number of descriptions of stages cached by Metrics objects
+DESCRIPTIONS_SIZE = 1024
+
+#: Upper bounds in seconds of buckets of latency histograms
+BUCKETS = (
+    1e-6, 2.5e-6, 5e-6, 1e-5, 2.5e-5, 5e-5, 1e-4, 2.5e-4, 5e-4,
+    1e-3, 2.5e-3, 5e-3, 1e-2, 2.5e-2, 5e-2, 0.1, 0.25, 0.5, 1.0,
+    float('inf'))
+
+
+class Stats(object):
+    """Statistics of a stage.
+
+    ``time`` is the time spent in the stage itself, excluding time spent in
+    iterators of previous stages it consumes, ``items`` is the number of
+    items its iterators produced and ``item_time`` the time producing them,
+    again excluding time spent in previous stages.
+    """
+    __slots__ = ('name', 'calls', 'time', 'items', 'item_time')
+
+    def __init__(self, name):
+        self.name = name
+        self.calls = 0
+        self.time = 0.0
+        self.items = 0
+        self.item_time = 0.0
+
+    @property
+    def total(self):
+        """Total time spent in the stage, invocation and iteration."""
+        return self.time + self.item_time
+
+    def __repr__(self):
+        return '<Stats %s: %d calls, %d items, %.6fs>' % (
+            self.name, self.calls, self.items, self.total)
+
+
+class Profiler(object):
+    """Runs ``stages`` as a Function does, timing each one.
+
+    Outputs of stages that are iterators are wrapped, so that time spent
+    producing items is attributed to the stage which returned the iterator,
+    not to the one consuming it.  The overhead of wrapping them is counted
+    in the time of the consuming stage.
+
+    >>> from fx import f
+    >>> profiler = (f(map) << abs | f(filter) << None | sum).profile()
+    >>> profiler([-2, 0, 1])
+    3
+    >>> [(stats.name, stats.calls, stats.items) for stats in profiler.stats]
+    [('map << abs', 1, 3), ('filter << None', 1, 2), ('sum', 1, 0)]
+    >>> print(profiler.table())  # doctest: +ELLIPSIS
+      #  stage            calls   time (ms)  items  per item (us)
+      0  map << abs           1 ...
+      1  filter << None       1 ...
+      2  sum                  1 ...
+    """
+    def __init__(self, stages):
+        self.stages = stages
+        self.stats = [Stats(describe(stage)) for stage in stages]
+        # time spent in nested timed sections, one entry per active section
+        self.nested = []
+
+    def __call__(self, *args, **kwargs):
+        stages = self.stages
+        output = self.time(0, stages[0], args, kwargs)
+        for index in range(1, len(stages)):
+            output = self.time(index, stages[index], (output,), {})
+        return output
+
+    def time(self, index, stage, args, kwargs):
+        """Calls ``stage``, attributing time to stage ``index``."""
+        stats = self.stats[index]
+        stats.calls += 1
+        self.nested.append(0.0)
+        start = perf_counter()
+        try:
+            output = stage(*args, **kwargs)
+        finally:
+            elapsed = perf_counter() - start
+            stats.time += elapsed - self.nested.pop()
+            if self.nested:
+                self.nested[-1] += elapsed
+        if is_iterator(output):
+            return self.iterate(stats, output)
+        return output
+
+    def iterate(self, stats, iterator):
+        """Yields items of ``iterator``, timing each one."""
+        nested = self.nested
+        while True:
+            nested.append(0.0)
+            start = perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                return
+            finally:
+                elapsed = perf_counter() - start
+                stats.item_time += elapsed - nested.pop()
+                if nested:
+                    nested[-1] += elapsed
+            stats.items += 1
+            yield item
+
+    def reset(self):
+        """Clears statistics collected."""
+        self.stats = [Stats(stats.name) for stats in self.stats]
+
+    def table(self):
+        """Returns statistics as a table, one stage per row."""
+        width = max([len('stage')] + [len(stats.name) for stats in self.stats])
+        lines = ['%3s  %-*s %7s %11s %6s %14s' % (
+            '#', width, 'stage', 'calls', 'time (ms)', 'items',
+            'per item (us)')]
+        for index, stats in enumerate(self.stats):
+            per_item = ('%14.3f' % (stats.item_time / stats.items * 1e6)
+                        if stats.items else '%14s' % '-')
+            lines.append('%3d  %-*s %7d %11.3f %6d %s' % (
+                index, width, stats.name, stats.calls, stats.total * 1e3,
+                stats.items, per_item))
+        return '\n'.join(line.rstrip() for line in lines)
+
+    def print_stats(self, stream=None):
+        """Prints statistics as a table to ``stream``, stdout by default."""
+        stream = sys.stdout if stream is None else stream
+        stream.write(self.table() + '\n')
+
+    def __str__(self):
+        return self.table()
+
+
+class Metrics(object):
+    """Collects call counts, error counts and latency histograms.
+
+    A Metrics object is a hook for :func:`fx.function.add_hook`, grouping
+    invocations by ``key(function)``, the stages of the Function described
+    by default, described once per tuple of stages.  Counts are of invocations reported, that is, of sampled
+    ones when sampling.
+
+    >>> from fx import f
+    >>> from fx.function import add_hook, remove_hook
+    >>> metrics = Metrics()
+    >>> add_hook(metrics)
+    >>> parse = f(int) | abs
+    >>> parse('-1'), parse('2')
+    (1, 2)
+    >>> remove_hook(metrics)
+    >>> stats = metrics.snapshot()['int | abs']
+    >>> stats['calls'], stats['errors'], sum(stats['histogram'].values())
+    (2, 0, 2)
+    """
+    def __init__(self, key=None, buckets=BUCKETS):
+        self.key = self.describe if key is None else key
+        self.buckets = tuple(buckets)
+        self.lock = Lock()
+        # description and tuple of stages, by id of the tuple
+        self.descriptions = {}
+        self.reset()
+
+    def describe(self, function):
+        """Returns the description of stages of ``function``, cached."""
+        stages = function.stages
+        try:
+            cached, description = self.descriptions[id(stages)]
+        except KeyError:
+            cached = None
+        if cached is not stages:
+            description = describe_stages(function)
+            if len(self.descriptions) >= DESCRIPTIONS_SIZE:
+                self.descriptions.clear()
+            self.descriptions[id(stages)] = stages, description
+        return description
+
+    def __call__(self, function, seconds, error):
+        key = self.key(function)
+        bucket = bisect_left(self.buckets, seconds)
+        with self.lock:
+            try:
+                stats = self.stats[key]
+            except KeyError:
+                stats = self.stats[key] = [0, 0, 0.0, [0] * len(self.buckets)]
+            stats[0] += 1
+            if error is not None:
+                stats[1] += 1
+            stats[2] += seconds
+            stats[3][min(bucket, len(self.buckets) - 1)] += 1
+
+    def reset(self):
+        """Clears metrics collected."""
+        with self.lock:
+            self.stats = {}
+
+    def snapshot(self):
+        """Returns metrics collected so far, as a dict of dicts by key.
+
+        Each one has ``'calls'``, ``'errors'``, ``'seconds'``, the total time,
+        and ``'histogram'``, mapping the upper bound of each bucket in seconds
+        to the number of calls that took longer than the bound of the
+        previous bucket, but no longer than its own.
+        """
+        with self.lock:
+            return dict(
+                (key, {
+                    'calls': calls,
+                    'errors': errors,
+                    'seconds': seconds,
+                    'histogram': dict(zip(self.buckets, histogram)),
+                })
+                for key, (calls, errors, seconds, histogram)
+                in self.stats.items())
+
+
+def is_iterator(obj):
+    """Returns True if ``obj`` looks like an iterator."""
+    return hasattr(type(obj), '__next__')
+
+
+def describe(function):
+    """Returns a short description of ``function`` as a stage.
+
+    >>> describe(partial(map, abs))
+    'map << abs'
+    >>> describe(compose(sum, flip(map)))
+    'sum ** ~map'
+    >>> describe(constant('spam'))
+    "'spam'"
+    """
+    if type(function) is partial:
+        args = [describe_value(arg) for arg in function.args]
+        args += ['%s=%s' % (name, describe_value(value))
+                 for name, value in sorted(function.keywords.items())]
+        return '%s << %s' % (describe(function.func), ', '.join(args))
+    if type(function) is flip:
+        return '~' + describe(function.func)
+    if type(function) is compose:
+        return '%s ** %s' % (describe(function.f), describe(function.g))
+    if type(function) is constant:
+        return describe_value(function.value)
+    name = getattr(function, '__name__', None)
+    if isinstance(name, str):
+        return name
+    return type(function).__name__
+
+
+def describe_stages(function):
+    """Returns a short description of stages of Function ``function``."""
+    return ' | '.join(describe(stage) for stage in function.stages)
+
+
+def describe_value(value):
+    """Returns a short description of ``value``, an argument of a stage."""
+    if callable(value):
+        return describe(value)
+    text = repr(value)
+    if len(text) > REPR_SIZE:
+        text = text[:REPR_SIZE - 3] + '...'
+    return text
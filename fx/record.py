@@ -0,0 +1,192 @@
+# Copyright 2012-2014, Philip Xu <pyx@xrefactor.com>
+# License: BSD New, see LICENSE for details.
+"""fx.record - item getter of fixed-layout binary records."""
+
+__all__ = ['RecordGetter']
+
+import re
+from functools import partial
+from struct import Struct, calcsize
+
+#: numpy byte order of struct byte order characters
+NUMPY_BYTEORDER = {'@': '=', '=': '=', '<': '<', '>': '>', '!': '>'}
+
+#: numpy kind of struct format characters
+NUMPY_KIND = dict(
+    [(code, 'i') for code in 'bhilqn'] +
+    [(code, 'u') for code in 'BHILQN'] +
+    [(code, 'f') for code in 'efd'] +
+    [('?', 'b'), ('c', 'S'), ('s', 'S'), ('p', 'S')])
+
+FORMAT = re.compile(r'^\s*(\d*)\s*([a-zA-Z?])\s*$')
+
+
+class RecordGetter(object):
+    """Item getter of records laid out as in module :mod:`struct`.
+
+    ``fields`` is a sequence of ``(name, format)`` pairs, each format being a
+    single struct format character with an optional count, ``byteorder`` is
+    the struct byte order character.
+
+    >>> rec = RecordGetter([('id', 'I'), ('price', 'd'), ('code', '4s')])
+    >>> rec.size
+    16
+    >>> data = rec.struct.pack(1, 9.5, b'spam')
+    >>> data += rec.struct.pack(2, 0.5, b'eggs')
+
+    Subscribing with a field name reads that field, with an integer selects a
+    record, the first one is read by default.  Either way, fields are read
+    directly from the buffer, without slicing.
+
+    >>> rec['price'](data)
+    9.5
+    >>> rec[1]['code'](data)
+    b'eggs'
+    >>> rec[-1](data)
+    (2, 0.5, b'eggs')
+
+    Subscribing with a slice reads records in batch, returns an iterator.
+
+    >>> list(rec[:]['id'](data))
+    [1, 2]
+    >>> list(rec[::-1](data))
+    [(2, 0.5, b'eggs'), (1, 9.5, b'spam')]
+    """
+    __slots__ = (
+        'names', 'formats', 'byteorder', 'struct', 'fields', 'index', 'field')
+
+    def __init__(self, fields, byteorder='<'):
+        fields = list(fields)
+        self.names = tuple(name for name, format in fields)
+        self.formats = tuple(format for name, format in fields)
+        self.byteorder = byteorder
+        self.struct = Struct(byteorder + ''.join(self.formats))
+        # field name -> (offset, struct of the field)
+        self.fields = {}
+        prefix = ''
+        for name, format in fields:
+            prefix += format
+            struct = Struct(byteorder + format)
+            # calcsize takes alignment into account for native byte order
+            offset = calcsize(byteorder + prefix) - struct.size
+            self.fields[name] = offset, struct
+        self.index = None
+        self.field = None
+
+    def __reduce__(self):
+        return restore_record_getter, (
+            type(self), tuple(zip(self.names, self.formats)), self.byteorder,
+            self.index, self.field)
+
+    @property
+    def size(self):
+        """Size of a record in bytes."""
+        return self.struct.size
+
+    def __getitem__(self, key):
+        getter = object.__new__(type(self))
+        for attr in self.__slots__:
+            setattr(getter, attr, getattr(self, attr))
+        if isinstance(key, str):
+            if self.field is not None:
+                raise TypeError('field already selected')
+            if key not in self.fields:
+                raise KeyError(key)
+            getter.field = key
+        elif isinstance(key, (int, slice)):
+            if self.index is not None:
+                raise TypeError('record already selected')
+            getter.index = key
+        else:
+            raise TypeError('key must be a field name, an integer or a slice')
+        return getter
+
+    def count(self, buffer):
+        """Returns the number of whole records in ``buffer``."""
+        return memoryview(buffer).nbytes // self.size
+
+    def __call__(self, buffer):
+        index = 0 if self.index is None else self.index
+        if self.field is None:
+            offset, struct = 0, self.struct
+        else:
+            offset, struct = self.fields[self.field]
+
+        if isinstance(index, slice):
+            indices = range(self.count(buffer))[index]
+            if indices.step == 1 and self.field is None:
+                view = memoryview(buffer)
+                view = view[indices.start * self.size:indices.stop * self.size]
+                return struct.iter_unpack(view)
+            offsets = range(
+                indices.start * self.size + offset,
+                indices.stop * self.size + offset,
+                indices.step * self.size)
+            records = map(partial(struct.unpack_from, buffer), offsets)
+            return records if self.field is None else map(first, records)
+
+        count = self.count(buffer)
+        if index < 0:
+            index += count
+        if not 0 <= index < count:
+            raise IndexError('record index out of range')
+        record = struct.unpack_from(buffer, index * self.size + offset)
+        return record if self.field is None else first(record)
+
+    @property
+    def dtype(self):
+        """The equivalent numpy structured dtype, requires numpy."""
+        import numpy
+        byteorder = NUMPY_BYTEORDER.get(self.byteorder, '=')
+        names, formats, offsets = [], [], []
+        for name, format in zip(self.names, self.formats):
+            count, code = FORMAT.match(format).groups()
+            if code in 'xX':
+                continue
+            count = int(count or 1)
+            kind = NUMPY_KIND[code]
+            if kind == 'S':
+                format = 'S%d' % (count if code != 'c' else 1)
+                if code == 'c' and count > 1:
+                    format = (format, count)
+            else:
+                format = '%s%s%d' % (
+                    byteorder, kind, calcsize(self.byteorder + code))
+                if count > 1:
+                    format = (format, count)
+            names.append(name)
+            formats.append(format)
+            offsets.append(self.fields[name][0])
+        return numpy.dtype({
+            'names': names, 'formats': formats, 'offsets': offsets,
+            'itemsize': self.size})
+
+    def array(self, buffer):
+        """Reads records of ``buffer`` as a numpy array, requires numpy.
+
+        The array shares memory with ``buffer``, record and field selection
+        are applied as numpy indexing.
+        """
+        import numpy
+        records = numpy.frombuffer(
+            buffer, dtype=self.dtype, count=self.count(buffer))
+        if self.index is not None:
+            records = records[self.index]
+        if self.field is not None:
+            records = records[self.field]
+        return records
+
+
+def restore_record_getter(cls, fields, byteorder, index, field):
+    """Creates a record getter of type ``cls`` from pickled arguments."""
+    getter = cls(fields, byteorder)
+    if index is not None:
+        getter = getter[index]
+    if field is not None:
+        getter = getter[field]
+    return getter
+
+
+def first(values):
+    """Returns the only value in ``values`` if there is one."""
+    return values[0] if len(values) == 1 else values
@@ -1,11 +1,11 @@
 # Copyright 2012-2014, Philip Xu <pyx@xrefactor.com>
 # License: BSD New, see LICENSE for details.
-"""fx.utils - implements helper functions compose and flip."""
+"""fx.utils - implements helper functions compose, flip and more."""
 
-__all__ = ['compose', 'flip']
+__all__ = ['compose', 'constant', 'flip', 'identity']
 
 
-def compose(f, g):
+class compose(object):
     """Function composition.
 
     ``compose(f, g) -> f . g``
@@ -19,10 +19,23 @@ def compose(f, g):
     >>> add_2_mul_5(1)
     15
     """
-    return lambda *args, **kwargs: f(g(*args, **kwargs))
+    # NOTE:
+    # compose and flip are classes rather than closures, so that the wrapped
+    # functions can be inspected, e.g. by fx.compiler, and pickled.
+    __slots__ = ('f', 'g')
 
+    def __init__(self, f, g):
+        self.f = f
+        self.g = g
 
-def flip(f):
+    def __call__(self, *args, **kwargs):
+        return self.f(self.g(*args, **kwargs))
+
+    def __reduce__(self):
+        return compose, (self.f, self.g)
+
+
+class flip(object):
     """Creates a function that takes arguments in reverse order.
 
     ``flip(f) -> g``
@@ -39,4 +52,41 @@ def flip(f):
     >>> list(fzip(range(5), range(5, 10), range(10, 15)))
     [(10, 5, 0), (11, 6, 1), (12, 7, 2), (13, 8, 3), (14, 9, 4)]
     """
-    return lambda *args, **kwargs: f(*args[::-1], **kwargs)
+    __slots__ = ('func',)
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        return self.func(*args[::-1], **kwargs)
+
+    def __reduce__(self):
+        return flip, (self.func,)
+
+
+class constant(object):
+    """Creates a function that takes no arguments and returns ``value``.
+
+    >>> the_answer = constant(42)
+    >>> the_answer()
+    42
+    """
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __call__(self):
+        return self.value
+
+    def __reduce__(self):
+        return constant, (self.value,)
+
+
+def identity(value):
+    """Returns ``value`` as it is.
+
+    >>> identity(42)
+    42
+    """
+    return value
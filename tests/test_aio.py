@@ -0,0 +1,66 @@
+from fx.aio import async_map
+
+import asyncio
+import pytest
+
+
+async def square(n):
+    await asyncio.sleep(0.001 * (n % 3))
+    return n * n
+
+
+def test_async_map():
+    assert asyncio.run(async_map(square, range(20))) == \
+        [n * n for n in range(20)]
+    assert asyncio.run(async_map(square, range(20), limit=4)) == \
+        [n * n for n in range(20)]
+    assert sorted(asyncio.run(async_map(
+        square, range(20), limit=4, ordered=False))) == \
+        [n * n for n in range(20)]
+    assert asyncio.run(async_map(square, [])) == []
+    # plain functions work too
+    assert asyncio.run(async_map(abs, [-1, 2], limit=1)) == [1, 2]
+
+
+def test_async_map_limit():
+    running, peak, completed = [0], [0], [0]
+
+    async def track(n):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.001)
+        running[0] -= 1
+        completed[0] += 1
+        return n
+
+    def source():
+        for n in range(50):
+            # items are read as calls complete, not all at once
+            assert n < completed[0] + 5
+            yield n
+
+    assert asyncio.run(async_map(track, source(), limit=5)) == list(range(50))
+    assert peak[0] == 5
+    with pytest.raises(ValueError):
+        asyncio.run(async_map(track, [], limit=0))
+
+
+def test_async_map_exception():
+    started, cancelled = [], []
+
+    async def fail_on_3(n):
+        started.append(n)
+        try:
+            await asyncio.sleep(0.01 if n == 3 else 1)
+        except asyncio.CancelledError:
+            cancelled.append(n)
+            raise
+        if n == 3:
+            raise ValueError(n)
+        return n
+
+    with pytest.raises(ValueError):
+        asyncio.run(async_map(fail_on_3, range(10), limit=4))
+    # others are cancelled, not waited for
+    assert sorted(cancelled) == [0, 1, 2]
+    assert sorted(started) == [0, 1, 2, 3]
@@ -0,0 +1,392 @@
+from fx.cache import AsyncSingleFlight, Memoized, SingleFlight, make_key
+from fx.function import Function as f
+
+import asyncio
+from functools import lru_cache
+from threading import Event, Thread
+from time import sleep
+
+
+def counted(function):
+    """Returns ``function`` counting its calls in attribute ``calls``."""
+    def wrapper(*args, **kwargs):
+        wrapper.calls += 1
+        return function(*args, **kwargs)
+    wrapper.calls = 0
+    return wrapper
+
+
+def test_memoize():
+    square = counted(lambda n: n * n)
+    memoized = f(square).memoize()
+    assert [memoized(n) for n in [1, 2, 1, 2, 3]] == [1, 4, 1, 4, 9]
+    assert square.calls == 3
+    info = memoized.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (2, 3, 3)
+    assert info.maxsize == 128
+
+
+def test_memoize_pipeline():
+    length = counted(len)
+    memoized = (f(str) | length).memoize()
+    assert memoized(12345) == 5
+    assert memoized(12345) == 5
+    assert length.calls == 1
+    # operators keep working
+    assert (memoized | str)(123) == '3'
+    assert (str ** memoized)(123) == '3'
+    assert (memoized << 1234)() == 4
+    assert length.calls == 3
+
+
+def test_memoize_kwargs():
+    parse = counted(int)
+    memoized = f(parse).memoize()
+    parse_hex = memoized.apply(base=16)
+    assert parse_hex('ff') == 255
+    assert parse_hex('ff') == 255
+    assert memoized('ff', base=16) == 255
+    assert memoized('10') == 10
+    assert memoized('10', base=16) == 16
+    assert parse.calls == 3
+    assert parse_hex.cache_info().hits == 2
+    assert make_key('a', b=1, c=2) == make_key('a', c=2, b=1)
+
+
+def test_memoize_lru():
+    square = counted(lambda n: n * n)
+    memoized = f(square).memoize(maxsize=2)
+    memoized(1)
+    memoized(2)
+    memoized(1)
+    # evicts 2, the least recently used
+    memoized(3)
+    memoized(1)
+    assert square.calls == 3
+    memoized(2)
+    assert square.calls == 4
+    info = memoized.cache_info()
+    assert (info.evictions, info.currsize) == (2, 2)
+
+    unbounded = f(square).memoize(maxsize=None)
+    for n in range(1000):
+        unbounded(n)
+    assert unbounded.cache_info().currsize == 1000
+
+    disabled = f(square).memoize(maxsize=0)
+    disabled(1)
+    disabled(1)
+    assert disabled.cache_info().currsize == 0
+    assert disabled.cache_info().misses == 2
+
+
+def test_memoize_ttl():
+    square = counted(lambda n: n * n)
+    memoized = f(square).memoize(ttl=0.05)
+    memoized(2)
+    memoized(2)
+    assert square.calls == 1
+    sleep(0.06)
+    memoized(2)
+    assert square.calls == 2
+    assert memoized.cache_info().expirations == 1
+
+
+def test_memoize_ttl_purge():
+    memoized = f(abs).memoize(maxsize=None, ttl=0.05)
+    for n in range(1000):
+        memoized(n)
+    assert memoized.cache_info().currsize == 1000
+    sleep(0.06)
+    # expired results of keys not used again are removed on insertion
+    memoized(-1)
+    info = memoized.cache_info()
+    assert info.currsize == 1
+    assert info.expirations == 1000
+
+
+def test_memoize_key():
+    upper = counted(str.upper)
+    memoized = f(upper).memoize(key=str.lower)
+    assert memoized('spam') == 'SPAM'
+    assert memoized('SPAM') == 'SPAM'
+    assert upper.calls == 1
+
+    # unhashable arguments need a key
+    total = f(sum).memoize(key=tuple)
+    assert total([1, 2]) == 3
+    assert total([1, 2]) == 3
+    assert total.cache_info().hits == 1
+    try:
+        f(sum).memoize()([1, 2])
+    except TypeError:
+        pass
+    else:
+        assert False, 'TypeError expected'
+
+
+def test_memoize_exception():
+    parse = counted(int)
+    memoized = f(parse).memoize()
+    for _ in range(2):
+        try:
+            memoized('spam')
+        except ValueError:
+            pass
+    assert parse.calls == 2
+    assert memoized.cache_info().currsize == 0
+
+
+def test_memoize_clear():
+    memoized = f(abs).memoize()
+    memoized(-1)
+    memoized(-1)
+    memoized.cache_clear()
+    info = memoized.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (0, 0, 0)
+
+
+def test_memoize_threads():
+    square = counted(lambda n: n * n)
+    memoized = Memoized(square, maxsize=50)
+    results = []
+
+    def work():
+        results.append([memoized(n % 100) for n in range(1000)])
+
+    threads = [Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    expected = [(n % 100) ** 2 for n in range(1000)]
+    assert all(result == expected for result in results)
+    info = memoized.cache_info()
+    assert info.hits + info.misses == 8000
+    assert info.currsize <= 50
+
+
+def test_cache_info_lru_cache():
+    memoized = f(lru_cache()(abs))
+    memoized(-1)
+    memoized(-1)
+    assert memoized.cache_info().hits == 1
+    try:
+        f(abs).cache_info()
+    except TypeError:
+        pass
+    else:
+        assert False, 'TypeError expected'
+
+
+def run_threads(target, args_list):
+    """Runs ``target`` in a thread per arguments, returns results."""
+    results = [None] * len(args_list)
+
+    def run(index, args):
+        try:
+            results[index] = target(*args)
+        except Exception as error:
+            results[index] = error
+
+    threads = [Thread(target=run, args=(index, args))
+               for index, args in enumerate(args_list)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return results
+
+
+def test_singleflight():
+    release = Event()
+
+    @counted
+    def fetch(name):
+        release.wait(1)
+        return name.upper()
+
+    single = f(fetch).singleflight()
+    assert isinstance(single.stages[0], SingleFlight)
+    timer = Thread(target=lambda: sleep(0.05) or release.set())
+    timer.start()
+    results = run_threads(single, [('spam',)] * 5 + [('eggs',)] * 3)
+    timer.join()
+    assert results == ['SPAM'] * 5 + ['EGGS'] * 3
+    assert fetch.calls == 2
+    assert single.stages[0].flights == {}
+
+    # not a cache, calls after the first one returned run again
+    assert single('spam') == 'SPAM'
+    assert fetch.calls == 3
+
+
+def test_singleflight_exception():
+    release = Event()
+
+    @counted
+    def fail(name):
+        release.wait(1)
+        raise ValueError(name)
+
+    single = f(fail).singleflight() | str
+    timer = Thread(target=lambda: sleep(0.05) or release.set())
+    timer.start()
+    results = run_threads(single, [('spam',)] * 4)
+    timer.join()
+    assert all(isinstance(result, ValueError) for result in results)
+    assert fail.calls == 1
+
+
+def test_singleflight_pipeline():
+    length = counted(len)
+    single = (f(str) | length).singleflight(key=str)
+    assert single(123) == 3
+    assert single('123') == 3
+    assert length.calls == 2
+
+
+def test_singleflight_async():
+    calls = []
+
+    async def fetch(name, delay=0.02):
+        calls.append(name)
+        await asyncio.sleep(delay)
+        return name.upper()
+
+    single = f(fetch).singleflight()
+    assert isinstance(single.stages[0], AsyncSingleFlight)
+
+    async def main():
+        results = await asyncio.gather(
+            single('spam'), single('spam'), single('eggs'),
+            single('spam', delay=0.02))
+        again = await single('spam')
+        return results, again
+
+    results, again = asyncio.run(main())
+    assert results == ['SPAM', 'SPAM', 'EGGS', 'SPAM']
+    assert again == 'SPAM'
+    assert calls == ['spam', 'eggs', 'spam', 'spam']
+    assert single.stages[0].tasks == {}
+
+
+def test_singleflight_async_cancel():
+    calls = []
+
+    async def fetch(name):
+        calls.append(name)
+        await asyncio.sleep(0.05)
+        return name
+
+    single = AsyncSingleFlight(fetch)
+
+    async def main():
+        first = asyncio.ensure_future(single('spam'))
+        second = asyncio.ensure_future(single('spam'))
+        await asyncio.sleep(0.01)
+        first.cancel()
+        return await second, first.cancelled()
+
+    assert asyncio.run(main()) == ('spam', True)
+    assert calls == ['spam']
+
+
+def test_singleflight_async_exception():
+    async def fail(name):
+        await asyncio.sleep(0.01)
+        raise ValueError(name)
+
+    single = f(fail).singleflight()
+
+    async def main():
+        return await asyncio.gather(
+            single('spam'), single('spam'), return_exceptions=True)
+
+    results = asyncio.run(main())
+    assert [type(result) for result in results] == [ValueError, ValueError]
+
+
+def test_lazy():
+    expensive = counted(lambda: [1, 2, 3])
+    lazy = f(expensive).lazy()
+    assert lazy == [1, 2, 3]
+    assert not lazy != [1, 2, 3]
+    assert 2 in lazy
+    assert list(lazy) == [1, 2, 3]
+    assert lazy.value == [1, 2, 3]
+    assert +lazy == lazy() == [1, 2, 3]
+    assert expensive.calls == 1
+    info = lazy.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (6, 1, 1)
+
+    lazy.cache_clear()
+    info = lazy.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (0, 0, 0)
+    assert lazy == [1, 2, 3]
+    assert expensive.calls == 2
+
+
+def test_lazy_statistics_threads():
+    expensive = counted(lambda: [1, 2, 3])
+    lazy = f(expensive).lazy()
+    run_threads(lambda: [lazy() for _ in range(1000)], [()] * 4)
+    info = lazy.cache_info()
+    assert (info.hits, info.misses) == (3999, 1)
+    assert expensive.calls == 1
+
+
+def test_lazy_applied():
+    total = counted(sum)
+    lazy = (f(total) << [1, 2, 3]).lazy()
+    assert lazy == 6
+    assert 6 in lazy
+    assert total.calls == 1
+    # following stages run each time, on the value kept
+    as_text = lazy | str
+    assert as_text.value == as_text.value == '6'
+    assert total.calls == 1
+    # calls with arguments are not cached
+    identity = f(counted(lambda *args: args)).lazy()
+    assert identity(1) == (1,)
+    assert identity(1) == (1,)
+    assert identity.stages[0].function.calls == 2
+
+
+def test_lazy_iterator():
+    square = counted(lambda n: n * n)
+    lazy = (f(map) << square << range(4)).lazy()
+    assert list(lazy) == [0, 1, 4, 9]
+    assert list(lazy) == [0, 1, 4, 9]
+    assert 4 in lazy
+    assert 100 not in lazy
+    assert square.calls == 4
+
+    # items are produced on demand, once
+    lazy = (f(map) << square << range(4)).lazy()
+    first = iter(lazy)
+    assert next(first) == 0
+    assert list(lazy) == [0, 1, 4, 9]
+    assert list(first) == [1, 4, 9]
+    assert square.calls == 8
+
+
+def test_lazy_threads():
+    release = Event()
+
+    @counted
+    def slow():
+        release.wait(1)
+        return 42
+
+    lazy = f(slow).lazy()
+    timer = Thread(target=lambda: sleep(0.05) or release.set())
+    timer.start()
+    results = run_threads(lambda: lazy.value, [()] * 8)
+    timer.join()
+    assert results == [42] * 8
+    assert slow.calls == 1
+
+    squares = f(lambda: iter(range(1000))).lazy()
+    results = run_threads(lambda: sum(squares), [()] * 8)
+    assert results == [sum(range(1000))] * 8
@@ -0,0 +1,76 @@
+from fx.compiler import compile_stages, templates
+from fx.function import Function as f
+from fx.utils import compose, flip
+
+from functools import partial
+
+
+def collect(*args, **kwargs):
+    return args, sorted(kwargs.items())
+
+
+def test_compile_stages():
+    # opaque callables are called as they are
+    compiled = compile_stages([range, sum, str])
+    assert compiled(5) == '10'
+
+    # partial applications are inlined
+    compiled = compile_stages([partial(collect, 1, a=1), partial(collect, 2)])
+    assert compiled(3, b=2) == (
+        (2, ((1, 3), [('a', 1), ('b', 2)])), [])
+    # keyword arguments of invocation take precedence
+    assert compiled(a=2) == ((2, ((1,), [('a', 2)])), [])
+
+    # so are flips and compositions
+    compiled = compile_stages([
+        partial(flip(collect), 1, 2, k=0),
+        compose(partial(flip(collect), 3), partial(collect, 4))])
+    expected = compose(partial(flip(collect), 3), partial(collect, 4))(
+        partial(flip(collect), 1, 2, k=0)(5, 6, k=7))
+    assert compiled(5, 6, k=7) == expected
+
+
+def test_compile_equivalent():
+    minus = f(lambda a, b: a - b)
+    pipelines = [
+        f(range) << 1 | f(filter) << (lambda n: n % 3 == 0) | sum,
+        ~minus << 10 | (minus << 100) | str,
+        f(max) << 1 << 3 << 5 | ~minus << 1 | ~(minus << 2),
+        ~~(~minus << 2) ** (f(divmod) << 100 | sum),
+        f(int).apply(base=16) | ~f(divmod) << 7 | list,
+        f(42),
+    ]
+    arguments = [(20,), (3,), (1,), (7,), ('ff',), ()]
+    for pipeline, args in zip(pipelines, arguments):
+        compiled = pipeline.compile()
+        assert compiled(*args) == pipeline(*args)
+
+    # keyword arguments named after parameters of the compiled function
+    compiled = (f(collect) | f(str)).compile()
+    assert compiled(value=1) == str(collect(value=1))
+    assert compiled(1, 2) == str(collect(1, 2))
+    assert compiled(1, value=2) == str(collect(1, value=2))
+    assert compiled(1) == str(collect(1))
+    assert compiled() == str(collect())
+
+
+def test_template_cache():
+    one = (f(range) << 1 | sum).compile()
+    two = (f(range) << 2 | sum).compile()
+
+    # same structure, same code, different constants
+    assert one.__code__ is two.__code__
+    assert one.source in templates
+    assert one(10) == 45
+    assert two(10) == 44
+
+
+def test_deep_pipeline():
+    import sys
+
+    depth = sys.getrecursionlimit() * 2
+    inc = f(1 .__add__)
+    pipeline = inc
+    for _ in range(depth - 1):
+        pipeline |= inc
+    assert pipeline.compile()(0) == depth
@@ -1,3 +1,5 @@
+import sys
+
 from fx.function import Function as f
 
 from functools import partial
@@ -382,3 +384,280 @@ def test_iter():
 
     res = list(answer)
     assert res == [42]
+
+
+def test_flat_stages():
+    # piping and composing append and prepend stages, nothing is nested
+    inc = f(1 .__add__)
+    assert len((inc | inc | inc).stages) == 3
+    assert len((inc ** inc ** inc).stages) == 3
+    assert len(((inc | inc) ** (inc | inc)).stages) == 4
+
+    # order of stages follows the order of evaluation
+    double = f(2 .__mul__)
+    assert (inc | double).stages == (inc.stages[0], double.stages[0])
+    assert (inc ** double).stages == (double.stages[0], inc.stages[0])
+
+    # applying arguments and flipping only change the first stage
+    pipeline = f(range) | sum | str
+    assert (pipeline << 5).stages[1:] == pipeline.stages[1:]
+    assert (~pipeline).stages[1:] == pipeline.stages[1:]
+
+
+def test_deep_pipeline():
+    # depth of pipelines is not bounded by the recursion limit
+    depth = sys.getrecursionlimit() * 2
+    inc = f(1 .__add__)
+    pipeline = inc
+    for _ in range(depth - 1):
+        pipeline |= inc
+    assert pipeline(0) == depth
+
+    pipeline = inc
+    for _ in range(depth - 1):
+        pipeline = inc ** pipeline
+    assert pipeline(0) == depth
+
+
+def test_linked_stages():
+    # operands are linked, stages flattened once when first needed
+    inc = f(1 .__add__)
+    double = f(2 .__mul__)
+    head = inc | double
+    pipeline = (head | inc) ** (double ** inc)
+    assert pipeline(1) == inc(double(inc(double(inc(1)))))
+    assert head.stages == (inc.stages[0], double.stages[0])
+    assert pipeline.stages is pipeline.stages
+    assert (head | inc).stages[:2] == head.stages
+
+    # building takes time linear in the number of stages
+    pipeline = inc
+    for _ in range(100000):
+        pipeline = pipeline | inc
+    assert len(pipeline.stages) == 100001
+
+
+def test_merged_partial():
+    # repeated application accumulates arguments on a single partial object
+    # wrapping the original function
+    g = f(max) << 1 << 3 << 5 << 7 << 9
+    head, = g.stages
+    assert type(head) is partial
+    assert head.func is max
+    assert head.args == (1, 3, 5, 7, 9)
+    assert g.value == 9
+
+    # keyword arguments are merged, later ones take precedence
+    g = f(int).apply(base=2).apply('11')
+    head, = g.stages
+    assert head.func is int
+    assert head.args == ('11',)
+    assert head.keywords == {'base': 2}
+    assert g.value == 3
+    assert g.apply(base=16).value == 17
+
+    # original functions and partials are left untouched
+    h = f(max) << 1
+    assert (h << 2).value == 2
+    assert h(0) == 1
+
+
+def test_metadata():
+    # metadata of the wrapped function
+    length = f(len)
+    assert length.__name__ == 'len'
+    assert length.__doc__ == len.__doc__
+    assert length.__module__ == len.__module__
+
+    def answer():
+        """The answer."""
+        return 42
+
+    the_answer = f(answer)
+    assert the_answer.__name__ == 'answer'
+    assert the_answer.__doc__ == 'The answer.'
+    assert the_answer.__module__ == __name__
+    assert (the_answer | str).__name__ == 'answer'
+
+    # class attributes are not affected
+    assert f.__name__ == 'Function'
+    assert f.__module__ == 'fx.function'
+    assert f.__doc__.startswith('A function wrapper class.')
+
+
+def test_metadata_assigned():
+    # assigned metadata overrides the wrapped function's
+    length = f(len)
+    length.__name__ = 'size'
+    length.__doc__ = 'Size.'
+    assert (length.__name__, length.__doc__) == ('size', 'Size.')
+    assert f(len).__name__ == 'len'
+    del length.__name__
+    assert length.__name__ == 'len'
+    try:
+        del length.__name__
+    except AttributeError:
+        pass
+    else:
+        assert False, 'AttributeError expected'
+
+    import functools
+    wrapper = functools.update_wrapper(f(len), abs)
+    assert wrapper.__name__ == 'abs'
+    assert wrapper.__wrapped__ is abs
+    assert wrapper([1, 2]) == 2
+
+
+def test_slots():
+    # stages are slots, metadata is only stored once assigned
+    assert vars(f(len)) == {}
+    import weakref
+    length = f(len)
+    assert weakref.ref(length)() is length
+
+
+def test_hooks():
+    from fx.function import Function, add_hook, remove_hook
+    invoke = Function.invoke
+    calls = []
+
+    def hook(function, seconds, error):
+        calls.append((function, error))
+
+    add_hook(hook)
+    try:
+        inc = f(lambda n: n + 1)
+        assert inc(1) == 2
+        assert +(inc << 2) == 3
+        assert (inc << 3).value == 4
+        assert inc.call(4) == 5
+        try:
+            inc('spam')
+        except TypeError:
+            pass
+        assert len(calls) == 5
+        assert calls[0] == (inc, None)
+        assert isinstance(calls[-1][1], TypeError)
+    finally:
+        remove_hook(hook)
+    # invocation is restored as it was
+    assert Function.invoke is invoke
+    assert Function.__call__ is invoke
+    assert inc(1) == 2
+    assert len(calls) == 5
+
+    try:
+        remove_hook(hook)
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError expected'
+
+
+def test_hooks_sampling():
+    from fx.function import add_hook, remove_hook
+    every, sampled = [], []
+
+    def hook(function, seconds, error):
+        every.append(seconds)
+
+    def sampling_hook(function, seconds, error):
+        sampled.append(seconds)
+
+    add_hook(hook)
+    add_hook(sampling_hook, sample=10)
+    try:
+        for n in range(100):
+            f(abs)(n)
+    finally:
+        remove_hook(hook)
+        remove_hook(sampling_hook)
+    assert len(every) == 100
+    assert len(sampled) == 10
+    assert all(seconds >= 0 for seconds in every)
+
+    try:
+        add_hook(hook, sample=0)
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError expected'
+
+
+def test_async_function():
+    import asyncio
+    import pickle
+    from fx.function import AsyncFunction as af
+
+    async def fetch(n):
+        await asyncio.sleep(0)
+        return [n] * n
+
+    pipeline = af(abs) | fetch | len
+    assert type(pipeline) is af
+    assert asyncio.run(pipeline(-3)) == 3
+    # either operand promotes a Function to AsyncFunction
+    for mixed in (f(abs) | af(fetch) | len,
+                  len ** f(fetch) ** af(abs),
+                  len ** af(fetch) ** f(abs),
+                  (f(abs) | f(neg)) | af(fetch) | sum):
+        assert type(mixed) is af
+    assert asyncio.run((f(abs) | af(fetch) | sum)(-2)) == 4
+    assert asyncio.run((str ** f(len) ** af(fetch) ** abs)(-4)) == '4'
+    assert asyncio.run((af(fetch) << 2).value) == [2, 2]
+    assert asyncio.run(+(af(fetch) << 2 | sum)) == 4
+    assert asyncio.run((~af(lambda a, b: a - b) | fetch)(5, 7)) == [2, 2]
+    restored = pickle.loads(pickle.dumps(af(abs) | str))
+    assert type(restored) is af
+    assert asyncio.run(restored(-1)) == '1'
+
+    try:
+        af(abs).memoize()
+    except TypeError:
+        pass
+    else:
+        assert False, 'TypeError expected'
+    try:
+        list(af(range) << 3)
+    except TypeError:
+        pass
+    else:
+        assert False, 'TypeError expected'
+
+
+def test_async_function_amap():
+    import asyncio
+    from fx.function import AsyncFunction as af
+    running, peak = [0], [0]
+
+    async def fetch(n):
+        running[0] += 1
+        peak[0] = max(peak[0], running[0])
+        await asyncio.sleep(0.001)
+        running[0] -= 1
+        return n * n
+
+    total = f(range) | af(fetch).amap(limit=3) | sum
+    assert asyncio.run(total(20)) == sum(n * n for n in range(20))
+    assert peak[0] == 3
+    squares = (af(abs) | fetch).amap(ordered=False) | sorted
+    assert asyncio.run(squares([-2, 1, 0])) == [0, 1, 4]
+
+
+def test_async_function_singleflight():
+    import asyncio
+    from fx.function import AsyncFunction as af
+    calls = []
+
+    async def fetch(n):
+        calls.append(n)
+        await asyncio.sleep(0.01)
+        return n
+
+    single = (af(fetch) | str).singleflight()
+
+    async def main():
+        return await asyncio.gather(single(1), single(1), single(2))
+
+    assert asyncio.run(main()) == ['1', '1', '2']
+    assert calls == [1, 2]
@@ -98,3 +98,249 @@ def test_other_key_type():
     get_name = _['name']
 
     assert get_name(someone) == 'Joe'
+
+
+def test_mixed():
+    record = {'payload': {'items': [{'id': 42}]}}
+
+    get_id = _['payload']['items'][0]['id']
+
+    assert get_id(record) == 42
+    # compiled on second call, reused afterwards
+    assert get_id.accessor is False
+    assert get_id(record) == 42
+    accessor = get_id.accessor
+    assert get_id(record) == 42
+    assert get_id.accessor is accessor
+
+    # falls back to iteration when hitting a non-subscriptable object
+    record = {'payload': {'items': iter([{'id': 42}])}}
+
+    assert get_id(record) == 42
+
+
+def test_errors():
+    import pytest
+
+    with pytest.raises(KeyError):
+        _['name']({})
+
+    with pytest.raises(IndexError):
+        _[3]([1, 2, 3])
+
+    with pytest.raises(IndexError):
+        _[3](iter([1, 2, 3]))
+
+    with pytest.raises(TypeError):
+        _['name']([1, 2, 3])
+
+
+def test_identity():
+    seq = [1, 2, 3]
+
+    assert _(seq) is seq
+
+
+def test_compiled_shared():
+    from fx.itemgetter import accessors, compile_steps, get, get_view
+    compile_steps([(get, 'a'), (get_view, slice(1, None))])
+    count = len(accessors)
+    # keys do not matter, only their number and views
+    accessor = compile_steps([(get, 'b'), (get_view, slice(None, 2))])
+    assert len(accessors) == count
+    assert bytes(accessor({'b': b'spam'})) == b'sp'
+    getters = [_[0][n] for n in range(5)]
+    for n, getter in enumerate(getters):
+        getter([list(range(5))])
+        assert getter([list(range(5))]) == n
+    assert len(accessors) <= count + 1
+
+
+def test_interned():
+    # equal paths are the same getter, sharing the compiled accessor
+    assert _['user']['id'] is _['user']['id']
+    assert x['user']['id'] is _['user']['id']
+    assert _[1:][0] is _[1:][0]
+    assert _['user']['id'] is not _['user']['name']
+    assert _[1] is not _[True]
+
+    # common prefixes are shared
+    user = _['user']
+    assert user['id'].parent is user['name'].parent is user
+
+    # so are views, and paths following them
+    from fx.itemgetter import interned
+    assert _['a'].view is _['a'].view
+    assert _['a'].view['b'] is _['a'].view['b']
+    size = len(interned)
+    for _i in range(3):
+        _['a'].view['b']
+    assert len(interned) == size
+
+    # unhashable keys are supported, but not interned
+    some_dict = {(1, 2): 'tuple'}
+    assert _[(1, 2)](some_dict) == 'tuple'
+    assert _[1:[2]].keys == _[1:[2]].keys
+
+
+def test_keys():
+    assert _.keys == ()
+    assert _['a'][0][1:].keys == ('a', 0, slice(1, None))
+
+
+def test_deep_path():
+    depth = 10000
+    getter = _
+    nested = 42
+    for _n in range(depth):
+        getter = getter[0]
+        nested = [nested]
+
+    assert getter.depth == depth
+    assert getter(nested) == 42
+    assert getter.parent(nested) == [42]
+
+
+def test_iterable_negative_index():
+    seq = list(range(10))
+
+    for index in range(-10, 10):
+        assert _[index](iter(seq)) == seq[index]
+
+    import pytest
+
+    with pytest.raises(IndexError):
+        _[-11](iter(seq))
+
+    with pytest.raises(IndexError):
+        _[10](iter(seq))
+
+    with pytest.raises(ValueError):
+        _['name'](iter(seq))
+
+
+def test_iterable_slice():
+    indices = [None, -12, -10, -7, -3, -1, 0, 1, 3, 7, 10, 12]
+
+    for length in (0, 1, 5, 10):
+        seq = list(range(length))
+        for start in indices:
+            for stop in indices:
+                for step in (None, 1, 2, 3, -1, -2, -3):
+                    key = slice(start, stop, step)
+                    assert list(_[key](iter(seq))) == seq[key], key
+
+
+def test_iterable_slice_lazy():
+    from itertools import count
+
+    # positive start and negative stop, consumed lazily
+    init = _[2:-3]
+    iterator = init(count())
+    assert [next(iterator) for _n in range(5)] == [2, 3, 4, 5, 6]
+
+
+def test_project():
+    from fx.itemgetter import project
+
+    records = [
+        {'id': 1, 'ts': 10, 'value': [0.5], 'tag': 'a'},
+        {'id': 2, 'ts': 20, 'value': [1.5], 'tag': 'b'},
+        {'id': 3, 'ts': 30, 'value': [2.5], 'tag': 'c'},
+    ]
+
+    # flat keys
+    rows = project(['id', 'ts'], records)
+    assert list(rows) == [(1, 10), (2, 20), (3, 30)]
+    assert list(project(['tag'], records)) == [('a',), ('b',), ('c',)]
+
+    # item getters, mixed with flat keys
+    rows = project(['id', _['value'][0]], iter(records))
+    assert list(rows) == [(1, 0.5), (2, 1.5), (3, 2.5)]
+
+    # lazy, works with infinite streams
+    from itertools import count
+    rows = project([_[0], _[1:][0]], ((n, -n) for n in count()))
+    assert next(rows) == (0, 0)
+    assert next(rows) == (1, -1)
+
+    # columns
+    ids, tags = project(['id', 'tag'], records, columns=list)
+    assert ids == [1, 2, 3]
+    assert tags == ['a', 'b', 'c']
+    assert project(['id', 'tag'], [], columns=list) == [[], []]
+
+    # no fields
+    assert list(project([], records)) == [(), (), ()]
+    assert list(project((), iter(records))) == [(), (), ()]
+    assert project([], records, columns=list) == []
+    ids, = project([_['id']], iter(records), columns=tuple)
+    assert ids == (1, 2, 3)
+
+
+def test_project_numpy():
+    import pytest
+    numpy = pytest.importorskip('numpy')
+    from fx.itemgetter import project
+
+    records = [{'id': n, 'value': n / 2.0} for n in range(5)]
+
+    ids, values = project(['id', 'value'], records, columns=numpy.array)
+
+    assert ids.tolist() == [0, 1, 2, 3, 4]
+    assert values.sum() == 5.0
+
+
+def test_view():
+    from array import array
+    from fx.itemgetter import SequenceView
+
+    cdr = _.view[1:]
+    cddr = cdr[1:]
+
+    # buffers are sliced as memoryview, no copying
+    data = bytearray(b'spam')
+    tail = cdr(data)
+    assert isinstance(tail, memoryview)
+    assert tail.tobytes() == b'pam'
+    assert cddr(data).tobytes() == b'am'
+    data[3] = ord('n')
+    assert tail.tobytes() == b'pan'
+    assert cddr(b'spam').tobytes() == b'am'
+    assert cddr(array('i', [1, 2, 3])).tolist() == [3]
+
+    # lists and tuples as SequenceView
+    numbers = list(range(10))
+    view = cddr(numbers)
+    assert isinstance(view, SequenceView)
+    assert view.sequence is numbers
+    assert view == list(range(2, 10))
+    assert len(view) == 8
+    assert view[0] == 2
+    assert view[-1] == 9
+    assert list(reversed(view)) == list(range(9, 1, -1))
+    assert _.view[::-1][1:][::2](numbers) == numbers[::-1][1:][::2]
+    assert _.view[1:][0](numbers) == 1
+    assert cdr((1, 2, 3)) == (2, 3)
+
+    # other objects are sliced as usual
+    assert cdr('spam') == 'pam'
+    assert list(cdr(iter([1, 2, 3]))) == [2, 3]
+
+    # views start from where view is referenced
+    records = {'data': b'spam'}
+    assert _['data'].view[1:](records).tobytes() == b'pam'
+    assert _['data'][1:](records) == b'pam'
+    assert _[1:].view[1:](b'spam') == b'pam'[1:]
+    assert _.view[1:] is _.view[1:]
+    assert _.view[1:] is not _[1:]
+
+
+def test_view_iterator_compiled():
+    # falling back after a view does not restart on a consumed iterator
+    getter = _.view[-3:][0]
+    for _i in range(3):
+        assert getter(iter(range(10))) == 7
+    getter = _[0].view[1:][0][1]
+    for _i in range(3):
+        assert getter([iter([[0, 'ab'], [1, 'cd']])]) == 'cd'
@@ -0,0 +1,159 @@
+from fx.function import Function as f
+from fx.optimizer import optimize_stages
+from fx.utils import compose, constant, flip, identity
+
+from functools import partial
+
+
+def minus(a, b):
+    return a - b
+
+
+def optimized(function, *args):
+    """Returns optimized function and rewrites fired, checks equivalence."""
+    report = []
+    result = function.optimize(report)
+    assert result(*args) == function(*args)
+    return result, report
+
+
+def test_flip():
+    # flipping twice cancels out on construction already
+    assert minus.__code__ is f(minus).flip.flip.stages[0].__code__
+
+    g, report = optimized(f(flip(flip(minus))), 5, 2)
+    assert g.stages == (minus,)
+    assert report == ['double flip']
+
+    g, report = optimized(f(partial(flip(flip(minus)), 5)), 2)
+    assert g.stages[0].func is minus
+    assert report == ['double flip']
+
+    g, report = optimized(f(compose(flip(flip(abs)), flip(minus))), 5, 2)
+    assert report == ['double flip']
+
+    # flips after the first stage get a single argument
+    g, report = optimized(f(abs) | ~f(str), -1)
+    assert g.stages == (abs, str)
+    assert report == ['single argument flip']
+
+    # nothing to do with flipped partial applications
+    g, report = optimized(f(abs) | ~f(minus) << 1, -1)
+    assert report == []
+
+
+def test_identity():
+    g, report = optimized(f(identity) | identity | abs | identity, -1)
+    assert g.stages == (identity, abs)
+    assert report == ['identity', 'identity']
+
+
+def test_materialization():
+    g, report = optimized(f(range) | list | sum, 10)
+    assert g.stages == (range, sum)
+    assert report == ['materialization']
+
+    g, report = optimized(f(map) << str | tuple | list | ' '.join, range(3))
+    assert len(g.stages) == 2
+    assert report == ['materialization', 'materialization']
+
+    g, report = optimized(f(range) | list | iter | list, 5)
+    assert g.stages == (range, iter, list)
+
+    # not for the first stage, nor consumers that may stop early or need a
+    # sequence
+    for function, args in [
+            (f(list) | sum, ([1, 2],)),
+            (f(range) | list | any, (5,)),
+            (f(range) | list | len, (5,)),
+            # dict takes mappings as a whole, not their keys
+            (f(identity) | list | dict, ([('a', 1)],))]:
+        g, report = optimized(function, *args)
+        assert report == []
+    g = (f(dict) | list | dict).optimize()
+    assert len(g.stages) == 3
+
+
+def test_constant_folding():
+    g, report = optimized(f(42) | str | len)
+    assert type(g.stages[0]) is constant
+    assert len(g.stages) == 1
+    assert report == ['constant folding', 'constant folding']
+
+    g, report = optimized(f('ff') | partial(int, base=16) | hex)
+    assert g.stages[0].value == '0xff'
+
+    # stops at functions unknown to be pure, or raising
+    g, report = optimized(f([1, 2]) | sum | str)
+    assert report == []
+    g = (f('a') | int).optimize(report)
+    assert report == []
+    assert len(g.stages) == 2
+
+    # nor for mutable values, which may change after optimizing
+    items = []
+    for function in (f(items) | len, f(items) | str, f((items,)) | repr):
+        g, report = optimized(function)
+        assert report == []
+    g = (f(items) | len).optimize()
+    items.append(1)
+    assert g() == 1
+    g, report = optimized(f((1, frozenset('ab'))) | len)
+    assert report == ['constant folding']
+
+
+def test_optimize_stages():
+    stages = (range, list, sum)
+    assert optimize_stages(stages) == (range, sum)
+
+
+def test_map_filter_fusion():
+    fmap, ffilter = f(map), f(filter)
+    odd = lambda n: n % 2
+    g, report = optimized(
+        f(iter) | fmap << abs | ffilter << odd | fmap << str | list,
+        [-3, -2, -1, 0, 1, 2, 3])
+    assert len(g.stages) == 3
+    assert report == ['map filter fusion']
+
+    # filter without predicate
+    g, report = optimized(
+        f(iter) | ffilter << None | fmap << str | list, [0, 1, '', 'a'])
+    assert report == ['map filter fusion']
+
+    # not applied to single operations, filter as the first stage, or
+    # applications with more arguments
+    for function in [
+            f(iter) | fmap << str | list,
+            ffilter << odd | fmap << abs | list,
+            f(iter) | fmap << abs | fmap << pow << [2] | list]:
+        g, report = optimized(function, [1, -2])
+        assert report == []
+
+    # map as the first stage is fused, over all arguments
+    g, report = optimized(
+        fmap << abs | ffilter << odd | ffilter << None | list, [1, -2])
+    assert len(g.stages) == 2
+    assert report == ['map filter fusion']
+    g, report = optimized(
+        fmap << pow | ffilter << odd | list, [1, 2, 3], [2, 1, 0])
+    assert len(g.stages) == 2
+    assert report == ['map filter fusion']
+    import pytest
+    with pytest.raises(TypeError):
+        # arguments are checked as map does, before iterating
+        (fmap << abs | ffilter << odd).optimize()(1)
+    import pickle
+    g = pickle.loads(pickle.dumps((fmap << pow | ffilter << None).optimize()))
+    assert list(g([0, 2], [1, 2])) == [4]
+
+    # lazy
+    from itertools import count
+    g = (f(iter) | fmap << abs | ffilter << odd).optimize()
+    assert list(zip(range(3), g(count()))) == [(0, 1), (1, 3), (2, 5)]
+
+    # exceptions propagate
+    import pytest
+    g = (f(iter) | fmap << (lambda n: 1 / n) | ffilter << odd | list)
+    with pytest.raises(ZeroDivisionError):
+        g.optimize()([1, 0])
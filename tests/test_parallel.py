@@ -0,0 +1,312 @@
+from fx import f, identity, parallel_map, parallel_reduce
+from fx.parallel import combine_tree
+
+import os
+import pytest
+import threading
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+from concurrent.futures import ProcessPoolExecutor
+from functools import reduce
+from itertools import count, islice
+from operator import add, mul
+from time import sleep
+
+
+def square(n):
+    return n * n
+
+
+def slow_square(n):
+    sleep(0.001 * (n % 3))
+    return n * n
+
+
+def fail_on_3(n):
+    if n == 3:
+        raise ValueError(n)
+    return n
+
+
+class Counting(object):
+    """Iterator over an infinite count, counting items pulled."""
+    def __init__(self):
+        self.pulled = 0
+        self.items = count()
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        self.pulled += 1
+        return next(self.items)
+
+
+@pytest.mark.parametrize('chunksize', [1, 3, 100])
+def test_parallel_map_threads(chunksize):
+    results = parallel_map(
+        slow_square, range(50), workers=4, chunksize=chunksize)
+    assert list(results) == [n * n for n in range(50)]
+
+
+def test_parallel_map_processes():
+    results = parallel_map(
+        square, range(100), workers=2, processes=True, chunksize=10)
+    assert list(results) == [n * n for n in range(100)]
+
+
+def test_parallel_map_unordered():
+    results = list(parallel_map(
+        slow_square, range(50), workers=4, ordered=False))
+    assert sorted(results) == [n * n for n in range(50)]
+
+
+def test_parallel_map_bounded():
+    source = Counting()
+    results = parallel_map(square, source, workers=2, chunksize=5, inflight=3)
+    assert list(islice(results, 10)) == [n * n for n in range(10)]
+    # no more than inflight chunks ahead of results consumed
+    assert source.pulled <= 5 * (2 + 3) + 1
+    results.close()
+
+    source = Counting()
+    results = parallel_map(square, source, ordered=False, inflight=2)
+    assert len(list(islice(results, 10))) == 10
+    assert source.pulled <= 10 + 2 + 1
+    results.close()
+
+
+def test_parallel_map_lazy_and_shutdown():
+    before = threading.active_count()
+    results = parallel_map(square, range(10), workers=4)
+    # nothing runs before the first item is asked for
+    assert threading.active_count() == before
+    assert next(results) == 0
+    results.close()
+    assert threading.active_count() == before
+
+    assert list(parallel_map(square, range(10), workers=4))[-1] == 81
+    assert threading.active_count() == before
+
+
+def test_parallel_map_exception():
+    results = parallel_map(fail_on_3, range(10), workers=2)
+    assert next(results) == 0
+    with pytest.raises(ValueError):
+        list(results)
+    with pytest.raises(ValueError):
+        list(parallel_map(fail_on_3, range(10), ordered=False))
+
+
+def test_parallel_map_executor():
+    with ThreadPoolExecutor(2) as executor:
+        assert list(parallel_map(square, range(5), executor=executor)) == \
+            [0, 1, 4, 9, 16]
+        # left running
+        assert executor.submit(square, 3).result() == 9
+
+
+def test_parallel_map_arguments():
+    with pytest.raises(ValueError):
+        parallel_map(square, [], chunksize=0)
+    with pytest.raises(ValueError):
+        parallel_map(square, [], inflight=0)
+    with pytest.raises(ValueError):
+        parallel_map(square, [], transport='mail')
+    assert list(parallel_map(square, [])) == []
+
+
+def test_pmap():
+    pipeline = f(range) | (f(square) | str).pmap(workers=3) | ','.join
+    assert pipeline(4) == '0,1,4,9'
+    # stages are picklable, so processes work
+    total = f(range) | f(square).pmap(processes=True, chunksize=50) | sum
+    assert total(1000) == sum(n * n for n in range(1000))
+    unordered = f(slow_square).pmap(ordered=False) | sorted
+    assert unordered(range(10)) == [n * n for n in range(10)]
+
+
+def segments():
+    return set(os.listdir('/dev/shm')) if os.path.isdir('/dev/shm') else set()
+
+
+def checksum(data):
+    # items come as memoryview, without a copy
+    assert isinstance(data, memoryview)
+    return sum(data[::4096])
+
+
+def negate(data):
+    return -data
+
+
+def head(data):
+    return data[:4]
+
+
+def fail_on_small(data):
+    if len(data) < 100:
+        raise ValueError(len(data))
+    return data
+
+
+BLOB = bytes(range(256)) * 1024
+
+
+def test_shared_memory():
+    before = segments()
+    items = [BLOB, bytearray(BLOB), b'spam', array('d', range(10000)), 42]
+    results = list(parallel_map(
+        identity, items, workers=2, processes=True, chunksize=2,
+        transport='shared_memory'))
+    # large buffers come back as bytes, others as they are
+    assert results[:3] == [BLOB, BLOB, b'spam']
+    assert isinstance(results[1], bytes)
+    assert results[3] == array('d', range(10000)).tobytes()
+    assert results[4] == 42
+
+    assert list(parallel_map(
+        checksum, [BLOB] * 3, processes=True, transport='shared_memory',
+        ordered=False)) == [sum(BLOB[::4096])] * 3
+    assert segments() == before
+
+
+def test_shared_memory_numpy():
+    numpy = pytest.importorskip('numpy')
+    before = segments()
+    matrix = numpy.arange(20000, dtype='<i4').reshape(100, 200)
+    records = numpy.zeros(10000, dtype=[('id', '<i4'), ('price', '<f8')])
+    results = list(parallel_map(
+        negate, [matrix, matrix.T, records['price'], matrix[:2]],
+        workers=2, processes=True, transport='shared_memory'))
+    assert [result.shape for result in results] == \
+        [(100, 200), (200, 100), (10000,), (2, 200)]
+    assert (results[0] == -matrix).all()
+    assert (results[1] == -matrix.T).all()
+    identical, = parallel_map(
+        identity, [records], processes=True, transport='shared_memory')
+    assert identical.dtype == records.dtype
+    assert segments() == before
+
+
+def test_shared_memory_cleanup():
+    before = segments()
+    with ProcessPoolExecutor(2) as executor:
+        with pytest.raises(ValueError):
+            list(parallel_map(
+                fail_on_small, [BLOB, BLOB, b'spam', BLOB] * 3,
+                executor=executor, chunksize=3, transport='shared_memory'))
+        results = parallel_map(
+            identity, [BLOB] * 20, executor=executor,
+            transport='shared_memory')
+        assert next(results) == BLOB
+        results.close()
+    assert segments() == before
+
+
+def test_shared_memory_close_unordered():
+    before = segments()
+    with ProcessPoolExecutor(2) as executor:
+        results = parallel_map(
+            identity, [BLOB] * 20, executor=executor, ordered=False,
+            inflight=8, transport='shared_memory')
+        assert next(results) == BLOB
+        # chunks done but not read yet are discarded too
+        sleep(0.2)
+        results.close()
+    assert segments() == before
+
+
+def test_shared_memory_small_views():
+    before = segments()
+    # views into items, too small to be shared, come back as bytes
+    results = list(parallel_map(
+        head, [BLOB, bytearray(BLOB), b'spam'], processes=True,
+        transport='shared_memory'))
+    assert results == [BLOB[:4], BLOB[:4], b'spam']
+    assert segments() == before
+    views = list(parallel_map(
+        memoryview, [b'spam'], processes=True, transport='shared_memory'))
+    assert views == [b'spam']
+
+
+def test_pmap_shared_memory():
+    lengths = f(len).pmap(processes=True, transport='shared_memory')
+    assert list(lengths([BLOB, b'spam'])) == [len(BLOB), 4]
+
+
+def nest(a, b):
+    return '(%s %s)' % (a, b)
+
+
+def matmul(a, b):
+    # associative, not commutative
+    return ((a[0] * b[0] + a[1] * b[2], a[0] * b[1] + a[1] * b[3],
+             a[2] * b[0] + a[3] * b[2], a[2] * b[1] + a[3] * b[3]))
+
+
+@pytest.mark.parametrize('chunksize', [1, 3, 7, 1000])
+def test_parallel_reduce(chunksize):
+    assert parallel_reduce(add, range(1000), chunksize=chunksize) == \
+        sum(range(1000))
+    words = [str(n) for n in range(100)]
+    assert parallel_reduce(add, words, chunksize=chunksize, workers=3) == \
+        ''.join(words)
+    fibonacci = [(1, 1, 1, 0)] * 30
+    assert parallel_reduce(matmul, fibonacci, chunksize=chunksize)[1] == \
+        832040
+
+
+def test_parallel_reduce_initial():
+    assert parallel_reduce(add, [], 0) == 0
+    assert parallel_reduce(add, 'am', 'sp') == 'spam'
+    assert parallel_reduce(mul, range(1, 6), initial=1, chunksize=2) == 120
+    with pytest.raises(TypeError):
+        parallel_reduce(add, [])
+    with pytest.raises(ValueError):
+        parallel_reduce(add, [], chunksize=0)
+
+
+def test_parallel_reduce_processes():
+    assert parallel_reduce(
+        add, range(10000), processes=True, workers=2, chunksize=500) == \
+        sum(range(10000))
+
+
+def test_parallel_reduce_stream():
+    source = Counting()
+    limited = iter(lambda: next(source), 100000)
+    assert parallel_reduce(add, limited, chunksize=100, inflight=2) == \
+        sum(range(100000))
+    with pytest.raises(ValueError):
+        parallel_reduce(add, (fail_on_3(n) for n in range(10)), chunksize=2)
+
+
+def test_combine_tree():
+    assert combine_tree(nest, 'a') == 'a'
+    assert combine_tree(nest, 'abcd') == '((a b) (c d))'
+    assert combine_tree(nest, 'abcdefg') == \
+        '(((a b) (c d)) ((e f) g))'
+    for size in range(1, 20):
+        assert combine_tree(add, map(str, range(size))) == \
+            reduce(add, map(str, range(size)))
+
+
+def test_preduce():
+    total = f(range) | f(add).preduce(chunksize=100)
+    assert total(1000) == sum(range(1000))
+    assert f(add).preduce(0, processes=True)(range(5000)) == \
+        sum(range(5000))
+    concat = (f(add) | str.upper).preduce('', chunksize=2)
+    assert concat(['sp', 'a', 'm']) == 'SPAM'
+
+
+def test_pmap_executor():
+    with ProcessPoolExecutor(2) as executor:
+        squares = f(square).pmap(executor=executor, chunksize=10) | sum
+        total = f(add).preduce(0, executor=executor, chunksize=100)
+        for n in (10, 100, 1000):
+            assert squares(range(n)) == sum(k * k for k in range(n))
+            assert total(range(n)) == sum(range(n))
+        # the pool is reused, left running
+        assert executor.submit(square, 3).result() == 9
@@ -0,0 +1,286 @@
+from fx.function import Function as f
+from fx.persist import (
+    DirectoryStore, Persisted, SQLiteStore, identity_of, make_key)
+
+import os
+import pytest
+from array import array
+from functools import partial
+
+
+def counted(function):
+    """Returns ``function`` counting its calls in attribute ``calls``."""
+    def wrapper(*args, **kwargs):
+        wrapper.calls += 1
+        return function(*args, **kwargs)
+    wrapper.calls = 0
+    wrapper.__qualname__ = function.__qualname__
+    return wrapper
+
+
+@pytest.fixture(params=['directory', 'cache.sqlite'])
+def path(request, tmp_path):
+    return str(tmp_path / request.param)
+
+
+def test_persist(path):
+    square = counted(lambda n: n * n)
+    assert f(square).persist(path)(4) == 16
+    # as if after restart, another object finds results
+    persisted = f(square).persist(path)
+    assert persisted(4) == 16
+    assert square.calls == 1
+    assert persisted(5) == 25
+    assert square.calls == 2
+    info = persisted.cache_info()
+    assert (info.hits, info.misses, info.currsize) == (1, 1, 2)
+
+    persisted.cache_clear()
+    assert persisted.cache_info().currsize == 0
+    assert persisted(4) == 16
+    assert square.calls == 3
+
+
+def test_persist_store_type(path):
+    persisted = f(abs).persist(path)
+    store = persisted.stages[0].store
+    if path.endswith('.sqlite'):
+        assert isinstance(store, SQLiteStore)
+    else:
+        assert isinstance(store, DirectoryStore)
+        assert os.path.isdir(path)
+
+
+def test_persist_kwargs(path):
+    parse = counted(int)
+    persisted = f(parse).persist(path)
+    assert (persisted << 'ff')(base=16) == 255
+    assert persisted('ff', base=16) == 255
+    assert persisted('10') == 10
+    assert parse.calls == 2
+    assert make_key('id', (1,), {'a': 1, 'b': 2}) == \
+        make_key('id', (1,), {'b': 2, 'a': 1})
+
+
+def test_make_key_canonical():
+    import subprocess
+    import sys
+    spam = 'spam' * 3
+    # equal values, the same object or not
+    assert make_key('id', (spam, spam), {}) == \
+        make_key('id', (spam, ''.join(['spam'] * 3)), {})
+    assert make_key('id', ({'a': 1, 'b': {2}},), {}) == \
+        make_key('id', ({'b': {2}, 'a': 1},), {})
+    assert make_key('id', ({'a': 1},), {}) != make_key('id', ({'a': 2},), {})
+    assert make_key('id', ({1},), {}) != make_key('id', (frozenset([1]),), {})
+    assert make_key('id', ([1, 2],), {}) != make_key('id', ((1, 2),), {})
+    # whatever the hashes of strings
+    script = (
+        'from fx.persist import make_key;'
+        'print(make_key("id", (frozenset("abcdefgh"), {"x": set("xyz")}),'
+        ' {}))')
+    keys = set()
+    for seed in '12':
+        keys.add(subprocess.check_output(
+            [sys.executable, '-c', script],
+            env=dict(os.environ, PYTHONHASHSEED=seed)))
+    assert len(keys) == 1
+
+
+def test_persist_pipeline(path):
+    length = counted(len)
+    pipeline = f(str) | length
+    assert pipeline.persist(path)(12345) == 5
+    assert pipeline.persist(path)(12345) == 5
+    assert length.calls == 1
+    # different stages, different results
+    assert (f(repr) | length).persist(path)('spam') == 6
+    assert length.calls == 2
+
+
+def test_persist_name(path):
+    assert f(lambda n: n + 1).persist(path, name='version 1')(1) == 2
+    assert f(lambda n: n + 2).persist(path, name='version 1')(1) == 2
+    assert f(lambda n: n + 2).persist(path, name='version 2')(1) == 3
+
+
+def test_identity_of():
+    def inc(n):
+        return n + 1
+    first = inc
+
+    def inc(n):
+        return n + 2
+    assert identity_of(first) != identity_of(inc)
+    assert identity_of(first)[:2] == identity_of(inc)[:2]
+
+    # where a function is defined does not matter
+    source = 'def inc(n):\n    return [m for m in (n, 2)]\n'
+    moved = {}
+    exec(compile(source, 'a.py', 'exec'), {}, moved)
+    exec(compile('\n' * 10 + source, 'b.py', 'exec'), {}, moved.copy())
+    other = {}
+    exec(compile('\n' * 10 + source, 'b.py', 'exec'), {}, other)
+    assert identity_of(moved['inc']) == identity_of(other['inc'])
+    assert identity_of(partial(map, abs)) == identity_of(partial(map, abs))
+    assert identity_of(f(abs) | str) == ('Function',) + tuple(
+        identity_of(stage) for stage in (f(abs) | str).stages)
+    assert identity_of((~f(map)).stages[0]) == \
+        ('flip', ('builtins', 'map'))
+    from fx import _
+    assert identity_of(_['a'][0]) == ('ItemGetter', False, ('a', 0))
+
+
+class Scale(object):
+    def __init__(self, factor):
+        self.factor = factor
+
+    def __call__(self, n):
+        return n * self.factor
+
+    def apply(self, n):
+        return n * self.factor
+
+
+def test_identity_of_bound():
+    from operator import itemgetter
+
+    def key_of(function):
+        # as pickled in keys, objects by state
+        return make_key(identity_of(function), (), {})
+    assert key_of(' '.join) != key_of(','.join)
+    assert key_of(2 .__mul__) != key_of(3 .__mul__)
+    assert key_of(Scale(2).apply) != key_of(Scale(5).apply)
+    assert key_of(Scale(2).apply) == key_of(Scale(2).apply)
+    assert key_of(itemgetter('a')) != key_of(itemgetter('b'))
+    assert key_of(f(abs).memoize()) != key_of(f(str).memoize())
+    assert key_of(f(abs).lazy()) != key_of(f(str).lazy())
+    assert key_of(f(abs).singleflight()) != \
+        key_of(f(str).singleflight())
+    from fx.compiler import fuse
+    assert key_of(fuse([(map, abs)])) != key_of(fuse([(map, str)]))
+    assert key_of(fuse([(map, abs)])) != \
+        key_of(fuse([(map, abs)], head=True))
+    from fx.record import RecordGetter
+    rec = RecordGetter([('id', 'I'), ('price', 'd')])
+    assert key_of(rec['id']) != key_of(rec['price'])
+    # opaque objects are not identified by their class
+    with pytest.raises(TypeError):
+        identity_of(Scale(2))
+
+
+def test_persist_bound(path):
+    assert f(2 .__mul__).persist(path)(10) == 20
+    assert f(3 .__mul__).persist(path)(10) == 30
+    assert f(Scale(2).apply).persist(path)(10) == 20
+    assert f(Scale(5).apply).persist(path)(10) == 50
+    assert f(' '.join).persist(path)('ab') == 'a b'
+    assert f(','.join).persist(path)('ab') == 'a,b'
+    assert f(abs).memoize().persist(path)(-1) == 1
+    assert f(str).memoize().persist(path)(-1) == '-1'
+    with pytest.raises(TypeError):
+        f(Scale(2)).persist(path)
+    assert f(Scale(2)).persist(path, name='scale 2')(10) == 20
+
+
+@pytest.mark.parametrize('maxbytes', [1000])
+def test_persist_eviction(path, maxbytes):
+    blob = counted(lambda n: b'x' * 400 + bytes([n]))
+    persisted = f(blob).persist(path, maxbytes=maxbytes)
+    for n in range(5):
+        persisted(n)
+    info = persisted.cache_info()
+    assert info.evictions >= 3
+    assert info.currsize <= 2
+    assert info.maxsize == maxbytes
+    # the most recent results are kept
+    persisted(4)
+    assert blob.calls == 5
+    persisted(0)
+    assert blob.calls == 6
+
+
+def test_persist_mmap(tmp_path):
+    path = str(tmp_path)
+    data = bytes(range(256)) * 1024
+    persisted = f(lambda: data).persist(path, mmap=True)
+    # the same type on first call as on the following ones
+    for loaded in (persisted(), persisted()):
+        assert isinstance(loaded, memoryview)
+        assert loaded.readonly
+        assert loaded == data
+    assert [name.endswith('.raw') for name in os.listdir(path)] == [True]
+
+    numbers = array('d', range(10000))
+    persisted = f(lambda: numbers).persist(path, mmap=True)
+    persisted()
+    loaded = persisted()
+    assert loaded.format == 'd'
+    assert loaded.tolist() == numbers.tolist()
+
+    # small ones are pickled
+    persisted = f(lambda: b'spam').persist(path, mmap=True)
+    persisted()
+    assert persisted() == b'spam'
+    assert isinstance(persisted(), bytes)
+
+    with pytest.raises(ValueError):
+        f(abs).persist(str(tmp_path / 'cache.db'), mmap=True)
+
+
+def test_persist_no_mmap(path):
+    data = bytes(range(256)) * 1024
+    persisted = f(lambda: data).persist(path)
+    assert [type(persisted()) for _ in range(2)] == [bytes, bytes]
+    numbers = array('d', range(10000))
+    persisted = f(lambda: numbers).persist(path)
+    assert [type(persisted()) for _ in range(2)] == [array, array]
+
+
+def test_persist_mmap_numpy(tmp_path):
+    numpy = pytest.importorskip('numpy')
+    matrix = numpy.arange(20000, dtype='<i4').reshape(100, 200)
+    persisted = f(lambda: matrix).persist(str(tmp_path), mmap=True)
+    persisted()
+    loaded = persisted()
+    assert isinstance(loaded, numpy.ndarray)
+    assert loaded.shape == (100, 200)
+    assert not loaded.flags.writeable
+    assert (loaded == matrix).all()
+
+
+def test_persist_corrupted(tmp_path):
+    path = str(tmp_path)
+    square = counted(lambda n: n * n)
+    persisted = f(square).persist(path)
+    persisted(3)
+    name, = os.listdir(path)
+    with open(os.path.join(path, name), 'wb') as stream:
+        stream.write(b'garbage')
+    assert persisted(3) == 9
+    assert square.calls == 2
+    assert persisted(3) == 9
+    assert square.calls == 2
+
+
+def test_persisted_store_object(tmp_path):
+    store = DirectoryStore(str(tmp_path))
+    persisted = Persisted(abs, store)
+    assert persisted(-1) == 1
+    assert len(store) == 1
+
+
+def test_directory_store_scans(tmp_path, monkeypatch):
+    store = DirectoryStore(str(tmp_path), maxbytes=10000)
+    scans = []
+    entries = store.entries
+    monkeypatch.setattr(
+        store, 'entries', lambda: scans.append(1) or entries())
+    for n in range(5):
+        store.save(str(n), b'x' * 100)
+    # scanned once, then sizes are summed up
+    assert len(scans) == 1
+    store.maxbytes = 300
+    assert store.save('5', b'x' * 100) > 0
+    assert len(scans) == 2
+    assert len(store) <= 3
@@ -0,0 +1,122 @@
+from fx import _, compose, f, flip, identity
+from fx.record import RecordGetter
+from fx.utils import constant
+
+import pickle
+import pytest
+from concurrent.futures import ProcessPoolExecutor
+from operator import add, sub
+
+PROTOCOLS = range(pickle.HIGHEST_PROTOCOL + 1)
+
+
+def inc(n):
+    return n + 1
+
+
+def odd(n):
+    return n % 2
+
+
+def round_trip(obj, protocol=pickle.DEFAULT_PROTOCOL):
+    return pickle.loads(pickle.dumps(obj, protocol))
+
+
+# pairs of a Function and the arguments to invoke it with
+FUNCTIONS = [
+    (f(inc), (1,)),
+    (f(42), ()),
+    (f(inc) | inc | str, (1,)),
+    (str ** f(inc) ** inc, (1,)),
+    (str ** f(inc), (1,)),
+    (inc | f(inc), (1,)),
+    (f(sub) << 10, (3,)),
+    (f(sub) & 10, (3,)),
+    (f(int).apply(base=16), ('ff',)),
+    (~f(sub), (10, 3)),
+    (~f(sub) << 10, (3,)),
+    (f(sub).flip.flip, (10, 3)),
+    (f(map) << inc | list, ([1, 2],)),
+    (f(map) << (f(add) << 1) ** inc | list, ([1, 2],)),
+    (f(range) << 1 | f(filter) << odd | sum, (10,)),
+    (f(range) | _[1:][-1], (5,)),
+    (f(identity) | _['a'][0], ({'a': [1]},)),
+    ((f(range) | list | sum).optimize(), (5,)),
+    ((f(map) << inc | f(filter) << odd | list).optimize(), ([1, 2, 3],)),
+    (f(inc).memoize(maxsize=10, ttl=60), (1,)),
+    ((f(sum) << [1, 2]).lazy(), ()),
+    (f(inc).singleflight(), (1,)),
+]
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+@pytest.mark.parametrize('function, args', FUNCTIONS)
+def test_pickle_function(function, args, protocol):
+    restored = round_trip(function, protocol)
+    assert type(restored) is type(function)
+    assert len(restored.stages) == len(function.stages)
+    assert restored(*args) == function(*args)
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_pickle_utils(protocol):
+    assert round_trip(compose(str, inc), protocol)(1) == '2'
+    assert round_trip(flip(sub), protocol)(10, 3) == -7
+    assert round_trip(constant([1]), protocol)() == [1]
+    assert round_trip(identity, protocol) is identity
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_pickle_itemgetter(protocol):
+    getter = _['a'][1:][0]
+    assert round_trip(getter, protocol) is getter
+    # compiled accessors are not pickled
+    assert getter({'a': 'spam'}) == 'p'
+    restored = round_trip(getter, protocol)
+    assert restored({'a': 'spam'}) == 'p'
+
+    view = _.view[1:][1:]
+    assert round_trip(view, protocol) is view
+    assert bytes(round_trip(view, protocol)(b'spam')) == b'am'
+    # views of getters following other keys are not interned
+    mixed = round_trip(_[1:].view[1:], protocol)
+    assert mixed.keys == (slice(1, None), slice(1, None))
+    assert [step[0].__name__ for step in mixed.steps] == ['get', 'get_view']
+    assert mixed([1, 2, 3]) == [3]
+    assert round_trip(_, protocol)([1]) == [1]
+
+    # unhashable keys are not interned
+    unhashable = _[[0, 1]]
+    assert round_trip(unhashable, protocol).keys == ([0, 1],)
+
+
+@pytest.mark.parametrize('protocol', PROTOCOLS)
+def test_pickle_record(protocol):
+    rec = RecordGetter([('id', 'I'), ('price', 'd')])
+    data = rec.struct.pack(1, 9.5) + rec.struct.pack(2, 0.5)
+    assert round_trip(rec, protocol)(data) == (1, 9.5)
+    assert round_trip(rec[1]['price'], protocol)(data) == 0.5
+    assert list(round_trip(rec[:]['id'], protocol)(data)) == [1, 2]
+
+
+def test_pickle_function_subclass():
+    class_ = Subclass
+    restored = round_trip(class_(inc) | inc)
+    assert type(restored) is Subclass
+    assert restored(1) == 3
+
+
+class Subclass(f):
+    __slots__ = ()
+
+
+def test_process_pool():
+    pipeline = f(range) << 1 | f(filter) << odd | f(map) << inc | sum
+    with ProcessPoolExecutor(2) as executor:
+        results = list(executor.map(pipeline, [10, 100, 1000]))
+    assert results == [pipeline(10), pipeline(100), pipeline(1000)]
+
+    getter = _['values'][-1]
+    records = [{'values': [n, n + 1]} for n in range(5)]
+    with ProcessPoolExecutor(2) as executor:
+        assert list(executor.map(getter, records)) == [1, 2, 3, 4, 5]
@@ -0,0 +1,147 @@
+from fx.function import Function as f
+from fx.itemgetter import _
+from fx.profiler import describe
+
+from functools import partial
+from time import sleep
+
+
+def slow(seconds):
+    def stage(value):
+        sleep(seconds)
+        return value
+    stage.__name__ = 'slow%g' % seconds
+    return stage
+
+
+def test_profile_returns_same_output():
+    function = f(range) << 1 | f(map) << str | ' '.join
+    profiler = function.profile()
+    assert profiler(5) == function(5)
+    assert profiler(3) == function(3)
+    assert [stats.calls for stats in profiler.stats] == [2, 2, 2]
+
+
+def test_profile_time_per_stage():
+    profiler = (f(slow(0.02)) | slow(0.001)).profile()
+    profiler(1)
+    first, second = profiler.stats
+    assert first.name == 'slow0.02'
+    assert first.time >= 0.02
+    assert second.time < first.time
+
+
+def test_profile_iterators():
+    def slow_inc(n):
+        sleep(0.002)
+        return n + 1
+
+    profiler = (f(map) << slow_inc | f(filter) << None | list).profile()
+    assert profiler([-1, 0, 1]) == [1, 2]
+    mapped, filtered, listed = profiler.stats
+    assert (mapped.items, filtered.items, listed.items) == (3, 2, 0)
+    # time spent in map is not attributed to filter nor list
+    assert mapped.item_time >= 0.006
+    assert filtered.item_time < mapped.item_time
+    assert listed.time < mapped.item_time
+
+
+def test_profile_exception():
+    profiler = (f(int) | abs).profile()
+    try:
+        profiler('spam')
+    except ValueError:
+        pass
+    else:
+        assert False, 'ValueError expected'
+    assert [stats.calls for stats in profiler.stats] == [1, 0]
+    assert profiler(-1) == 1
+    assert profiler.nested == []
+
+
+def test_profile_reset():
+    profiler = (f(abs) | str).profile()
+    profiler(-1)
+    profiler.reset()
+    assert [stats.calls for stats in profiler.stats] == [0, 0]
+    assert [stats.name for stats in profiler.stats] == ['abs', 'str']
+
+
+def test_profile_table():
+    profiler = (f(map) << abs | sum).profile()
+    profiler([-1, 2])
+    lines = str(profiler).splitlines()
+    assert len(lines) == 3
+    assert lines[0].split()[:3] == ['#', 'stage', 'calls']
+    assert lines[1].split()[:5] == ['0', 'map', '<<', 'abs', '1']
+    assert lines[1].split()[-2] == '2'
+    assert lines[2].split()[-1] == '-'
+
+
+def test_describe():
+    assert describe(abs) == 'abs'
+    assert describe((~f(map)).stages[0]) == '~map'
+    assert describe(partial(int, base=16)) == 'int << base=16'
+    assert describe(partial(sum, list(range(100)))) == \
+        'sum << [0, 1, 2, 3, 4, 5, 6,...'
+    assert describe(_[0]) == 'ItemGetter'
+
+
+def test_metrics():
+    from fx.function import add_hook, remove_hook
+    from fx.profiler import Metrics
+
+    metrics = Metrics(buckets=(0.01, float('inf')))
+    add_hook(metrics)
+    try:
+        parse = f(int) | abs
+        parse('-1')
+        f(slow(0.02))(1)
+        try:
+            parse('spam')
+        except ValueError:
+            pass
+    finally:
+        remove_hook(metrics)
+    snapshot = metrics.snapshot()
+    assert sorted(snapshot) == ['int | abs', 'slow0.02']
+    assert snapshot['int | abs']['calls'] == 2
+    assert snapshot['int | abs']['errors'] == 1
+    assert snapshot['int | abs']['histogram'] == {0.01: 2, float('inf'): 0}
+    assert snapshot['slow0.02']['histogram'] == {0.01: 0, float('inf'): 1}
+    assert snapshot['slow0.02']['seconds'] >= 0.02
+
+    metrics.reset()
+    assert metrics.snapshot() == {}
+
+
+def test_metrics_describe():
+    from fx import profiler
+    from fx.profiler import Metrics
+
+    metrics = Metrics()
+    parse = f(int) | abs
+    assert metrics.describe(parse) == 'int | abs'
+    assert metrics.describe(f(parse)) is metrics.describe(parse)
+    # the tuple held keeps its id from being reused
+    assert metrics.descriptions[id(parse.stages)][0] is parse.stages
+    assert metrics.describe(f(str) | len) == 'str | len'
+
+    size = profiler.DESCRIPTIONS_SIZE
+    for _ in range(size + 1):
+        metrics.describe(f(abs) | str)
+    assert len(metrics.descriptions) <= size
+
+
+def test_metrics_key():
+    from fx.function import add_hook, remove_hook
+    from fx.profiler import Metrics
+
+    metrics = Metrics(key=lambda function: 'all')
+    add_hook(metrics, sample=2)
+    try:
+        for n in range(10):
+            f(abs)(n)
+    finally:
+        remove_hook(metrics)
+    assert metrics.snapshot()['all']['calls'] == 5
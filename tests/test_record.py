@@ -0,0 +1,103 @@
+from fx.record import RecordGetter
+
+import pytest
+
+FIELDS = [('id', 'I'), ('price', 'd'), ('qty', 'H'), ('code', '4s')]
+
+
+def records(rec, count):
+    return b''.join(
+        rec.struct.pack(n, n * 1.5, n % 7, b'%04d' % n) for n in range(count))
+
+
+def test_layout():
+    rec = RecordGetter(FIELDS)
+    assert rec.size == 4 + 8 + 2 + 4
+    assert rec.names == ('id', 'price', 'qty', 'code')
+    assert [rec.fields[name][0] for name in rec.names] == [0, 4, 12, 14]
+
+    # native byte order takes alignment into account
+    rec = RecordGetter([('flag', '?'), ('value', 'd')], byteorder='@')
+    assert rec.fields['value'][0] == rec.size - 8
+    data = rec.struct.pack(True, 2.5)
+    assert rec['value'](data) == 2.5
+    assert rec['flag'](data) is True
+
+
+def test_field():
+    rec = RecordGetter(FIELDS)
+    data = records(rec, 10)
+
+    assert rec['id'](data) == 0
+    assert rec[3]['price'](data) == 4.5
+    assert rec['price'][3](data) == 4.5
+    assert rec[-1]['code'](data) == b'0009'
+    assert rec[9](data) == (9, 13.5, 2, b'0009')
+
+    # multiple values in a field
+    pair = RecordGetter([('xy', '2h'), ('z', 'h')])
+    assert pair['xy'](pair.struct.pack(1, -2, 3)) == (1, -2)
+
+    with pytest.raises(IndexError):
+        rec[10](data)
+
+    with pytest.raises(IndexError):
+        rec[-11](data)
+
+    with pytest.raises(KeyError):
+        rec['name']
+
+    with pytest.raises(TypeError):
+        rec['id']['price']
+
+    with pytest.raises(TypeError):
+        rec[0][1]
+
+
+def test_batch():
+    rec = RecordGetter(FIELDS)
+    data = records(rec, 10)
+
+    assert list(rec[:](data)) == [rec[n](data) for n in range(10)]
+    assert list(rec[2:5]['id'](data)) == [2, 3, 4]
+    assert list(rec[::-3]['qty'](data)) == [9 % 7, 6 % 7, 3 % 7, 0]
+    assert list(rec[-2:]['code'](data)) == [b'0008', b'0009']
+    assert list(rec[20:](data)) == []
+
+    # trailing partial record is ignored
+    assert rec.count(data + b'\0' * 5) == 10
+    assert len(list(rec[:](data + b'\0' * 5))) == 10
+
+
+def test_buffers():
+    import mmap
+    import tempfile
+
+    rec = RecordGetter(FIELDS)
+    data = records(rec, 100)
+
+    assert rec[50]['price'](memoryview(data)) == 75.0
+    assert rec[50]['price'](bytearray(data)) == 75.0
+
+    with tempfile.TemporaryFile() as stream:
+        stream.write(data)
+        stream.flush()
+        mapped = mmap.mmap(stream.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            assert rec[99]['id'](mapped) == 99
+            assert sum(rec[:]['qty'](mapped)) == sum(n % 7 for n in range(100))
+        finally:
+            mapped.close()
+
+
+def test_numpy():
+    numpy = pytest.importorskip('numpy')
+
+    rec = RecordGetter(FIELDS)
+    data = records(rec, 10)
+
+    array = rec.array(data)
+    assert array.dtype.itemsize == rec.size
+    assert array['id'].tolist() == list(range(10))
+    assert rec['price'].array(data).sum() == sum(n * 1.5 for n in range(10))
+    assert rec[3].array(data)['code'] == b'0003'